@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史归档模块
+旧记录按月份写入 JSONL.gz 归档文件，并维护按 ID 查找的索引
+"""
+
+import os
+import gzip
+import json
+from typing import Collection, Dict, Iterator, List, Optional, TextIO
+
+
+class HistoryArchive:
+    """历史记录归档
+
+    归档目录结构：
+        archive/history-2024-01.jsonl.gz  每行一条记录
+        archive/index.jsonl               记录ID -> 月份
+        archive/staging.jsonl             待提交的记录（历史文件替换成功后才写入归档）
+
+    write() 只写暂存文件，commit() 再按月追加到归档文件和索引，已在索引中的记录跳过，
+    中断后重复提交也不会产生重复归档
+    """
+
+    def __init__(self, archive_dir: str):
+        self.archive_dir = archive_dir
+        self.index_file = os.path.join(archive_dir, 'index.jsonl')
+        self.staging_file = os.path.join(archive_dir, 'staging.jsonl')
+        self._staging: Optional[TextIO] = None
+        # 记录ID -> 月份，索引文件变化（大小、修改时间）后重新读取
+        self._index: Dict[str, str] = {}
+        self._index_signature: Optional[List[int]] = None
+
+    def _month_file(self, month: str) -> str:
+        """月份对应的归档文件"""
+        return os.path.join(self.archive_dir, f'history-{month}.jsonl.gz')
+
+    @staticmethod
+    def month_of(record: Dict) -> str:
+        """记录所属月份，时间戳异常的归入 unknown"""
+        timestamp = str(record.get('timestamp', ''))
+        month = timestamp[:7]
+        if len(month) == 7 and month[4] == '-' and month.replace('-', '').isdigit():
+            return month
+        return 'unknown'
+
+    def write(self, record: Dict):
+        """把一条待归档记录写入暂存文件，commit() 之前不影响归档"""
+        if self._staging is None:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            self._staging = open(self.staging_file, 'w', encoding='utf-8')
+        self._staging.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def seal(self):
+        """暂存文件落盘并关闭，之后才能替换历史文件"""
+        if self._staging:
+            self._staging.flush()
+            os.fsync(self._staging.fileno())
+            self._staging.close()
+            self._staging = None
+
+    def staged(self) -> bool:
+        """是否有上次中断留下的暂存记录"""
+        return self._staging is None and os.path.exists(self.staging_file)
+
+    def discard(self):
+        """放弃暂存的记录"""
+        if self._staging:
+            self._staging.close()
+            self._staging = None
+        if os.path.exists(self.staging_file):
+            os.remove(self.staging_file)
+
+    def commit(self, skip: Collection[str] = ()) -> int:
+        """把暂存记录按月追加到归档文件（gzip 支持多段追加，读取时自动拼接）并写入索引
+
+        已在索引或 skip 中的记录不再写入，返回实际归档条数；全部写完后删除暂存文件
+        """
+        self.seal()
+        if not os.path.exists(self.staging_file):
+            return 0
+        index = self._load_index()
+        writers: Dict[str, TextIO] = {}
+        added: Dict[str, str] = {}
+        try:
+            with open(self.staging_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    record_id = record.get('id')
+                    if record_id in index or record_id in added or record_id in skip:
+                        continue
+                    month = self.month_of(record)
+                    writer = writers.get(month)
+                    if writer is None:
+                        writer = writers[month] = gzip.open(self._month_file(month), 'at', encoding='utf-8')
+                    writer.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    added[record_id] = month
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        # 归档文件写完再写索引：中断时最多留下未进索引的归档行，重新提交前不会被查到
+        if added:
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                for record_id, month in added.items():
+                    f.write(json.dumps({'id': record_id, 'month': month}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        os.remove(self.staging_file)
+        return len(added)
+
+    def _load_index(self) -> Dict[str, str]:
+        """读取记录ID -> 月份索引，文件未变化时使用缓存"""
+        try:
+            stat = os.stat(self.index_file)
+        except OSError:
+            self._index, self._index_signature = {}, None
+            return self._index
+        signature = [stat.st_size, stat.st_mtime_ns]
+        if signature != self._index_signature:
+            index = {}
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        index[entry.get('id')] = entry['month']
+            self._index, self._index_signature = index, signature
+        return self._index
+
+    def months(self):
+        """已有归档月份，从新到旧"""
+        if not os.path.isdir(self.archive_dir):
+            return []
+        names = [n for n in os.listdir(self.archive_dir)
+                 if n.startswith('history-') and n.endswith('.jsonl.gz')]
+        return sorted((n[len('history-'):-len('.jsonl.gz')] for n in names), reverse=True)
+
+    def iter_month(self, month: str) -> Iterator[Dict]:
+        """逐条读取某月的归档记录"""
+        with gzip.open(self._month_file(month), 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def iter_records(self) -> Iterator[Dict]:
+        """逐条读取全部归档记录"""
+        for month in self.months():
+            yield from self.iter_month(month)
+
+    def find(self, record_id: str) -> Optional[Dict]:
+        """通过索引定位月份后查找归档记录"""
+        month = self._load_index().get(record_id)
+        if month is None:
+            return None
+
+        for record in self.iter_month(month):
+            if record.get('id') == record_id:
+                return record
+        return None
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成资源管理模块
+图片按内容哈希存储（自动去重），并根据历史记录引用清理无用资源
+"""
+
+import os
+import re
+import mmap
+import time
+import uuid
+import base64
+import hashlib
+import argparse
+import mimetypes
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+from config import Config
+from history import HistoryManager
+from image_cache import ImageCache
+
+
+# 旧版本直接写在输出目录下的图片和预览文件
+LEGACY_ASSET_PATTERN = re.compile(r'^(cover|content)_\d+_\d+\.png$')
+PREVIEW_PATTERN = re.compile(r'^preview_\d+\.html$')
+TRACE_PATTERN = re.compile(r'^trace_\d+_\d+\.json$')
+
+# 刚写入的资源可能还没有登记到历史记录，清理时跳过
+GC_GRACE_SECONDS = 3600
+
+
+def parse_size(text: str) -> int:
+    """解析 500MB / 2G 这类容量"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*', text.lower())
+    if not match:
+        raise ValueError(f"无法解析容量: {text}")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** ' kmgt'.index(unit or ' '))
+
+
+def _normalize(path: str) -> str:
+    """统一路径形式，用于和历史记录中的图片路径比较"""
+    return os.path.normcase(os.path.abspath(path))
+
+
+class IncomingAsset:
+    """正在写入的资源，边写边计算哈希，退出上下文时按哈希落盘
+
+    适合分块到达的数据（如异步下载），写入方逐块调用 write
+    """
+
+    def __init__(self, store: 'AssetStore', ext: str = '.png', min_size: int = 0, keep_buffer: bool = False):
+        self.store = store
+        self.ext = ext
+        self.min_size = min_size
+        self.size = 0
+        self.path: Optional[str] = None
+        # 需要继续在内存中使用时保留一份数据，避免之后再从磁盘读回
+        self.buffer: Optional[bytearray] = bytearray() if keep_buffer else None
+        self._digest = hashlib.sha256()
+        os.makedirs(store.assets_dir, exist_ok=True)
+        self._temp_path = os.path.join(store.assets_dir, f".incoming_{os.getpid()}_{uuid.uuid4().hex}")
+        self._file = open(self._temp_path, 'wb')
+
+    def write(self, chunk: bytes):
+        """写入一块数据"""
+        if chunk:
+            self._digest.update(chunk)
+            self._file.write(chunk)
+            if self.buffer is not None:
+                self.buffer += chunk
+            self.size += len(chunk)
+
+    def commit(self) -> str:
+        """完成写入；已存在相同内容时直接复用"""
+        self._file.close()
+        if self.size < self.min_size:
+            raise ValueError(f"图片过小: {self.size} bytes")
+
+        path = self.store.path_for(self._digest.hexdigest(), self.ext)
+        if os.path.exists(path):
+            os.remove(self._temp_path)
+            # 更新修改时间，表示资源刚被使用过
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._temp_path, path)
+        self.path = path
+        return path
+
+    def abort(self):
+        """放弃写入，删除临时文件"""
+        self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.commit()
+        finally:
+            self.abort()
+
+
+class ImageAsset:
+    """一张图片的数据和本地路径
+
+    数据来自下载时保留的内存缓冲，或按需 mmap 本地文件；
+    浏览器上传和 MCP 上传都直接读取同一个 memoryview，不再从磁盘重复读取或整体复制
+    """
+
+    def __init__(self, path: str, buffer: Optional[Union[bytearray, bytes]] = None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.mime_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self._buffer = buffer
+        self._mmap: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+
+    @property
+    def view(self) -> memoryview:
+        """图片数据的只读视图，没有内存缓冲时映射本地文件"""
+        if self._view is None:
+            if self._buffer is None:
+                with open(self.path, 'rb') as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._view = memoryview(self._mmap)
+            else:
+                self._view = memoryview(self._buffer).toreadonly()
+        return self._view
+
+    @property
+    def size(self) -> int:
+        return self.view.nbytes
+
+    def file_payload(self) -> Dict:
+        """Playwright set_input_files 的文件载荷（base64 编码时直接读取缓冲）"""
+        return {'name': self.name, 'mimeType': self.mime_type, 'buffer': self.view}
+
+    def iter_base64(self, chunk_size: int = 48 * 1024) -> Iterator[str]:
+        """分块输出 base64 编码，块大小取 3 的倍数，拼接结果与整体编码一致"""
+        chunk_size -= chunk_size % 3
+        view = self.view
+        for offset in range(0, len(view), chunk_size):
+            yield base64.b64encode(view[offset:offset + chunk_size]).decode('ascii')
+
+    def close(self):
+        """释放视图和文件映射"""
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class AssetStore:
+    """内容寻址的资源存储
+
+    文件保存在 assets/<哈希前两位>/<sha256>.<扩展名>，相同内容只存一份；
+    按哈希前缀分目录，避免单个目录文件过多
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.assets_dir = os.path.join(output_dir, 'assets')
+
+    def path_for(self, digest: str, ext: str = '.png') -> str:
+        """哈希对应的存储路径"""
+        return os.path.join(self.assets_dir, digest[:2], f"{digest}{ext}")
+
+    def open_incoming(self, ext: str = '.png', min_size: int = 0, keep_buffer: bool = False) -> IncomingAsset:
+        """开始写入一个新资源，配合 with 使用；keep_buffer 时同时在内存中保留数据"""
+        return IncomingAsset(self, ext, min_size, keep_buffer)
+
+    def put_stream(self, chunks: Iterable[bytes], ext: str = '.png', min_size: int = 0) -> str:
+        """边写边计算哈希，写完后按哈希落盘；已存在相同内容时直接复用"""
+        with self.open_incoming(ext, min_size) as incoming:
+            for chunk in chunks:
+                incoming.write(chunk)
+        return incoming.path
+
+    def iter_files(self) -> Iterable[Dict]:
+        """列出所有可清理的文件：内容寻址资源、旧版图片、预览页和时间线文件"""
+        if os.path.isdir(self.assets_dir):
+            for shard in os.scandir(self.assets_dir):
+                if shard.is_file() and shard.name.startswith('.incoming_'):
+                    # 写入中途崩溃遗留的临时文件
+                    stat = shard.stat()
+                    yield {'path': shard.path, 'size': stat.st_size, 'mtime': stat.st_mtime, 'kind': 'temp'}
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.is_file():
+                        stat = entry.stat()
+                        yield {'path': entry.path, 'size': stat.st_size, 'mtime': stat.st_mtime, 'kind': 'asset'}
+
+        if os.path.isdir(self.output_dir):
+            for entry in os.scandir(self.output_dir):
+                if not entry.is_file():
+                    continue
+                if LEGACY_ASSET_PATTERN.match(entry.name):
+                    kind = 'asset'
+                elif PREVIEW_PATTERN.match(entry.name):
+                    kind = 'preview'
+                elif TRACE_PATTERN.match(entry.name):
+                    kind = 'trace'
+                else:
+                    continue
+                stat = entry.stat()
+                yield {'path': entry.path, 'size': stat.st_size, 'mtime': stat.st_mtime, 'kind': kind}
+
+    def reference_counts(self, history_mgr: HistoryManager) -> Dict[str, int]:
+        """统计历史记录（含归档）对每个图片文件的引用次数"""
+        counts: Dict[str, int] = {}
+        for record in history_mgr.iter_records(include_archive=True):
+            for image in record.get('images', []):
+                if isinstance(image, str):
+                    key = _normalize(image)
+                    counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def _remove_empty_shard(self, path: str):
+        """删除已清空的哈希分片目录"""
+        shard = os.path.dirname(path)
+        if os.path.dirname(shard) != self.assets_dir:
+            return
+        try:
+            os.rmdir(shard)
+        except OSError:
+            pass
+
+    def gc(self, history_mgr: HistoryManager, max_age_days: Optional[float] = None,
+           max_bytes: Optional[int] = None, dry_run: bool = False,
+           keep: Iterable[str] = ()) -> Dict:
+        """清理未被引用的资源和旧预览页
+
+        - 超过 max_age_days 的未引用文件直接删除
+        - 总容量超过 max_bytes 时，从最旧的未引用文件开始删除直到满足预算
+        被历史记录引用的文件和 keep 中的文件（如图片缓存仍在使用的图片）永远不会删除
+        """
+        now = time.time()
+        references = self.reference_counts(history_mgr)
+        for path in keep:
+            references[_normalize(path)] = references.get(_normalize(path), 0) + 1
+        files = list(self.iter_files())
+        total_bytes = sum(f['size'] for f in files)
+
+        unreferenced = [f for f in files if _normalize(f['path']) not in references]
+        candidates = sorted((f for f in unreferenced if now - f['mtime'] > GC_GRACE_SECONDS),
+                            key=lambda f: f['mtime'])
+
+        removed: List[Dict] = []
+        remaining = total_bytes
+        for f in candidates:
+            expired = max_age_days is not None and now - f['mtime'] > max_age_days * 86400
+            over_budget = max_bytes is not None and remaining > max_bytes
+            if not (expired or over_budget):
+                continue
+            if not dry_run:
+                try:
+                    os.remove(f['path'])
+                except OSError as e:
+                    print(f"⚠️  删除失败: {f['path']} ({e})")
+                    continue
+                self._remove_empty_shard(f['path'])
+            removed.append(f)
+            remaining -= f['size']
+
+        return {
+            'files': len(files),
+            'referenced': len(files) - len(unreferenced),
+            'removed': len(removed),
+            'freed_bytes': sum(f['size'] for f in removed),
+            'total_bytes': total_bytes,
+            'remaining_bytes': remaining
+        }
+
+
+def run_gc_command(argv: List[str]):
+    """清理无用的生成资源"""
+    parser = argparse.ArgumentParser(prog='run.py gc', description='清理未被历史记录引用的图片和旧预览页')
+    parser.add_argument('-d', '--max-age-days', type=float, default=7, help='删除多少天前的未引用文件（默认 7）')
+    parser.add_argument('-s', '--max-size', help='输出目录资源总容量预算，如 500MB、2GB')
+    parser.add_argument('--dry-run', action='store_true', help='只统计，不删除')
+    args = parser.parse_args(argv)
+
+    config = Config('.env')
+    store = AssetStore(config.output_dir)
+    history_mgr = HistoryManager(config.output_dir)
+    cache = ImageCache(config.output_dir)
+    max_bytes = parse_size(args.max_size) if args.max_size else None
+
+    # 先按同样的期限和预算淘汰图片缓存，淘汰后的图片再按历史记录引用决定是否删除
+    evicted = cache.evict(args.max_age_days, max_bytes, args.dry_run)
+    result = store.gc(history_mgr, args.max_age_days, max_bytes, args.dry_run,
+                      keep=evicted['kept'])
+
+    action = '可删除' if args.dry_run else '已删除'
+    print(f"♻️  图片缓存 {evicted['entries']} 条，{action} {evicted['evicted']} 条，"
+          f"剩余 {evicted['remaining_bytes'] / 1024 / 1024:.1f} MB")
+    print(f"📦 共 {result['files']} 个文件（{result['total_bytes'] / 1024 / 1024:.1f} MB），"
+          f"其中 {result['referenced']} 个被历史记录引用")
+    print(f"🧹 {action} {result['removed']} 个文件，释放 {result['freed_bytes'] / 1024 / 1024:.1f} MB，"
+          f"剩余 {result['remaining_bytes'] / 1024 / 1024:.1f} MB")
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准测试模块
+对比不同生成模式的调用次数、耗时和 token 用量
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+from dataclasses import replace
+from typing import Dict, List
+
+from config import Config, ConfigSnapshot
+from history import HistoryManager
+from metrics import Metrics
+
+
+def _run_mode(config: ConfigSnapshot, topic: str, word_count: int, context: str, fused: bool) -> Dict:
+    """运行一次文本生成并返回指标"""
+    from clients import run
+    from xhs_auto import generate_text
+
+    metrics = Metrics()
+    start = time.time()
+    run(generate_text(config, metrics, topic, word_count, context, fused))
+    summary = metrics.summary()
+    summary['wall_time'] = time.time() - start
+    return summary
+
+
+def _average(runs: List[Dict], key: str) -> float:
+    """计算多轮结果的平均值"""
+    return sum(run[key] for run in runs) / len(runs) if runs else 0.0
+
+
+def _history_worker(output_dir: str, worker: int, count: int) -> List[str]:
+    """压力测试子进程：交替添加和更新记录"""
+    history_mgr = HistoryManager(output_dir)
+    ids = []
+    for i in range(count):
+        record = history_mgr.add_record({'title': f'worker{worker}-{i}', 'content': '压力测试' * 50},
+                                        status='pending', publish_method='auto')
+        if not history_mgr.update_status(record['id'], 'success'):
+            raise RuntimeError(f"更新记录失败: {record['id']}")
+        ids.append(record['id'])
+    return ids
+
+
+def run_history_stress(argv: List[str]) -> bool:
+    """多进程并发读写历史记录，校验没有丢失、重复或损坏"""
+    parser = argparse.ArgumentParser(prog='run.py benchmark history', description='历史记录并发压力测试')
+    parser.add_argument('-p', '--processes', type=int, default=8, help='并发进程数')
+    parser.add_argument('-n', '--records', type=int, default=50, help='每个进程写入的记录数')
+    args = parser.parse_args(argv)
+
+    output_dir = tempfile.mkdtemp(prefix='xhs_history_stress_')
+    print(f"⏱️  {args.processes} 个进程各写入 {args.records} 条记录: {output_dir}")
+
+    start = time.time()
+    with multiprocessing.Pool(args.processes) as pool:
+        results = pool.starmap(_history_worker,
+                               [(output_dir, w, args.records) for w in range(args.processes)])
+    elapsed = time.time() - start
+
+    expected = [record_id for ids in results for record_id in ids]
+    with open(os.path.join(output_dir, 'history.json'), 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    stats = HistoryManager(output_dir).get_statistics()
+
+    errors = []
+    if len(set(expected)) != len(expected):
+        errors.append("记录ID重复")
+    if sorted(r['id'] for r in records) != sorted(expected):
+        errors.append(f"记录数量不一致: 期望 {len(expected)}，实际 {len(records)}")
+    if any(r.get('status') != 'success' for r in records):
+        errors.append("存在未更新的记录")
+    if stats['total'] != len(expected) or stats['success'] != len(expected):
+        errors.append(f"统计不一致: {stats}")
+
+    total_ops = len(expected) * 2
+    print(f"📊 {total_ops} 次写入，耗时 {elapsed:.1f}s（{total_ops / elapsed:.0f} 次/秒）")
+    if errors:
+        for error in errors:
+            print(f"❌ {error}")
+        return False
+    print(f"✅ 并发写入校验通过")
+    return True
+
+
+def run_page_benchmark(argv: List[str]):
+    """对比完整加载与精简加载发布页的就绪耗时"""
+    parser = argparse.ArgumentParser(prog='run.py benchmark page', description='发布页加载基准测试')
+    parser.add_argument('-n', '--rounds', type=int, default=3, help='每种模式运行轮数')
+    parser.add_argument('--show', action='store_true', help='显示浏览器窗口（默认无头模式）')
+    args = parser.parse_args(argv)
+
+    from clients import run
+    from xhs_auto import XHSBrowserPublisher
+
+    loader = Config('.env')
+    if not loader.validate():
+        return
+    config = loader.snapshot()
+
+    results = {}
+    for name, lean in (('完整加载', False), ('精简加载', True)):
+        runs = []
+        for i in range(args.rounds):
+            print(f"\n⏱️  {name} 第 {i + 1}/{args.rounds} 轮")
+            try:
+                publisher = XHSBrowserPublisher(replace(config, browser_lean=lean))
+                runs.append(run(publisher.measure_page_load(headless=not args.show)))
+            except Exception as e:
+                print(f"❌ {name} 运行失败: {e}")
+        results[name] = runs
+
+    print(f"\n📊 发布页就绪耗时（平均每轮）")
+    print(f"{'模式':<8}{'就绪(s)':>10}{'拦截请求':>10}{'缓存命中':>10}")
+    for name, runs in results.items():
+        if not runs:
+            print(f"{name:<8}{'失败':>10}")
+            continue
+        print(f"{name:<8}{_average(runs, 'ready'):>10.2f}"
+              f"{sum(r.get('blocked', 0) for r in runs) / len(runs):>10.0f}"
+              f"{sum(r.get('cache_hits', 0) for r in runs) / len(runs):>10.0f}")
+
+    full, lean = results['完整加载'], results['精简加载']
+    if full and lean:
+        print(f"\n💡 精简加载每次节省 {_average(full, 'ready') - _average(lean, 'ready'):.2f}s")
+
+
+def run_benchmark(argv: List[str]):
+    """对比分步生成与合并生成"""
+    if argv and argv[0] == 'history':
+        if not run_history_stress(argv[1:]):
+            raise SystemExit(1)
+        return
+    if argv and argv[0] == 'page':
+        run_page_benchmark(argv[1:])
+        return
+
+    parser = argparse.ArgumentParser(prog='run.py benchmark', description='生成模式基准测试')
+    parser.add_argument('-t', '--topic', required=True, help='主题/选题')
+    parser.add_argument('-w', '--word-count', type=int, default=600, help='字数')
+    parser.add_argument('-c', '--context', default='', help='背景说明')
+    parser.add_argument('-n', '--rounds', type=int, default=1, help='每种模式运行轮数')
+    args = parser.parse_args(argv)
+
+    loader = Config('.env')
+    if not loader.validate():
+        return
+    config = loader.snapshot()
+
+    results = {}
+    for name, fused in (('分步生成', False), ('合并生成', True)):
+        runs = []
+        for i in range(args.rounds):
+            print(f"\n⏱️  {name} 第 {i + 1}/{args.rounds} 轮")
+            try:
+                runs.append(_run_mode(config, args.topic, args.word_count, args.context, fused))
+            except Exception as e:
+                print(f"❌ {name} 运行失败: {e}")
+        results[name] = runs
+
+    print(f"\n📊 基准测试结果（平均每篇）")
+    print(f"{'模式':<8}{'调用次数':>10}{'耗时(s)':>10}{'prompt':>10}{'completion':>12}{'缓存命中':>10}")
+    for name, runs in results.items():
+        if not runs:
+            print(f"{name:<8}{'失败':>10}")
+            continue
+        print(f"{name:<8}{_average(runs, 'calls'):>10.1f}{_average(runs, 'wall_time'):>10.1f}"
+              f"{_average(runs, 'prompt_tokens'):>10.0f}{_average(runs, 'completion_tokens'):>12.0f}"
+              f"{_average(runs, 'cached_tokens'):>10.0f}")
+
+    multi, fused = results['分步生成'], results['合并生成']
+    if multi and fused:
+        saved_time = _average(multi, 'wall_time') - _average(fused, 'wall_time')
+        saved_tokens = (_average(multi, 'prompt_tokens') + _average(multi, 'completion_tokens')
+                        - _average(fused, 'prompt_tokens') - _average(fused, 'completion_tokens'))
+        print(f"\n💡 合并生成每篇节省 {saved_time:.1f}s，{saved_tokens:.0f} tokens")
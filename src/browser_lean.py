@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+浏览器精简加载模块
+拦截发布页的请求：屏蔽用不到的资源类型和第三方域名，脚本和样式缓存到浏览器配置目录中跨运行复用
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+from fileutil import atomic_open
+
+
+# 拦截请求后浏览器自身的 HTTP 缓存不再生效，这些类型由 StaticCache 缓存
+CACHED_TYPES = ('script', 'stylesheet')
+# 缓存文件中不保留的响应头：body 已解码，长度和编码以实际内容为准
+_DROP_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'set-cookie'}
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+class StaticCache:
+    """静态资源缓存
+
+    按 URL 哈希保存响应体（.bin）和状态、响应头、过期时间（.json），
+    只缓存带 max-age 且未禁止缓存的 200 响应，过期后重新请求
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    def _paths(self, url: str) -> Tuple[str, str]:
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, digest[:2], digest)
+        return f"{base}.json", f"{base}.bin"
+
+    def get(self, url: str) -> Optional[Tuple[Dict, bytes]]:
+        """未过期的缓存响应，返回 (元数据, 响应体)"""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta['url'] != url or meta['expires_at'] < time.time():
+                return None
+            with open(body_path, 'rb') as f:
+                return meta, f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, url: str, status: int, headers: Dict[str, str], body: bytes) -> bool:
+        """按 Cache-Control 判断是否可缓存并保存，返回是否已缓存"""
+        cache_control = headers.get('cache-control', '').lower()
+        match = _MAX_AGE.search(cache_control)
+        if status != 200 or not match or any(d in cache_control for d in ('no-store', 'no-cache', 'private')):
+            return False
+        max_age = int(match.group(1))
+        if max_age <= 0:
+            return False
+
+        meta_path, body_path = self._paths(url)
+        try:
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            temp_path = f"{body_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(body)
+            os.replace(temp_path, body_path)
+            # 元数据最后写入，存在元数据即说明响应体完整
+            with atomic_open(meta_path) as f:
+                json.dump({
+                    'url': url,
+                    'status': status,
+                    'headers': {k: v for k, v in headers.items() if k.lower() not in _DROP_HEADERS},
+                    'expires_at': time.time() + max_age
+                }, f, ensure_ascii=False)
+        except OSError as e:
+            print(f"⚠️  缓存静态资源失败: {e}")
+            return False
+        return True
+
+
+class LeanLoader:
+    """发布页请求拦截器
+
+    block_types 中的资源类型（如 image、media、font）直接中止；
+    allow_domains 非空时，不属于这些域名（含子域名）的请求也中止；
+    其余的脚本和样式优先从 StaticCache 返回
+    """
+
+    def __init__(self, block_types: Iterable[str], allow_domains: Iterable[str] = (),
+                 cache: Optional[StaticCache] = None):
+        self.block_types = set(block_types)
+        self.allow_domains = tuple(d.lower().lstrip('.') for d in allow_domains)
+        self.cache = cache
+        self.blocked = 0
+        self.cache_hits = 0
+        self.cache_stores = 0
+
+    def _allowed(self, url: str) -> bool:
+        """域名是否在白名单内"""
+        if not self.allow_domains:
+            return True
+        host = (urlsplit(url).hostname or '').lower()
+        return any(host == d or host.endswith(f".{d}") for d in self.allow_domains)
+
+    async def install(self, context):
+        """在浏览器上下文上启用拦截"""
+        await context.route('**/*', self._handle)
+
+    async def remove(self, context):
+        """取消拦截（如需要扫码登录时恢复完整加载）"""
+        await context.unroute('**/*', self._handle)
+
+    async def _handle(self, route):
+        request = route.request
+        if request.resource_type in self.block_types or not self._allowed(request.url):
+            self.blocked += 1
+            await route.abort()
+            return
+
+        if self.cache is None or request.method != 'GET' or request.resource_type not in CACHED_TYPES:
+            await route.continue_()
+            return
+
+        hit = self.cache.get(request.url)
+        if hit:
+            meta, body = hit
+            self.cache_hits += 1
+            await route.fulfill(status=meta['status'], headers=meta['headers'], body=body)
+            return
+
+        response = await route.fetch()
+        body = await response.body()
+        if self.cache.put(request.url, response.status, response.headers, body):
+            self.cache_stores += 1
+        await route.fulfill(response=response, body=body)
+
+    def stats(self) -> Dict[str, int]:
+        return {'blocked': self.blocked, 'cache_hits': self.cache_hits, 'cache_stores': self.cache_stores}
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+录制回放模块
+在共享 HTTP 客户端的传输层录制模型调用、图片生成和下载、MCP 发布的请求与响应，
+写入 JSONL.gz 回放文件；回放时不访问网络，按原始耗时（可缩放）返回录制的响应
+"""
+
+import os
+import gzip
+import json
+import time
+import base64
+import asyncio
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Optional, TextIO, Tuple
+
+import httpx
+
+
+CASSETTE_VERSION = 1
+CASSETTE_MODES = ('off', 'record', 'replay')
+# 请求体中每次都会变化、不参与匹配的字段（如 JSON-RPC 的 id）
+_VOLATILE_KEYS = ('id',)
+
+
+class CassetteMiss(httpx.TransportError):
+    """回放文件中没有与请求匹配的录制"""
+
+
+def fingerprint(body: bytes) -> str:
+    """请求体指纹：JSON 请求体去掉易变字段后按键排序，其余按原始字节"""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        data = {k: v for k, v in data.items() if k not in _VOLATILE_KEYS}
+        body = json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def _encode_body(body: bytes) -> Dict:
+    """文本响应体直接保存，二进制（图片、压缩内容）保存为 base64"""
+    try:
+        return {'text': body.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'base64': base64.b64encode(body).decode('ascii')}
+
+
+def _decode_body(entry: Dict) -> bytes:
+    if 'base64' in entry:
+        return base64.b64decode(entry['base64'])
+    return entry.get('text', '').encode('utf-8')
+
+
+class Cassette:
+    """回放文件
+
+    第一行为文件头，之后每行一次交互：
+    {pool, method, url, fingerprint, status, headers, body, elapsed, offset}
+    录制时边完成边追加写入，进程中断也能保留已完成的交互。
+    回放时先按 (连接池, 方法, URL, 请求体指纹) 精确匹配，没有时按 (连接池, 方法, URL) 依录制顺序匹配；
+    同一组录制用完后从头循环，重复运行的基准测试也能回放
+    """
+
+    def __init__(self, path: str, mode: str = 'replay', scale: float = 1.0):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"未知的录制回放模式: {mode}")
+        self.path = path
+        self.mode = mode
+        self.scale = max(0.0, scale)
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self._writer: Optional[TextIO] = None
+        self._started = False
+        self._exact: Dict[Tuple, List[Dict]] = {}
+        self._loose: Dict[Tuple, List[Dict]] = {}
+        self._cursors: Dict[Tuple, int] = {}
+        self._origin = time.monotonic()
+        if mode == 'replay':
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise ValueError(f"回放文件不存在: {self.path}")
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if 'cassette' in entry:
+                    continue
+                self._exact.setdefault((entry['pool'], entry['method'], entry['url'], entry['fingerprint']),
+                                       []).append(entry)
+                self._loose.setdefault((entry['pool'], entry['method'], entry['url']), []).append(entry)
+
+    def _next(self, key: Tuple, entries: Dict[Tuple, List[Dict]]) -> Optional[Dict]:
+        items = entries.get(key)
+        if not items:
+            return None
+        cursor = self._cursors.get(key, 0)
+        self._cursors[key] = cursor + 1
+        return items[cursor % len(items)]
+
+    def match(self, pool: str, method: str, url: str, body: bytes) -> Optional[Dict]:
+        """查找与请求对应的录制"""
+        entry = self._next((pool, method, url, fingerprint(body)), self._exact)
+        if entry is None:
+            entry = self._next((pool, method, url), self._loose)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.replayed += 1
+        return entry
+
+    def record(self, pool: str, request: httpx.Request, body: bytes, status: int,
+               headers: List[Tuple[str, str]], content: bytes, elapsed: float, started: float):
+        """追加一次交互；第一次写入时覆盖旧文件"""
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._writer = gzip.open(self.path, 'at' if self._started else 'wt', encoding='utf-8')
+            if not self._started:
+                self._writer.write(json.dumps({'cassette': CASSETTE_VERSION,
+                                               'created_at': datetime.now().isoformat()}) + '\n')
+                self._started = True
+        self._writer.write(json.dumps({
+            'pool': pool,
+            'method': request.method,
+            'url': str(request.url),
+            'fingerprint': fingerprint(body),
+            'status': status,
+            'headers': headers,
+            'body': _encode_body(content),
+            'elapsed': elapsed,
+            'offset': started - self._origin
+        }, ensure_ascii=False) + '\n')
+        self.recorded += 1
+
+    def close(self):
+        """关闭写入句柄，之后再录制时追加到同一文件"""
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+    def stats(self) -> Dict:
+        return {'mode': self.mode, 'path': self.path, 'recorded': self.recorded,
+                'replayed': self.replayed, 'misses': self.misses}
+
+
+class CassetteTransport(httpx.AsyncBaseTransport):
+    """录制或回放的传输层
+
+    录制模式包装真实传输：读完整个响应（原始字节，保留 content-encoding 由客户端解码）后写入回放文件；
+    回放模式不建立连接，等待录制时的耗时乘以缩放系数后返回录制的响应
+    """
+
+    def __init__(self, cassette: Cassette, pool: str, inner: Optional[httpx.AsyncBaseTransport] = None):
+        self.cassette = cassette
+        self.pool = pool
+        self.inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        if self.cassette.mode == 'replay':
+            entry = self.cassette.match(self.pool, request.method, str(request.url), body)
+            if entry is None:
+                raise CassetteMiss(f"回放文件中没有匹配的请求: {request.method} {request.url}", request=request)
+            if self.cassette.scale and entry['elapsed']:
+                await asyncio.sleep(entry['elapsed'] * self.cassette.scale)
+            return httpx.Response(entry['status'], headers=entry['headers'],
+                                  content=_decode_body(entry['body']), request=request)
+
+        started = time.monotonic()
+        response = await self.inner.handle_async_request(request)
+        try:
+            content = b''.join([chunk async for chunk in response.aiter_raw()])
+        finally:
+            await response.aclose()
+        elapsed = time.monotonic() - started
+        self.cassette.record(self.pool, request, body, response.status_code,
+                             response.headers.multi_items(), content, elapsed, started)
+        return httpx.Response(response.status_code, headers=response.headers.multi_items(), content=content,
+                              request=request, extensions=response.extensions)
+
+    async def aclose(self):
+        if self.inner is not None:
+            await self.inner.aclose()
+
+
+_cassette: Optional[Cassette] = None
+_configured = False
+
+
+def configure_cassette(mode: str = 'off', path: str = '', scale: float = 1.0) -> Optional[Cassette]:
+    """设置进程级录制或回放，需在创建共享客户端前调用"""
+    global _cassette, _configured
+    if _cassette is not None:
+        _cassette.close()
+    _cassette = None if mode == 'off' else Cassette(path, mode, scale)
+    _configured = True
+    return _cassette
+
+
+def get_cassette(config) -> Optional[Cassette]:
+    """获取进程级回放文件，未设置时按配置（XHS_CASSETTE_MODE）创建"""
+    if not _configured:
+        configure_cassette(config.cassette_mode, config.cassette_path, config.replay_scale)
+    return _cassette
+
+
+def report_cassette():
+    """运行结束时输出录制或回放的统计"""
+    if _cassette is None:
+        return
+    stats = _cassette.stats()
+    if stats['mode'] == 'record':
+        print(f"📼 已录制 {stats['recorded']} 次请求: {stats['path']}")
+    else:
+        print(f"📼 回放 {stats['replayed']} 次请求（耗时缩放 {_cassette.scale:g}），未匹配 {stats['misses']} 次")
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享客户端模块
+进程内复用模型客户端和 HTTP 连接池，避免每篇笔记重复建立 TCP/TLS 连接
+"""
+
+import asyncio
+import importlib.util
+from typing import Dict, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+from cassette import CassetteTransport, get_cassette
+from config import ConfigSnapshot
+
+
+class ConnectionStats:
+    """连接复用计数，通过 httpx 的 trace 扩展统计新建连接"""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+
+    async def on_request(self, request: httpx.Request):
+        """请求钩子：计数并挂上 trace 回调"""
+        self.requests += 1
+        request.extensions['trace'] = self.trace
+
+    async def trace(self, event_name: str, info: Dict):
+        """httpcore 事件回调，只有新建连接时才会触发 connect/start_tls"""
+        if event_name == 'connection.connect_tcp.complete':
+            self.connections += 1
+        elif event_name == 'connection.start_tls.complete':
+            self.tls_handshakes += 1
+
+    def to_dict(self) -> Dict:
+        """当前计数"""
+        return {
+            'requests': self.requests,
+            'connections': self.connections,
+            'reused': max(0, self.requests - self.connections),
+            'tls_handshakes': self.tls_handshakes
+        }
+
+
+class ClientRegistry:
+    """进程级客户端注册表
+
+    - api: 文本和图片模型（火山方舟）共用的连接池
+    - cdn: 图片下载和 MCP 发布等其他请求共用的连接池
+    httpx 客户端绑定在创建它的事件循环上，事件循环更换时自动重建；
+    开启录制或回放（XHS_CASSETTE_MODE）时两个连接池都经过 CassetteTransport。
+    模型客户端按 (api_key, base_url) 分别创建、共用 api 连接池，热加载修改密钥或接入点后立即生效；
+    连接池参数、HTTP/2 和录制回放在首次使用时确定，修改后需要重启
+    """
+
+    def __init__(self, config: ConfigSnapshot):
+        self.config = config
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, ConnectionStats] = {}
+        self._openai: Dict[Tuple[str, str], AsyncOpenAI] = {}
+        self._loop = None
+
+    def _check_loop(self):
+        """事件循环变化时丢弃旧连接池（旧循环已关闭，连接无法复用）"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not self._loop:
+            self._clients = {}
+            self._openai = {}
+            self._loop = loop
+
+    def _http2_enabled(self) -> bool:
+        """HTTP/2 需要额外安装 h2，缺失时退回 HTTP/1.1 keep-alive"""
+        if not self.config.http2:
+            return False
+        if importlib.util.find_spec('h2') is None:
+            print("⚠️  未安装 h2，HTTP/2 不可用，使用 HTTP/1.1 长连接（pip install httpx[http2]）")
+            return False
+        return True
+
+    def http(self, name: str = 'cdn') -> httpx.AsyncClient:
+        """获取指定名称的共享 HTTP 客户端"""
+        self._check_loop()
+        client = self._clients.get(name)
+        if client is None:
+            stats = self._stats.setdefault(name, ConnectionStats())
+            http2 = self._http2_enabled()
+            limits = httpx.Limits(
+                max_connections=self.config.http_max_connections,
+                max_keepalive_connections=self.config.http_max_keepalive,
+                keepalive_expiry=self.config.http_keepalive_expiry
+            )
+            transport = None
+            cassette = get_cassette(self.config)
+            if cassette is not None:
+                inner = None if cassette.mode == 'replay' else httpx.AsyncHTTPTransport(http2=http2, limits=limits)
+                transport = CassetteTransport(cassette, name, inner)
+            client = httpx.AsyncClient(
+                http2=http2,
+                limits=limits,
+                transport=transport,
+                timeout=self.config.api_timeout,
+                follow_redirects=True,
+                event_hooks={'request': [stats.on_request]}
+            )
+            self._clients[name] = client
+        return client
+
+    def openai(self, config: Optional[ConfigSnapshot] = None) -> AsyncOpenAI:
+        """获取共享的模型客户端，config 为调用方的配置快照（未传入时使用创建时的配置）"""
+        self._check_loop()
+        config = config or self.config
+        key = (config.api_key, config.base_url)
+        client = self._openai.get(key)
+        if client is None:
+            client = self._openai[key] = AsyncOpenAI(
+                api_key=config.api_key,
+                base_url=config.base_url,
+                http_client=self.http('api')
+            )
+        return client
+
+    def stats(self) -> Dict[str, Dict]:
+        """各连接池的复用计数"""
+        return {name: stats.to_dict() for name, stats in self._stats.items()}
+
+    async def aclose(self):
+        """关闭所有连接"""
+        clients, self._clients, self._openai = self._clients, {}, {}
+        for client in clients.values():
+            await client.aclose()
+        cassette = get_cassette(self.config)
+        if cassette is not None:
+            cassette.close()
+
+
+_registry: Optional[ClientRegistry] = None
+
+
+def get_registry(config: ConfigSnapshot) -> ClientRegistry:
+    """获取进程级客户端注册表，首次调用时创建"""
+    global _registry
+    if _registry is None:
+        _registry = ClientRegistry(config)
+    return _registry
+
+
+def run(coro):
+    """运行协程，结束时关闭共享连接"""
+    async def runner():
+        try:
+            return await coro
+        finally:
+            if _registry is not None:
+                await _registry.aclose()
+
+    return asyncio.run(runner())
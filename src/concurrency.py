@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并发控制模块
+进程内所有外部调用（模型、图片、下载、MCP）共享一个并发上限；
+名额已满时按当前任务的优先级排队，紧急任务的调用先拿到名额。
+模型、图片和 MCP 调用另有按调用类型的自适应上限（AIMD）：延迟平稳时逐步放宽，
+遇到限流（429/503）、超时或延迟突增时减半
+"""
+
+import time
+import heapq
+import asyncio
+import itertools
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from tracing import span
+
+
+# 优先级越小越先执行：(通道序号, 最晚开始时间)；未设置时为普通通道、无截止时间
+DEFAULT_PRIORITY: Tuple[float, float] = (1, float('inf'))
+
+# 自适应上限的下限、降低时的乘数
+ADAPTIVE_MIN = 1
+ADAPTIVE_BACKOFF = 0.5
+# 延迟超过基线的倍数视为延迟突增
+LATENCY_TOLERANCE = 2.0
+# 基线延迟的指数滑动平均系数，以及开始判断延迟突增前需要的样本数
+BASELINE_ALPHA = 0.1
+BASELINE_SAMPLES = 3
+# 视为限流或服务过载的 HTTP 状态码
+OVERLOAD_STATUS = (429, 503)
+
+_priority: contextvars.ContextVar[Tuple[float, float]] = contextvars.ContextVar('priority', default=DEFAULT_PRIORITY)
+
+
+@contextmanager
+def priority_scope(priority: Tuple[float, float]):
+    """设置当前上下文中外部调用的排队优先级"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def is_overload(error: BaseException) -> bool:
+    """异常是否说明服务端过载：限流或服务不可用的状态码，或单次调用超时（不含笔记整体预算耗尽）"""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status in OVERLOAD_STATUS:
+        return True
+    return isinstance(error, TimeoutError) and getattr(error, 'reason', 'stage') != 'deadline'
+
+
+class ConcurrencyLimiter:
+    """全局并发限制器
+
+    与 asyncio.Semaphore 相同的名额语义，但等待者按 (优先级, 到达顺序) 出队，
+    同优先级保持先到先得。limit 可以在运行中调整，降低后占用的名额在归还时回收
+    """
+
+    def __init__(self, limit: int = 8, name: str = 'global'):
+        self.name = name
+        self.limit = max(1, limit)
+        self.in_flight = 0
+        self._waiters: List[Tuple[Tuple[float, float], int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    def _capacity(self) -> int:
+        return int(self.limit)
+
+    def _release(self):
+        """释放名额：未超出上限且有等待者时直接转交给优先级最高的一个"""
+        if self.in_flight <= self._capacity():
+            while self._waiters:
+                _, _, waiter = heapq.heappop(self._waiters)
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.in_flight -= 1
+
+    def _wake(self):
+        """上限提高后唤醒等待者"""
+        while self._waiters and self.in_flight < self._capacity():
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    async def _acquire(self):
+        if self.in_flight < self._capacity() and not self._waiters:
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        priority = _priority.get()
+        heapq.heappush(self._waiters, (priority, next(self._order), waiter))
+        # 名额已满，排队时间记录到时间线上
+        with span('queue', cat='limiter', limiter=self.name, limit=self._capacity(),
+                  in_flight=self.in_flight, priority=list(priority)):
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # 名额已经转交过来但调用方被取消，继续转交
+                    self._release()
+                raise
+
+    @asynccontextmanager
+    async def slot(self, kind: Optional[str] = None, key: Optional[str] = None):
+        """占用一个并发名额
+
+        kind 为 chat/image/mcp 等调用类型，开启自适应时先占用该类型的名额，再占用全局名额；
+        key 区分延迟基线（如模型调用的阶段），不同阶段的正常耗时差别很大。
+        返回的 CallSlot 用于报告调用结果，调用中抛出的异常会自动报告
+        """
+        adaptive = self.adaptive(kind)
+        if adaptive is not None:
+            await adaptive._acquire()
+        try:
+            await self._acquire()
+            call = CallSlot()
+            try:
+                yield call
+            except asyncio.CancelledError:
+                call.abandon()
+                raise
+            except Exception as e:
+                call.fail(e)
+                raise
+            finally:
+                call.ended = time.monotonic()
+                self._release()
+                if adaptive is not None and not call.abandoned:
+                    adaptive.observe(key or kind, call)
+        finally:
+            if adaptive is not None:
+                adaptive._release()
+
+    def adaptive(self, kind: Optional[str]) -> Optional['AdaptiveLimiter']:
+        """调用类型对应的自适应限制器，未开启自适应时为 None"""
+        return None
+
+    def stats(self) -> Dict[str, Dict]:
+        """各自适应限制器的当前上限和调整次数"""
+        return {}
+
+
+class CallSlot:
+    """一次占用名额的调用，记录耗时和结果"""
+
+    __slots__ = ('started', 'ended', 'failed', 'overloaded', 'abandoned')
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.ended: Optional[float] = None
+        self.failed = False
+        self.overloaded = False
+        self.abandoned = False
+
+    def fail(self, error: BaseException):
+        """调用失败，限流和超时计为过载"""
+        self.failed = True
+        self.overloaded = self.overloaded or is_overload(error)
+
+    def status(self, code: int):
+        """HTTP 状态码，429/503 计为过载"""
+        if code in OVERLOAD_STATUS:
+            self.failed = True
+            self.overloaded = True
+
+    def abandon(self):
+        """调用被取消，不计入自适应统计"""
+        self.abandoned = True
+
+    @property
+    def latency(self) -> float:
+        return (self.ended or time.monotonic()) - self.started
+
+
+class AdaptiveLimiter(ConcurrencyLimiter):
+    """单一调用类型的 AIMD 并发上限
+
+    - 名额用满时每成功一次上限增加 1/上限，即每一轮（约上限次调用）加 1，不超过 maximum
+    - 过载（限流、超时）或延迟超过该 key 基线的 LATENCY_TOLERANCE 倍时上限乘以 ADAPTIVE_BACKOFF，不低于 minimum；
+      上次降低之前就已开始的调用不再触发降低，一轮拥塞只降一次
+    基线为成功调用延迟的慢速滑动平均，延迟持续升高时基线随之上移
+    """
+
+    def __init__(self, name: str, initial: int, maximum: int, minimum: int = ADAPTIVE_MIN):
+        super().__init__(initial, name)
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.baselines: Dict[str, Tuple[float, int]] = {}
+        self.peak = self._capacity()
+        self.increases = 0
+        self.decreases = 0
+        self.overloads = 0
+        self.spikes = 0
+        self._decreased_at = 0.0
+
+    def observe(self, key: str, call: CallSlot):
+        """根据一次调用的结果调整上限"""
+        latency = call.latency
+        spike = False
+        if not call.failed:
+            baseline, samples = self.baselines.get(key, (latency, 0))
+            spike = samples >= BASELINE_SAMPLES and latency > baseline * LATENCY_TOLERANCE
+            self.baselines[key] = (baseline + BASELINE_ALPHA * (latency - baseline), samples + 1)
+
+        if call.overloaded or spike:
+            if call.overloaded:
+                self.overloads += 1
+            else:
+                self.spikes += 1
+            if call.started >= self._decreased_at:
+                self._decrease()
+        elif not call.failed and self.in_flight >= self._capacity():
+            # 只在名额用满时放宽，空闲时上限不会无限增长
+            self._increase()
+
+    def _increase(self):
+        before = self._capacity()
+        self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+        if self._capacity() > before:
+            self.increases += 1
+            self.peak = max(self.peak, self._capacity())
+            self._wake()
+
+    def _decrease(self):
+        before = self._capacity()
+        self.limit = max(float(self.minimum), self.limit * ADAPTIVE_BACKOFF)
+        self._decreased_at = time.monotonic()
+        if self._capacity() < before:
+            self.decreases += 1
+            print(f"   🎚️  {self.name} 并发上限 {before} → {self._capacity()}")
+
+    def to_dict(self) -> Dict:
+        return {
+            'limit': self._capacity(),
+            'min': self.minimum,
+            'max': self.maximum,
+            'peak': self.peak,
+            'in_flight': self.in_flight,
+            'increases': self.increases,
+            'decreases': self.decreases,
+            'overloads': self.overloads,
+            'latency_spikes': self.spikes,
+            'baselines': {key: baseline for key, (baseline, _) in self.baselines.items()}
+        }
+
+
+class AdaptiveConcurrencyLimiter(ConcurrencyLimiter):
+    """全局上限 + 按调用类型的自适应上限
+
+    各类型从全局上限的一半开始，最多放宽到全局上限
+    """
+
+    def __init__(self, limit: int = 8):
+        super().__init__(limit)
+        self._kinds: Dict[str, AdaptiveLimiter] = {}
+
+    def adaptive(self, kind: Optional[str]) -> Optional[AdaptiveLimiter]:
+        if kind is None:
+            return None
+        limiter = self._kinds.get(kind)
+        if limiter is None:
+            limiter = self._kinds[kind] = AdaptiveLimiter(kind, max(ADAPTIVE_MIN, self.limit // 2), self.limit)
+        return limiter
+
+    def stats(self) -> Dict[str, Dict]:
+        return {kind: limiter.to_dict() for kind, limiter in self._kinds.items()}
+
+
+_limiter: Optional[ConcurrencyLimiter] = None
+
+
+def configure_limiter(limit: int, adaptive: bool = False) -> ConcurrencyLimiter:
+    """设置全局并发上限和是否开启按调用类型的自适应上限，需在事件循环开始前调用"""
+    global _limiter
+    _limiter = AdaptiveConcurrencyLimiter(limit) if adaptive else ConcurrencyLimiter(limit)
+    return _limiter
+
+
+def get_limiter() -> ConcurrencyLimiter:
+    """获取全局并发限制器"""
+    global _limiter
+    if _limiter is None:
+        _limiter = ConcurrencyLimiter()
+    return _limiter
@@ -2,46 +2,156 @@
 # -*- coding: utf-8 -*-
 """
 配置管理模块
-支持 .env 文件和环境变量
+支持 .env 文件和环境变量；运行时各组件使用启动时构建的只读快照，
+.env 修改或收到 SIGHUP 后重新构建快照并整体替换
 """
 
 import os
+import time
+import signal
 import getpass
-from typing import Dict, Optional
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
 from pathlib import Path
 
 
+def _env_int(key: str, default: int) -> int:
+    value = os.getenv(key, str(default))
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{key} 不是有效的整数: {value}") from None
+
+
+def _env_float(key: str, default: float) -> float:
+    value = os.getenv(key, str(default))
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{key} 不是有效的数字: {value}") from None
+
+
+def _env_lists(key: str) -> Dict[str, List[str]]:
+    """解析 name=a,b;name2=c 格式"""
+    result = {}
+    for item in os.getenv(key, '').split(';'):
+        if '=' not in item:
+            continue
+        name, values = item.split('=', 1)
+        selected = [v.strip() for v in values.split(',') if v.strip()]
+        if selected:
+            result[name.strip()] = selected
+    return result
+
+
 class Config:
     """配置管理"""
 
     def __init__(self, env_file: str = '.env'):
         self.env_file = env_file
+        # 从 .env 写入环境变量的值，重新加载时只覆盖这些键，外部设置的环境变量仍然优先
+        self._file_values: Dict[str, str] = {}
         self._load_env()
 
+    def _read_env_file(self) -> Optional[Dict[str, str]]:
+        """解析 .env 文件，文件不存在时返回 None"""
+        env_path = Path(self.env_file)
+        if not env_path.exists():
+            return None
+        values = {}
+        with open(env_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                # 跳过注释和空行
+                if not line or line.startswith('#'):
+                    continue
+                # 解析 key=value
+                if '=' in line:
+                    key, value = line.split('=', 1)
+                    values[key.strip()] = value.strip()
+        return values
+
     def _load_env(self):
         """加载 .env 文件"""
-        env_path = Path(self.env_file)
-        if env_path.exists():
-            try:
-                with open(env_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line = line.strip()
-                        # 跳过注释和空行
-                        if not line or line.startswith('#'):
-                            continue
-                        # 解析 key=value
-                        if '=' in line:
-                            key, value = line.split('=', 1)
-                            key = key.strip()
-                            value = value.strip()
-                            # 只设置未设置的环境变量
-                            if key not in os.environ:
-                                os.environ[key] = value
-                print(f"✅ 已加载配置文件: {self.env_file}")
-            except Exception as e:
-                print(f"⚠️  配置文件加载失败: {e}")
-        else:
+        try:
+            values = self._read_env_file()
+        except Exception as e:
+            print(f"⚠️  配置文件加载失败: {e}")
+            return
+        if values is None:
             print(f"⚠️  配置文件不存在: {self.env_file}")
+            return
+        for key, value in values.items():
+            # 只设置未设置的环境变量
+            if key not in os.environ:
+                os.environ[key] = value
+                self._file_values[key] = value
+        print(f"✅ 已加载配置文件: {self.env_file}")
+
+    def reload(self):
+        """重新读取 .env，更新之前由该文件设置的环境变量；读取失败时抛出异常"""
+        values = self._read_env_file() or {}
+        for key, old in list(self._file_values.items()):
+            if os.environ.get(key) != old:
+                # 运行中被外部修改过，不再由文件管理
+                del self._file_values[key]
+            elif key not in values:
+                del os.environ[key]
+                del self._file_values[key]
+        for key, value in values.items():
+            if key not in os.environ or key in self._file_values:
+                os.environ[key] = value
+                self._file_values[key] = value
+
+    def snapshot(self, version: int = 1) -> 'ConfigSnapshot':
+        """读取当前配置，构建校验过的只读快照"""
+        return ConfigSnapshot(
+            version=version,
+            loaded_at=time.time(),
+            api_key=self.api_key,
+            model=self.model,
+            models=tuple(self.models),
+            model_routes=MappingProxyType({k: tuple(v) for k, v in self.model_routes.items()}),
+            base_url=self.base_url,
+            image_model=self.image_model,
+            mcp_url=self.mcp_url,
+            mcp_image_mode=self.mcp_image_mode,
+            mcp_tool=self.mcp_tool,
+            default_account=self.default_account,
+            default_word_count=self.default_word_count,
+            output_dir=self.output_dir,
+            api_timeout=self.api_timeout,
+            chat_timeout=self.chat_timeout,
+            image_timeout=self.image_timeout,
+            download_timeout=self.download_timeout,
+            mcp_timeout=self.mcp_timeout,
+            browser_timeout=self.browser_timeout,
+            browser_lean=self.browser_lean,
+            browser_block_types=tuple(self.browser_block_types),
+            browser_allow_domains=tuple(self.browser_allow_domains),
+            browser_profile=self.browser_profile,
+            note_deadline=self.note_deadline,
+            dedup_mode=self.dedup_mode,
+            dedup_threshold=self.dedup_threshold,
+            prompt_variants=MappingProxyType({k: tuple(v) for k, v in self.prompt_variants.items()}),
+            local_tags=self.local_tags,
+            max_jobs=self.max_jobs,
+            prewarm=self.prewarm,
+            trace=self.trace,
+            image_cache=self.image_cache,
+            image_cache_reuse=tuple(self.image_cache_reuse),
+            candidates=self.candidates,
+            max_concurrency=self.max_concurrency,
+            adaptive_concurrency=self.adaptive_concurrency,
+            cassette_mode=self.cassette_mode,
+            cassette_path=self.cassette_path,
+            replay_scale=self.replay_scale,
+            http2=self.http2,
+            http_max_connections=self.http_max_connections,
+            http_max_keepalive=self.http_max_keepalive,
+            http_keepalive_expiry=self.http_keepalive_expiry
+        )
 
     @property
     def api_key(self) -> str:
@@ -51,6 +161,17 @@ class Config:
     def model(self) -> str:
         return os.getenv('XHS_MODEL', 'doubao-seed-1-8-251228')
 
+    @property
+    def models(self) -> List[str]:
+        """文本模型候选列表（逗号分隔），未配置时只使用 XHS_MODEL"""
+        models = [m.strip() for m in os.getenv('XHS_MODELS', '').split(',') if m.strip()]
+        return models or [self.model]
+
+    @property
+    def model_routes(self) -> Dict[str, List[str]]:
+        """按调用类型指定候选模型，如 structure=a,b;content=c,a"""
+        return _env_lists('XHS_MODEL_ROUTES')
+
     @property
     def base_url(self) -> str:
         return os.getenv('XHS_API_ENDPOINT', 'https://ark.cn-beijing.volces.com/api/v3')
@@ -63,6 +184,11 @@ class Config:
     def mcp_url(self) -> str:
         return os.getenv('XHS_MCP_URL', '')
 
+    @property
+    def mcp_image_mode(self) -> str:
+        """MCP 图片传递方式：path（本地路径）/ base64（图片数据流式编码进请求体）"""
+        return os.getenv('XHS_MCP_IMAGE_MODE', 'path').lower()
+
     @property
     def mcp_tool(self) -> str:
         return os.getenv('XHS_MCP_TOOL', 'publish_content')
@@ -73,7 +199,7 @@ class Config:
 
     @property
     def default_word_count(self) -> int:
-        return int(os.getenv('XHS_DEFAULT_WORD_COUNT', '500'))
+        return _env_int('XHS_DEFAULT_WORD_COUNT', 500)
 
     @property
     def output_dir(self) -> str:
@@ -81,7 +207,153 @@ class Config:
 
     @property
     def api_timeout(self) -> int:
-        return int(os.getenv('XHS_API_TIMEOUT', '60'))
+        return _env_int('XHS_API_TIMEOUT', 60)
+
+    @property
+    def chat_timeout(self) -> float:
+        """单次文本模型调用超时（秒），默认沿用 XHS_API_TIMEOUT"""
+        return _env_float('XHS_CHAT_TIMEOUT', self.api_timeout)
+
+    @property
+    def image_timeout(self) -> float:
+        """单张图片生成超时（秒），默认沿用 XHS_API_TIMEOUT"""
+        return _env_float('XHS_IMAGE_TIMEOUT', self.api_timeout)
+
+    @property
+    def download_timeout(self) -> float:
+        return _env_float('XHS_DOWNLOAD_TIMEOUT', 30)
+
+    @property
+    def mcp_timeout(self) -> float:
+        return _env_float('XHS_MCP_TIMEOUT', 30)
+
+    @property
+    def browser_timeout(self) -> float:
+        """浏览器页面加载超时（毫秒）"""
+        return _env_float('XHS_BROWSER_TIMEOUT', 30000)
+
+    @property
+    def browser_lean(self) -> bool:
+        """精简加载发布页：屏蔽无用资源和第三方域名，等到表单控件出现即开始操作"""
+        return os.getenv('XHS_BROWSER_LEAN', 'true').lower() in ('1', 'true', 'yes')
+
+    @property
+    def browser_block_types(self) -> List[str]:
+        """精简加载时屏蔽的资源类型（Playwright resource_type，逗号分隔）"""
+        value = os.getenv('XHS_BROWSER_BLOCK_TYPES', 'image,media,font')
+        return [t.strip() for t in value.split(',') if t.strip()]
+
+    @property
+    def browser_allow_domains(self) -> List[str]:
+        """精简加载时允许访问的域名（含子域名），其他第三方域名的请求被屏蔽；留空不限制"""
+        value = os.getenv('XHS_BROWSER_ALLOW_DOMAINS', 'xiaohongshu.com,xhscdn.com')
+        return [d.strip() for d in value.split(',') if d.strip()]
+
+    @property
+    def browser_profile(self) -> str:
+        """浏览器配置目录，保存登录状态和静态资源缓存；设为空则每次使用临时配置"""
+        return os.getenv('XHS_BROWSER_PROFILE', os.path.join(self.output_dir, 'browser_profile'))
+
+    @property
+    def note_deadline(self) -> float:
+        """单篇笔记从生成到发布的总预算（秒），等待用户确认的时间不计入；0 表示不限制"""
+        return _env_float('XHS_NOTE_DEADLINE', 600)
+
+    @property
+    def dedup_mode(self) -> str:
+        """相似笔记处理方式：reangle（换角度）/ skip（跳过）/ off（不检查）"""
+        return os.getenv('XHS_DEDUP_MODE', 'reangle').lower()
+
+    @property
+    def dedup_threshold(self) -> float:
+        return _env_float('XHS_DEDUP_THRESHOLD', 0.5)
+
+    @property
+    def prompt_variants(self) -> Dict[str, List[str]]:
+        """参与 A/B 对比的模板变体，如 humanize=default,b;content=b"""
+        return _env_lists('XHS_PROMPT_VARIANTS')
+
+    @property
+    def max_jobs(self) -> int:
+        """批量模式同时处理的笔记数，其余按优先通道和截止时间排队；0 表示不限制"""
+        return _env_int('XHS_MAX_JOBS', 4)
+
+    @property
+    def prewarm(self) -> bool:
+        """生成内容的同时预热发布渠道（启动浏览器并确认登录，或检查 MCP 服务端）"""
+        return os.getenv('XHS_PREWARM', 'true').lower() in ('1', 'true', 'yes')
+
+    @property
+    def trace(self) -> bool:
+        """记录各阶段和外部调用的时间线，运行结束后导出 Chrome Trace Event 文件"""
+        return os.getenv('XHS_TRACE', 'true').lower() in ('1', 'true', 'yes')
+
+    @property
+    def image_cache(self) -> bool:
+        """相同模型、尺寸和 prompt 的图片复用缓存，不重新生成"""
+        return os.getenv('XHS_IMAGE_CACHE', 'true').lower() in ('1', 'true', 'yes')
+
+    @property
+    def image_cache_reuse(self) -> List[str]:
+        """已发布过的缓存图片仍可复用的图片类型（cover / content），用于固定封面风格的系列笔记"""
+        return [t.strip() for t in os.getenv('XHS_IMAGE_CACHE_REUSE', '').split(',') if t.strip()]
+
+    @property
+    def local_tags(self) -> bool:
+        """历史数据足够时由本地标签索引推荐标签，不再让模型生成"""
+        return os.getenv('XHS_LOCAL_TAGS', 'false').lower() in ('1', 'true', 'yes')
+
+    @property
+    def candidates(self) -> int:
+        """推测生成的候选文案数，1 表示关闭"""
+        return max(1, _env_int('XHS_CANDIDATES', 1))
+
+    @property
+    def max_concurrency(self) -> int:
+        """进程内同时进行的网络调用上限（模型、图片、下载、MCP）"""
+        return _env_int('XHS_MAX_CONCURRENCY', 8)
+
+    @property
+    def adaptive_concurrency(self) -> bool:
+        """模型、图片和 MCP 调用按观测到的延迟和限流自动调整各自的并发上限（不超过 XHS_MAX_CONCURRENCY）"""
+        return os.getenv('XHS_ADAPTIVE_CONCURRENCY', 'true').lower() in ('1', 'true', 'yes')
+
+    @property
+    def cassette_mode(self) -> str:
+        """录制回放模式：off、record（录制外部请求）、replay（从回放文件返回，不访问网络）"""
+        return os.getenv('XHS_CASSETTE_MODE', 'off').lower()
+
+    @property
+    def cassette_path(self) -> str:
+        """回放文件路径"""
+        return os.getenv('XHS_CASSETTE', os.path.join(self.output_dir, 'cassette.jsonl.gz'))
+
+    @property
+    def replay_scale(self) -> float:
+        """回放时的耗时缩放：1 为录制时的原始耗时，0 为立即返回"""
+        return _env_float('XHS_REPLAY_SCALE', 1.0)
+
+    @property
+    def http2(self) -> bool:
+        """是否启用 HTTP/2（需要安装 h2）"""
+        return os.getenv('XHS_HTTP2', 'false').lower() in ('1', 'true', 'yes')
+
+    @property
+    def http_max_connections(self) -> int:
+        return _env_int('XHS_HTTP_MAX_CONNECTIONS', 20)
+
+    @property
+    def http_max_keepalive(self) -> int:
+        """保留的空闲连接数，默认与 XHS_HTTP_MAX_CONNECTIONS 相同
+
+        httpcore 在连接总数超过该值时会关闭空闲连接，设得更小会让高并发下几乎无法复用
+        """
+        return _env_int('XHS_HTTP_MAX_KEEPALIVE', self.http_max_connections)
+
+    @property
+    def http_keepalive_expiry(self) -> float:
+        """空闲连接保留时长（秒）"""
+        return _env_float('XHS_HTTP_KEEPALIVE_EXPIRY', 30)
 
     def validate(self) -> bool:
         """验证配置，返回是否成功"""
@@ -111,6 +383,87 @@ class Config:
         os.makedirs(self.output_dir, exist_ok=True)
         return True
 
+    def to_dict(self) -> Dict:
+        """返回配置字典"""
+        return self.snapshot().to_dict()
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """只读配置快照
+
+    启动时构建一次并传给所有组件，运行中不再读取环境变量；
+    热加载时构建新快照整体替换，已经开始的笔记继续使用开始时的快照
+    """
+
+    version: int
+    loaded_at: float
+    api_key: str = field(repr=False)
+    model: str
+    models: Tuple[str, ...]
+    model_routes: Mapping[str, Tuple[str, ...]]
+    base_url: str
+    image_model: str
+    mcp_url: str
+    mcp_image_mode: str
+    mcp_tool: str
+    default_account: str
+    default_word_count: int
+    output_dir: str
+    api_timeout: int
+    chat_timeout: float
+    image_timeout: float
+    download_timeout: float
+    mcp_timeout: float
+    browser_timeout: float
+    browser_lean: bool
+    browser_block_types: Tuple[str, ...]
+    browser_allow_domains: Tuple[str, ...]
+    browser_profile: str
+    note_deadline: float
+    dedup_mode: str
+    dedup_threshold: float
+    prompt_variants: Mapping[str, Tuple[str, ...]]
+    local_tags: bool
+    max_jobs: int
+    prewarm: bool
+    trace: bool
+    image_cache: bool
+    image_cache_reuse: Tuple[str, ...]
+    candidates: int
+    max_concurrency: int
+    adaptive_concurrency: bool
+    cassette_mode: str
+    cassette_path: str
+    replay_scale: float
+    http2: bool
+    http_max_connections: int
+    http_max_keepalive: int
+    http_keepalive_expiry: float
+
+    def __post_init__(self):
+        problems = []
+        if self.mcp_image_mode not in ('path', 'base64'):
+            problems.append(f"XHS_MCP_IMAGE_MODE 只能是 path 或 base64: {self.mcp_image_mode}")
+        if self.dedup_mode not in ('reangle', 'skip', 'off'):
+            problems.append(f"XHS_DEDUP_MODE 只能是 reangle、skip 或 off: {self.dedup_mode}")
+        if not 0 < self.dedup_threshold <= 1:
+            problems.append(f"XHS_DEDUP_THRESHOLD 应在 0 到 1 之间: {self.dedup_threshold}")
+        for name in ('default_word_count', 'max_concurrency', 'http_max_connections', 'api_timeout',
+                     'chat_timeout', 'image_timeout', 'download_timeout', 'mcp_timeout', 'browser_timeout'):
+            if getattr(self, name) <= 0:
+                problems.append(f"{name} 必须大于 0: {getattr(self, name)}")
+        if self.note_deadline < 0:
+            problems.append(f"XHS_NOTE_DEADLINE 不能为负数: {self.note_deadline}")
+        if self.max_jobs < 0:
+            problems.append(f"XHS_MAX_JOBS 不能为负数: {self.max_jobs}")
+        if self.cassette_mode not in ('off', 'record', 'replay'):
+            problems.append(f"XHS_CASSETTE_MODE 只能是 off、record 或 replay: {self.cassette_mode}")
+        if self.replay_scale < 0:
+            problems.append(f"XHS_REPLAY_SCALE 不能为负数: {self.replay_scale}")
+        if problems:
+            raise ValueError('；'.join(problems))
+
     def to_dict(self) -> Dict:
         """返回配置字典"""
         return {
@@ -123,4 +476,80 @@ class Config:
             'default_account': self.default_account,
             'default_word_count': self.default_word_count,
             'output_dir': self.output_dir
-        }
\ No newline at end of file
+        }
+
+
+class ConfigWatcher:
+    """配置热加载
+
+    current() 返回当前快照，每隔 interval 秒检查一次 .env 的修改时间，
+    文件变化或收到 SIGHUP 后重新构建快照；新配置校验失败时保留旧快照。
+    RESTART_FIELDS 中的配置在启动时确定，重新加载时发现变化会提示需要重启
+    """
+
+    # 连接池、并发上限和录制回放在首次使用时创建，修改后需要重启才能生效
+    RESTART_FIELDS = {
+        'max_concurrency': 'XHS_MAX_CONCURRENCY',
+        'adaptive_concurrency': 'XHS_ADAPTIVE_CONCURRENCY',
+        'http2': 'XHS_HTTP2',
+        'http_max_connections': 'XHS_HTTP_MAX_CONNECTIONS',
+        'http_max_keepalive': 'XHS_HTTP_MAX_KEEPALIVE',
+        'http_keepalive_expiry': 'XHS_HTTP_KEEPALIVE_EXPIRY',
+        'cassette_mode': 'XHS_CASSETTE_MODE',
+        'cassette_path': 'XHS_CASSETTE',
+        'replay_scale': 'XHS_REPLAY_SCALE'
+    }
+
+    def __init__(self, config: Config, interval: float = 1.0):
+        self.config = config
+        self.interval = interval
+        self._snapshot = config.snapshot()
+        self._mtime = self._stat()
+        self._checked_at = time.monotonic()
+        self._requested = False
+
+    def _stat(self) -> Optional[int]:
+        try:
+            return os.stat(self.config.env_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def current(self) -> ConfigSnapshot:
+        """当前快照，必要时先重新加载"""
+        now = time.monotonic()
+        if self._requested or now - self._checked_at >= self.interval:
+            self._checked_at = now
+            mtime = self._stat()
+            if self._requested or mtime != self._mtime:
+                self._requested = False
+                self._mtime = mtime
+                self.reload()
+        return self._snapshot
+
+    def reload(self) -> bool:
+        """重新加载配置，返回是否成功"""
+        try:
+            self.config.reload()
+            snapshot = self.config.snapshot(self._snapshot.version + 1)
+            if not snapshot.api_key:
+                raise ValueError("XHS_API_KEY 为空")
+        except Exception as e:
+            print(f"⚠️  配置重新加载失败，继续使用第 {self._snapshot.version} 版: {e}")
+            return False
+        changed = [key for name, key in self.RESTART_FIELDS.items()
+                   if getattr(snapshot, name) != getattr(self._snapshot, name)]
+        # 单次赋值替换，读取方拿到的要么是旧快照要么是新快照
+        self._snapshot = snapshot
+        print(f"🔄 配置已重新加载（第 {snapshot.version} 版）")
+        if changed:
+            print(f"⚠️  以下配置需要重启才能生效: {', '.join(changed)}")
+        return True
+
+    def request_reload(self):
+        """标记下次读取快照前重新加载"""
+        self._requested = True
+
+    def install_signal_handler(self):
+        """收到 SIGHUP 时重新加载（Windows 没有 SIGHUP，只依赖文件检查）"""
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.request_reload())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+超时与截止时间模块
+每篇笔记有一个端到端截止时间，通过 contextvars 传递到所有下游调用；
+每次调用的超时取阶段超时和剩余预算中的较小值
+"""
+
+import time
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from typing import Awaitable, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+class DeadlineExceeded(TimeoutError):
+    """阶段超时或笔记截止时间已到
+
+    reason 为 'stage' 表示单个阶段超过自身超时，'deadline' 表示笔记的整体预算耗尽
+    """
+
+    def __init__(self, stage: str, reason: str, budget: float):
+        self.stage = stage
+        self.reason = reason
+        self.budget = budget
+        label = '截止时间已到' if reason == 'deadline' else '阶段超时'
+        super().__init__(f"{stage} {label}（预算 {budget:.1f}s）")
+
+
+class Deadline:
+    """截止时间，等待用户输入等时间可以暂停计时"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """剩余秒数"""
+        return self.expires_at - time.monotonic()
+
+    @contextmanager
+    def paused(self):
+        """暂停计时，退出时按暂停时长顺延截止时间"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.expires_at += time.monotonic() - start
+
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar('deadline', default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: float):
+    """在当前上下文设置截止时间，嵌套时只能收紧不能放宽；seconds <= 0 表示不限制"""
+    if seconds <= 0:
+        yield _current.get()
+        return
+
+    outer = _current.get()
+    deadline = Deadline(seconds)
+    if outer is not None and outer.expires_at < deadline.expires_at:
+        deadline = outer
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """当前上下文的截止时间"""
+    return _current.get()
+
+
+@contextmanager
+def paused():
+    """暂停当前截止时间的计时，用于等待用户确认或定时发布"""
+    deadline = _current.get()
+    if deadline is None:
+        yield
+        return
+    with deadline.paused():
+        yield
+
+
+@contextmanager
+def forked():
+    """后台任务使用当前截止时间的副本：副本上的暂停只影响后台任务自己，不顺延原截止时间"""
+    outer = _current.get()
+    if outer is None:
+        yield None
+        return
+    deadline = Deadline(outer.seconds)
+    deadline.expires_at = outer.expires_at
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def extend(seconds: float):
+    """把当前截止时间顺延 seconds 秒，用于事后扣除等待用户的时间"""
+    deadline = _current.get()
+    if deadline is not None and seconds > 0:
+        deadline.expires_at += seconds
+
+
+def budget_for(timeout: float) -> Tuple[float, str]:
+    """计算一次调用可用的时间，返回 (秒数, 限制来源)"""
+    deadline = _current.get()
+    if deadline is not None and deadline.remaining() < timeout:
+        return deadline.remaining(), 'deadline'
+    return timeout, 'stage'
+
+
+async def with_timeout(stage: str, awaitable: Awaitable[T], timeout: float, metrics=None) -> T:
+    """在阶段超时和剩余预算内等待调用完成，超时即取消并记录到指标
+
+    只有本函数的计时到期才转换为 DeadlineExceeded；调用内部自己抛出的 TimeoutError
+    （如等待登录、等待文件锁超时）原样抛出
+    """
+    budget, reason = budget_for(timeout)
+    if budget <= 0:
+        # 预算已耗尽，不再发起调用
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        if metrics:
+            metrics.record_timeout(stage, reason, 0.0)
+        raise DeadlineExceeded(stage, reason, 0.0)
+
+    task = asyncio.ensure_future(awaitable)
+    try:
+        done, _ = await asyncio.wait({task}, timeout=budget)
+    except asyncio.CancelledError:
+        task.cancel()
+        await asyncio.wait({task})
+        raise
+
+    if not done:
+        # 计时到期：取消调用并等待其清理完成
+        task.cancel()
+        await asyncio.wait({task})
+        if not task.cancelled():
+            task.exception()
+        if metrics:
+            metrics.record_timeout(stage, reason, budget)
+        raise DeadlineExceeded(stage, reason, budget)
+    return task.result()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件工具模块
+跨进程的建议性文件锁与原子写入
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import TextIO
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """建议性文件锁
+
+    POSIX 使用 flock，支持共享锁（读）和排他锁（写）；
+    Windows 使用 msvcrt.locking，只支持排他锁，共享锁同样按排他锁处理
+    """
+
+    def __init__(self, path: str, exclusive: bool = True, timeout: float = 30.0):
+        self.path = path
+        self.exclusive = exclusive
+        self.timeout = timeout
+        self._file = None
+
+    def acquire(self):
+        """获取锁，超时抛出 TimeoutError"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._file = open(self.path, 'a+')
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            try:
+                if fcntl:
+                    mode = fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH
+                    fcntl.flock(self._file.fileno(), mode | fcntl.LOCK_NB)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    self._file.close()
+                    self._file = None
+                    raise TimeoutError(f"等待文件锁超时: {self.path}")
+                time.sleep(0.01)
+
+    def release(self):
+        """释放锁"""
+        if not self._file:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def _fsync_dir(path: str):
+    """同步目录项，确保 rename 在断电后依然生效（Windows 不支持，忽略）"""
+    if not fcntl:
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_open(path: str, newline: str = None):
+    """原子写入：先写同目录临时文件并 fsync，成功后再 rename 覆盖目标文件
+
+    写入过程中崩溃只会留下临时文件，目标文件要么是旧内容要么是新内容
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    f: TextIO = open(temp_path, 'w', encoding='utf-8', newline=newline)
+    try:
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.replace(temp_path, path)
+        _fsync_dir(path)
+    except BaseException:
+        f.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
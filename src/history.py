@@ -5,10 +5,26 @@
 """
 
 import os
+import csv
 import json
-from datetime import datetime
-from typing import Dict, List, Optional
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, TextIO
 from pathlib import Path
+from archive import HistoryArchive
+from fileutil import FileLock, atomic_open
+from similarity import SimilarityIndex
+from tag_index import TagIndex, apply_tag_stats
+from ledger import HISTORY_STATUS, PublishLedger
+
+
+# 流式读取历史记录时每次读取的字符数
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# 导出 CSV 的列
+EXPORT_FIELDS = ['id', 'timestamp', 'account', 'topic', 'title', 'status', 'publish_method',
+                 'word_count', 'tags', 'images', 'content']
 
 
 class HistoryManager:
@@ -17,20 +33,62 @@ class HistoryManager:
     def __init__(self, output_dir: str = './output'):
         self.output_dir = output_dir
         self.history_file = os.path.join(output_dir, 'history.json')
+        self.stats_file = os.path.join(output_dir, 'history_stats.json')
+        self.lock_file = os.path.join(output_dir, 'history.json.lock')
+        # 当前持有的锁：None / 'shared' / 'exclusive'
+        self._lock_mode: Optional[str] = None
+        self.similarity = SimilarityIndex(os.path.join(output_dir, 'similarity_index.jsonl'))
+        self.archive = HistoryArchive(os.path.join(output_dir, 'archive'))
+        self.ledger = PublishLedger(os.path.join(output_dir, 'publish_ledger.jsonl'))
+        self._similarity_synced = False
+        # 解析结果按文件大小和修改时间缓存，文件未变化时不重复解析
+        self._cache: Optional[List[Dict]] = None
+        self._cache_signature: Optional[List[int]] = None
+        self._positions: Optional[Dict[str, int]] = None
+        self._tag_index: Optional[TagIndex] = None
         self._ensure_history_file()
 
     def _ensure_history_file(self):
         """确保历史记录文件存在"""
-        if not os.path.exists(self.history_file):
-            os.makedirs(os.path.dirname(self.history_file), exist_ok=True)
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=2)
+        if os.path.exists(self.history_file):
+            return
+        os.makedirs(os.path.dirname(self.history_file), exist_ok=True)
+        with self._locked(exclusive=True):
+            if not os.path.exists(self.history_file):
+                with atomic_open(self.history_file) as f:
+                    json.dump([], f, ensure_ascii=False, indent=2)
 
-    def add_record(self, data: Dict, status: str = 'success', publish_method: str = 'auto') -> Dict:
-        """添加历史记录"""
+    @contextmanager
+    def _locked(self, exclusive: bool = False):
+        """持有历史记录文件锁；同一实例内可重入，避免嵌套调用自锁
+
+        持有共享锁时不能再申请排他锁（flock 升级不是原子操作，两个读者同时升级会互相等待）
+        """
+        if self._lock_mode == 'exclusive' or (self._lock_mode == 'shared' and not exclusive):
+            yield
+            return
+        if self._lock_mode == 'shared':
+            raise RuntimeError("持有共享锁时不能申请排他锁")
+        with FileLock(self.lock_file, exclusive=exclusive):
+            self._lock_mode = 'exclusive' if exclusive else 'shared'
+            try:
+                yield
+            finally:
+                self._lock_mode = None
+
+    @staticmethod
+    def new_record_id() -> str:
+        """生成记录ID，秒级时间戳加随机后缀，同一秒内多次写入也不会冲突"""
+        return f"record_{int(datetime.now().timestamp())}_{uuid.uuid4().hex[:12]}"
+
+    def add_record(self, data: Dict, status: str = 'success', publish_method: str = 'auto',
+                   record_id: Optional[str] = None) -> Dict:
+        """添加历史记录，record_id 为预先分配的ID（new_record_id），保存失败时抛出 OSError"""
         record = {
-            'id': f"record_{int(datetime.now().timestamp())}",
+            'id': record_id or self.new_record_id(),
             'timestamp': datetime.now().isoformat(),
+            'account': data.get('account', ''),
+            'topic': data.get('topic', ''),
             'title': data.get('title', ''),
             'content': data.get('content', ''),
             'tags': data.get('tags', []),
@@ -40,101 +98,398 @@ class HistoryManager:
             'word_count': len(data.get('content', ''))
         }
 
-        # 读取现有记录
-        records = self._load_records()
-        records.insert(0, record)  # 新记录放在前面
+        with self._locked(exclusive=True):
+            # 读取现有记录
+            stats = self._load_stats()
+            records = self._load_records(strict=True)
+            records.insert(0, record)  # 新记录放在前面
+
+            # 保存记录并增量更新统计
+            if not self._save_records(records):
+                raise OSError(f"保存历史记录失败: {self.history_file}")
+            self._apply_stats(stats, record, 1)
+            self._save_stats(stats)
 
-        # 保存记录
-        self._save_records(records)
+            # 增量更新相似度索引
+            self._index_record(record)
 
         return record
 
+    def _index_record(self, record: Dict):
+        """同步记录在相似度索引中的状态：只有发布成功的记录计入，失败和取消的移除
+
+        待发布（pending）和结果未知（unknown）的记录保持原样，等最终状态确定
+        """
+        status = record.get('status')
+        if status == 'success':
+            if not self.similarity.contains(record['id']):
+                self.similarity.add(record['id'], [t for t in (record.get('topic'), record.get('title')) if t])
+        elif status in ('failed', 'cancelled', 'pending'):
+            self.similarity.remove(record['id'])
+
+    def find_similar(self, text: str, threshold: float = 0.5, limit: int = 3) -> List[Dict]:
+        """查找与主题或标题已发布笔记相似的历史笔记"""
+        if not self._similarity_synced:
+            # 首次查询时补齐索引文件中缺失的已发布记录，移除旧版本索引中未发布的记录
+            with self._locked(exclusive=True):
+                for record in self._load_records():
+                    self._index_record(record)
+            self._similarity_synced = True
+
+        return self.similarity.query(text, threshold, limit)
+
     def update_status(self, record_id: str, status: str, message: str = '') -> bool:
-        """更新记录状态"""
-        records = self._load_records()
+        """更新记录状态，记录不存在或保存失败时返回 False"""
+        with self._locked(exclusive=True):
+            stats = self._load_stats()
+            records = self._load_records(strict=True)
 
-        for record in records:
-            if record['id'] == record_id:
-                record['status'] = status
-                record['status_message'] = message
-                record['updated_at'] = datetime.now().isoformat()
-                self._save_records(records)
-                return True
+            for record in records:
+                if record['id'] == record_id:
+                    self._apply_stats(stats, record, -1)
+                    record['status'] = status
+                    record['status_message'] = message
+                    record['updated_at'] = datetime.now().isoformat()
+                    self._apply_stats(stats, record, 1)
+                    if not self._save_records(records):
+                        return False
+                    self._save_stats(stats)
+                    self._index_record(record)
+                    return True
 
         return False
 
-    def _load_records(self) -> List[Dict]:
-        """加载历史记录"""
+    def reconcile(self, stale_after: float = 3600) -> List[Dict]:
+        """崩溃后对账：未发出的登记改为 failed（可以安全重试），已发出但没有结果的改为 unknown
+
+        返回被修改的台账条目，对应的历史记录状态同步更新
+        """
+        changed = []
+        for entry in self.ledger.stale(stale_after):
+            if entry['state'] == 'pending':
+                state, message = 'failed', '进程中断，请求未发出'
+            else:
+                state, message = 'unknown', '进程中断，无法确认是否已发布'
+            entry = self.ledger.transition(entry['key'], state, error=message)
+            self.update_status(entry['record_id'], HISTORY_STATUS[state], message)
+            changed.append(entry)
+        return changed
+
+    def _file_signature(self, path: str) -> Optional[List[int]]:
+        """文件签名（大小 + 修改时间 + inode），用于判断缓存是否失效"""
         try:
-            with open(self.history_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"⚠️  加载历史记录失败: {e}")
-            return []
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
 
-    def _save_records(self, records: List[Dict]):
-        """保存历史记录"""
+    def _load_records(self, strict: bool = False) -> List[Dict]:
+        """加载历史记录
+
+        strict=True 时（写入前）文件无法解析会抛出异常，
+        避免把空列表写回去覆盖掉全部历史
+        """
+        with self._locked():
+            signature = self._file_signature(self.history_file)
+            if self._cache is not None and signature == self._cache_signature:
+                return self._cache
+
+            try:
+                with open(self.history_file, 'r', encoding='utf-8') as f:
+                    records = json.load(f)
+            except Exception as e:
+                if strict:
+                    raise ValueError(f"历史记录文件无法解析，已停止写入以免覆盖: {e}") from e
+                print(f"⚠️  加载历史记录失败: {e}")
+                return []
+
+        self._cache, self._cache_signature, self._positions = records, signature, None
+        return records
+
+    def _save_records(self, records: List[Dict]) -> bool:
+        """保存历史记录（写临时文件 + fsync + rename），返回是否成功
+
+        失败时丢弃内存缓存：调用方已经就地修改了缓存中的列表，下次从文件重新读取
+        """
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
+            with atomic_open(self.history_file) as f:
                 json.dump(records, f, ensure_ascii=False, indent=2)
         except Exception as e:
             print(f"⚠️  保存历史记录失败: {e}")
+            self._cache = self._cache_signature = self._positions = None
+            return False
 
-    def get_records(self, limit: int = 10, status: Optional[str] = None) -> List[Dict]:
-        """获取历史记录"""
-        records = self._load_records()
+        self._cache = records
+        self._cache_signature = self._file_signature(self.history_file)
+        self._positions = None
+        return True
 
-        if status:
-            records = [r for r in records if r.get('status') == status]
+    def _apply_stats(self, stats: Dict, record: Dict, delta: int):
+        """把一条记录计入（或移出）各维度的统计"""
+        status = record.get('status', '')
+        keys = {
+            'method': record.get('publish_method', 'auto'),
+            'day': record.get('timestamp', '')[:10],
+            'account': record.get('account', '')
+        }
+        stats['status'][status] = stats['status'].get(status, 0) + delta
+        for dimension, key in keys.items():
+            bucket = stats[dimension].setdefault(key, {})
+            bucket[status] = bucket.get(status, 0) + delta
+        apply_tag_stats(stats, record, delta)
 
-        return records[:limit]
+    def _rebuild_stats(self, records: List[Dict]) -> Dict:
+        """根据全部记录重建统计"""
+        stats = {'status': {}, 'method': {}, 'day': {}, 'account': {},
+                 'tags': {}, 'tag_pairs': {}, 'tag_names': {}}
+        for record in records:
+            self._apply_stats(stats, record, 1)
+        return stats
 
-    def get_record_by_id(self, record_id: str) -> Optional[Dict]:
-        """根据ID获取记录"""
+    def _load_stats(self) -> Dict:
+        """加载统计文件，与历史记录文件不一致时重建
+
+        只有持有排他锁时才把重建结果写回，只读查询只在内存中重建，由下一次写入时保存
+        """
+        with self._locked():
+            try:
+                with open(self.stats_file, 'r', encoding='utf-8') as f:
+                    stats = json.load(f)
+                # 旧版本统计文件没有标签统计，需要重建
+                if stats.get('source') == self._file_signature(self.history_file) and 'tags' in stats:
+                    return stats
+            except (OSError, ValueError):
+                pass
+
+            stats = self._rebuild_stats(self._load_records())
+            stats['source'] = self._file_signature(self.history_file)
+            if self._lock_mode == 'exclusive':
+                self._save_stats(stats)
+            return stats
+
+    def _save_stats(self, stats: Dict):
+        """保存统计文件，并记录对应的历史记录文件签名"""
+        stats['source'] = self._file_signature(self.history_file)
+        try:
+            with atomic_open(self.stats_file) as f:
+                json.dump(stats, f, ensure_ascii=False)
+        except Exception as e:
+            print(f"⚠️  保存统计信息失败: {e}")
+
+    def query(self, status: Optional[str] = None, publish_method: Optional[str] = None,
+              account: Optional[str] = None, since: Optional[str] = None,
+              until: Optional[str] = None, cursor: Optional[str] = None,
+              limit: int = 20) -> Dict:
+        """分页查询历史记录
+
+        since / until 为日期或 ISO 时间（包含边界），cursor 为上一页返回的 next_cursor
+        """
         records = self._load_records()
 
-        for record in records:
-            if record['id'] == record_id:
-                return record
+        start = 0
+        if cursor:
+            if self._positions is None:
+                self._positions = {r['id']: i for i, r in enumerate(records)}
+            start = self._positions.get(cursor, len(records)) + 1
 
-        return None
+        page = []
+        next_cursor = None
+        for record in records[start:]:
+            timestamp = record.get('timestamp', '')
+            # 记录按时间倒序排列，早于 since 的可以直接停止
+            if since and timestamp[:len(since)] < since:
+                break
+            if until and timestamp[:len(until)] > until:
+                continue
+            if status and record.get('status') != status:
+                continue
+            if publish_method and record.get('publish_method') != publish_method:
+                continue
+            if account is not None and record.get('account', '') != account:
+                continue
+            if len(page) == limit:
+                next_cursor = page[-1]['id']
+                break
+            page.append(record)
 
-    def get_statistics(self) -> Dict:
-        """获取统计信息"""
+        return {'records': page, 'next_cursor': next_cursor}
+
+    def get_records(self, limit: int = 10, status: Optional[str] = None) -> List[Dict]:
+        """获取历史记录"""
+        return self.query(status=status, limit=limit)['records']
+
+    def get_record_by_id(self, record_id: str) -> Optional[Dict]:
+        """根据ID获取记录，当前记录中没有时查找归档"""
         records = self._load_records()
+        if self._positions is None:
+            self._positions = {r['id']: i for i, r in enumerate(records)}
 
-        total = len(records)
-        success = len([r for r in records if r.get('status') == 'success'])
-        failed = len([r for r in records if r.get('status') == 'failed'])
-        pending = len([r for r in records if r.get('status') == 'pending'])
+        position = self._positions.get(record_id)
+        if position is not None:
+            return records[position]
+        return self.archive.find(record_id)
 
-        methods = {}
-        for record in records:
-            method = record.get('publish_method', 'auto')
-            methods[method] = methods.get(method, 0) + 1
+    def aggregate(self, by: str = 'day', since: Optional[str] = None,
+                  until: Optional[str] = None) -> List[Dict]:
+        """按天 / 发布方式 / 账号汇总数量和成功率，直接读取增量维护的统计"""
+        stats = self._load_stats()
+
+        rows = []
+        for key, counts in sorted(stats[by].items(), reverse=True):
+            if by == 'day' and ((since and key < since[:10]) or (until and key > until[:10])):
+                continue
+            row = self._summarize(counts)
+            if row['total']:
+                rows.append({'key': key, **row})
+        return rows
 
+    def _summarize(self, counts: Dict) -> Dict:
+        """根据各状态数量计算汇总信息"""
+        total = sum(counts.values())
+        success = counts.get('success', 0)
         return {
             'total': total,
             'success': success,
-            'failed': failed,
-            'pending': pending,
-            'methods': methods,
+            'failed': counts.get('failed', 0),
+            'pending': counts.get('pending', 0),
+            'cancelled': counts.get('cancelled', 0),
+            'unknown': counts.get('unknown', 0),
             'success_rate': f"{(success / total * 100):.1f}%" if total > 0 else "0%"
         }
 
-    def clear_old_records(self, days: int = 30):
-        """清除旧记录"""
-        records = self._load_records()
-        cutoff_date = datetime.now().timestamp() - (days * 24 * 60 * 60)
+    def get_statistics(self) -> Dict:
+        """获取统计信息"""
+        stats = self._load_stats()
+        summary = self._summarize(stats['status'])
 
-        new_records = []
-        for record in records:
+        return {
+            'total': summary['total'],
+            'success': summary['success'],
+            'failed': summary['failed'],
+            'pending': summary['pending'],
+            'unknown': summary['unknown'],
+            'methods': {m: sum(c.values()) for m, c in stats['method'].items() if sum(c.values())},
+            'success_rate': summary['success_rate']
+        }
+
+    def tag_index(self) -> TagIndex:
+        """标签索引，历史记录变化后重新构建"""
+        stats = self._load_stats()
+        if self._tag_index is None or self._tag_index.source != stats['source']:
+            self._tag_index = TagIndex(stats['tags'], stats['tag_pairs'], stats['tag_names'], stats['source'])
+        return self._tag_index
+
+    def _iter_records(self) -> Iterator[Dict]:
+        """流式逐条读取 history.json，内存占用与文件大小无关"""
+        decoder = json.JSONDecoder()
+        with open(self.history_file, 'r', encoding='utf-8') as f:
+            buffer, started = '', False
+            while True:
+                chunk = f.read(STREAM_CHUNK_SIZE)
+                buffer += chunk
+                while True:
+                    buffer = buffer.lstrip()
+                    if not buffer:
+                        break
+                    if not started:
+                        if buffer[0] != '[':
+                            raise ValueError("历史记录文件格式错误")
+                        buffer, started = buffer[1:], True
+                    elif buffer[0] == ',':
+                        buffer = buffer[1:]
+                    elif buffer[0] == ']':
+                        return
+                    else:
+                        try:
+                            record, end = decoder.raw_decode(buffer)
+                        except json.JSONDecodeError:
+                            break  # 记录尚未读完整，继续读取
+                        yield record
+                        buffer = buffer[end:]
+                if not chunk:
+                    if buffer.strip():
+                        raise ValueError("历史记录文件不完整")
+                    return
+
+    def clear_old_records(self, days: int = 30, archive: bool = True) -> bool:
+        """清除旧记录，返回是否成功
+
+        流式处理：早于 days 天的记录先写入暂存文件（archive=False 时直接删除），
+        其余记录逐条写入新文件，原文件替换成功后才把暂存记录提交到按月归档文件，
+        全程只在内存中保留一条记录。替换失败时原文件、归档和统计都保持不变
+        """
+        cutoff = datetime.now() - timedelta(days=days)
+        stats = self._rebuild_stats([])
+        kept = removed = 0
+        action = '归档' if archive else '清除'
+        archive_writer = self.archive
+
+        with self._locked(exclusive=True):
+            if archive_writer.staged():
+                # 上次归档在替换历史文件前后中断：仍在历史文件中的记录说明替换没有完成，不提交
+                archive_writer.commit(skip={record.get('id') for record in self._iter_records()})
             try:
-                record_time = datetime.fromisoformat(record['timestamp']).timestamp()
-                if record_time > cutoff_date:
-                    new_records.append(record)
-            except:
-                continue
+                with atomic_open(self.history_file) as out:
+                    out.write('[')
+                    for record in self._iter_records():
+                        try:
+                            expired = datetime.fromisoformat(record['timestamp']) < cutoff
+                        except (KeyError, TypeError, ValueError):
+                            expired = True
+
+                        if expired:
+                            if archive:
+                                archive_writer.write(record)
+                            removed += 1
+                            continue
+
+                        out.write(',\n' if kept else '\n')
+                        out.write(json.dumps(record, ensure_ascii=False, indent=2))
+                        self._apply_stats(stats, record, 1)
+                        kept += 1
+                    out.write('\n]')
+                    archive_writer.seal()
+            except Exception as e:
+                archive_writer.discard()
+                print(f"❌ {action}旧记录失败，历史记录未修改: {e}")
+                return False
+            finally:
+                self._cache = self._cache_signature = self._positions = None
+
+            # 记录文件已经替换，统计才与之对应
+            self._save_stats(stats)
+            try:
+                archive_writer.commit()
+            except Exception as e:
+                print(f"⚠️  归档文件写入失败，下次归档时重新提交: {e}")
+                return False
+
+        print(f"✅ 已{action} {removed} 条旧记录，保留 {kept} 条")
+        return True
+
+    def iter_records(self, include_archive: bool = False) -> Iterator[Dict]:
+        """流式遍历全部记录（可包含归档），不会一次性加载到内存"""
+        with self._locked():
+            yield from self._iter_records()
+            if include_archive:
+                yield from self.archive.iter_records()
+
+    def export(self, out: TextIO, fmt: str = 'jsonl', include_archive: bool = True) -> int:
+        """流式导出全部历史记录为 CSV 或 JSONL，返回导出条数"""
+        writer = None
+        if fmt == 'csv':
+            writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+            writer.writeheader()
 
-        self._save_records(new_records)
-        print(f"✅ 已清除 {len(records) - len(new_records)} 条旧记录")
\ No newline at end of file
+        count = 0
+        with self._locked():
+            for record in self.iter_records(include_archive):
+                if writer:
+                    row = dict(record)
+                    row['tags'] = ' '.join(record.get('tags', []))
+                    row['images'] = '|'.join(record.get('images', []))
+                    writer.writerow(row)
+                else:
+                    out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                count += 1
+        return count
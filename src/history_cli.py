@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史记录命令行模块
+python run.py history list|show|stats|tags|reconcile|resolve|retry|archive|export
+"""
+
+import json
+import argparse
+from typing import List
+
+from config import Config
+from history import HistoryManager
+from ledger import HISTORY_STATUS, LedgerError
+
+
+def _print_records(records: List[dict]):
+    """打印记录列表"""
+    for record in records:
+        print(f"{record['id']}  {record.get('timestamp', '')[:19]}  "
+              f"{record.get('status', ''):<9} {record.get('publish_method', ''):<8} "
+              f"{record.get('title', '')}")
+
+
+def run_history_command(argv: List[str]):
+    """历史记录查询命令"""
+    parser = argparse.ArgumentParser(prog='run.py history', description='历史记录查询')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    list_parser = subparsers.add_parser('list', help='分页查询记录')
+    list_parser.add_argument('-s', '--status', help='按状态过滤 (success/failed/pending/cancelled/unknown)')
+    list_parser.add_argument('-m', '--publish-method', help='按发布方式过滤')
+    list_parser.add_argument('-a', '--account', help='按账号过滤')
+    list_parser.add_argument('--since', help='开始日期 (YYYY-MM-DD)')
+    list_parser.add_argument('--until', help='结束日期 (YYYY-MM-DD)')
+    list_parser.add_argument('--cursor', help='上一页返回的游标')
+    list_parser.add_argument('-n', '--limit', type=int, default=20, help='每页数量')
+    list_parser.add_argument('--json', action='store_true', help='以 JSON 输出')
+
+    show_parser = subparsers.add_parser('show', help='查看单条记录')
+    show_parser.add_argument('record_id', help='记录ID')
+
+    stats_parser = subparsers.add_parser('stats', help='统计信息')
+    stats_parser.add_argument('--by', choices=['day', 'method', 'account'], help='按维度汇总')
+    stats_parser.add_argument('--since', help='开始日期 (YYYY-MM-DD)')
+    stats_parser.add_argument('--until', help='结束日期 (YYYY-MM-DD)')
+    stats_parser.add_argument('--json', action='store_true', help='以 JSON 输出')
+
+    tags_parser = subparsers.add_parser('tags', help='标签统计和本地推荐')
+    tags_parser.add_argument('-n', '--limit', type=int, default=20, help='显示数量')
+    tags_parser.add_argument('--suggest', metavar='TEXT', help='根据主题或大纲推荐标签')
+
+    reconcile_parser = subparsers.add_parser('reconcile', help='崩溃后对账，列出结果未知和失败的发布')
+    reconcile_parser.add_argument('--stale-after', type=float, default=3600,
+                                  help='发送中超过多少秒视为中断（进程已退出的立即视为中断）')
+
+    resolve_parser = subparsers.add_parser('resolve', help='人工确认结果未知的发布')
+    resolve_parser.add_argument('record_id', help='记录ID')
+    resolve_parser.add_argument('state', choices=['published', 'failed'], help='实际结果')
+
+    retry_parser = subparsers.add_parser('retry', help='重新发布失败的记录，沿用已生成的内容和图片')
+    retry_parser.add_argument('record_id', help='记录ID')
+    retry_parser.add_argument('--force', action='store_true',
+                              help='确认未发布后重试结果未知或台账中没有的记录')
+
+    archive_parser = subparsers.add_parser('archive', help='归档旧记录')
+    archive_parser.add_argument('-d', '--days', type=int, default=30, help='归档多少天以前的记录')
+    archive_parser.add_argument('--delete', action='store_true', help='直接删除而不归档')
+
+    export_parser = subparsers.add_parser('export', help='流式导出全部记录')
+    export_parser.add_argument('-f', '--format', choices=['jsonl', 'csv'], default='jsonl', help='导出格式')
+    export_parser.add_argument('-o', '--output', help='输出文件（默认 history_export.<格式>）')
+    export_parser.add_argument('--no-archive', action='store_true', help='不包含已归档记录')
+
+    args = parser.parse_args(argv)
+
+    config = Config('.env')
+    history_mgr = HistoryManager(config.output_dir)
+
+    if args.action == 'list':
+        result = history_mgr.query(status=args.status, publish_method=args.publish_method,
+                                   account=args.account, since=args.since, until=args.until,
+                                   cursor=args.cursor, limit=args.limit)
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+            return
+        _print_records(result['records'])
+        if result['next_cursor']:
+            print(f"\n💡 下一页: --cursor {result['next_cursor']}")
+
+    elif args.action == 'show':
+        record = history_mgr.get_record_by_id(args.record_id)
+        if not record:
+            print(f"❌ 未找到记录: {args.record_id}")
+            return
+        print(json.dumps(record, ensure_ascii=False, indent=2))
+
+    elif args.action == 'tags':
+        tag_index = history_mgr.tag_index()
+        if args.suggest:
+            print(' '.join(tag_index.suggest(args.suggest, args.limit)))
+            return
+        print(f"{'标签':<20}{'使用':>6}{'成功率':>8}")
+        for row in tag_index.top(args.limit):
+            print(f"{row['tag']:<20}{row['count']:>6}{row['success_rate'] * 100:>7.1f}%")
+
+    elif args.action == 'reconcile':
+        for entry in history_mgr.reconcile(args.stale_after):
+            print(f"🔧 {entry['record_id']}: 标记为 {entry['state']}（{entry['error']}）")
+        for state in ('unknown', 'failed'):
+            for entry in history_mgr.ledger.entries(state):
+                print(f"{entry['record_id']}  {entry['at'][:19]}  {state:<8} {entry.get('error') or ''}")
+        print("💡 结果未知的发布请到小红书确认后执行 history resolve <记录ID> published|failed")
+
+    elif args.action == 'resolve':
+        entry = history_mgr.ledger.find(args.record_id)
+        if not entry:
+            print(f"❌ 台账中没有该记录: {args.record_id}")
+            return
+        try:
+            entry = history_mgr.ledger.transition(entry['key'], args.state,
+                                                  error=None if args.state == 'published' else '人工确认未发布')
+        except LedgerError as e:
+            print(f"❌ {e}")
+            return
+        history_mgr.update_status(args.record_id, HISTORY_STATUS[args.state], '人工确认')
+        print(f"✅ {args.record_id}: {entry['state']}")
+
+    elif args.action == 'retry':
+        record = history_mgr.get_record_by_id(args.record_id)
+        if not record:
+            print(f"❌ 未找到记录: {args.record_id}")
+            return
+        entry = history_mgr.ledger.find(args.record_id)
+        state = entry['state'] if entry else None
+        if state == 'published' or record.get('status') == 'success':
+            print(f"❌ 该记录已发布成功，不能重新发布: {args.record_id}")
+            return
+        if state in ('pending', 'sending'):
+            print(f"❌ 该记录正在发布，请先执行 history reconcile: {args.record_id}")
+            return
+        if state is None and record.get('status') not in ('failed', 'unknown'):
+            print(f"❌ 只能重新发布失败的记录（当前状态 {record.get('status')}）: {args.record_id}")
+            return
+        if state != 'failed' and not args.force:
+            reason = '上次发布结果未知' if state == 'unknown' else '台账中没有该记录，无法确认是否已发布'
+            print(f"❌ {reason}，请到小红书确认未发布后加 --force 重试: {args.record_id}")
+            return
+        if state == 'unknown':
+            history_mgr.ledger.transition(entry['key'], 'failed', error='人工确认未发布，重新发布')
+            history_mgr.update_status(args.record_id, HISTORY_STATUS['failed'], '人工确认')
+        from clients import run
+        from logger import Logger
+        from xhs_auto import publish_note
+        data = {key: record[key] for key in ('title', 'content', 'tags', 'images')}
+        try:
+            run(publish_note(config.snapshot(), history_mgr, Logger(config.output_dir), data,
+                             record.get('account', ''), record.get('topic', ''),
+                             record.get('publish_method', 'auto'), record_id=record['id']))
+        except Exception as e:
+            print(f"❌ 重新发布失败: {e}")
+
+    elif args.action == 'archive':
+        history_mgr.clear_old_records(args.days, archive=not args.delete)
+
+    elif args.action == 'export':
+        output = args.output or f"history_export.{args.format}"
+        with open(output, 'w', encoding='utf-8', newline='') as f:
+            count = history_mgr.export(f, args.format, not args.no_archive)
+        print(f"✅ 已导出 {count} 条记录: {output}")
+
+    elif args.action == 'stats':
+        if args.by:
+            result = history_mgr.aggregate(args.by, args.since, args.until)
+        else:
+            result = history_mgr.get_statistics()
+
+        if args.json or not args.by:
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+            return
+        print(f"{args.by:<20}{'总数':>6}{'成功':>6}{'失败':>6}{'待发布':>6}{'成功率':>8}")
+        for row in result:
+            print(f"{row['key'] or '-':<20}{row['total']:>6}{row['success']:>6}"
+                  f"{row['failed']:>6}{row['pending']:>6}{row['success_rate']:>8}")
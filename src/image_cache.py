@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片缓存模块
+按 (图片模型, 尺寸, 模板版本, 规范化后的 prompt) 缓存已生成的图片，
+相同 prompt 再次生成时直接复用资源存储中的文件，跳过图片生成和下载
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+
+from fileutil import FileLock, atomic_open
+
+
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """规范化 prompt：全角转半角、合并空白、英文小写，只有格式差异的 prompt 命中同一条缓存"""
+    return _SPACES.sub(' ', unicodedata.normalize('NFKC', prompt or '')).strip().lower()
+
+
+def cache_key(model: str, size: str, prompt: str, template: str = '') -> str:
+    """缓存键，template 为图片模板的 名称@版本，模板修改后旧缓存自然失效"""
+    text = '\n'.join([model, size, template, normalize_prompt(prompt)])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ImageCache:
+    """图片缓存索引
+
+    索引文件 image_cache.json 保存 缓存键 -> {path, bytes, model, size, template, prompt, image_type,
+    created_at, last_used, hits, published}，图片本身存放在资源存储中（按内容哈希去重）。
+    已随笔记发布的图片默认不再复用，避免多篇笔记使用同一张图；reuse_types 中的图片类型（如 cover）例外
+    """
+
+    def __init__(self, output_dir: str, reuse_types: Iterable[str] = ()):
+        self.cache_file = os.path.join(output_dir, 'image_cache.json')
+        self.lock_file = f"{self.cache_file}.lock"
+        self.reuse_types = set(reuse_types)
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            print(f"⚠️  图片缓存索引无法解析，已忽略: {e}")
+            return {}
+
+    def _save(self, entries: Dict[str, Dict]):
+        try:
+            with atomic_open(self.cache_file) as f:
+                json.dump(entries, f, ensure_ascii=False)
+        except Exception as e:
+            print(f"⚠️  保存图片缓存索引失败: {e}")
+
+    def get(self, key: str, image_type: str = 'content') -> Optional[Dict]:
+        """查找可复用的图片，命中时更新使用时间和次数"""
+        with FileLock(self.lock_file, exclusive=True):
+            entries = self._load()
+            entry = entries.get(key)
+            if entry is None:
+                return None
+            if not os.path.exists(entry['path']):
+                # 图片已被清理
+                del entries[key]
+                self._save(entries)
+                return None
+            if entry.get('published') and image_type not in self.reuse_types:
+                return None
+            entry['last_used'] = time.time()
+            entry['hits'] = entry.get('hits', 0) + 1
+            self._save(entries)
+            return entry
+
+    def put(self, key: str, path: str, model: str, size: str, prompt: str,
+            template: str = '', image_type: str = 'content') -> Dict:
+        """登记新生成的图片"""
+        now = time.time()
+        entry = {
+            'path': path,
+            'bytes': os.path.getsize(path),
+            'model': model,
+            'size': size,
+            'template': template,
+            'prompt': prompt,
+            'image_type': image_type,
+            'created_at': now,
+            'last_used': now,
+            'hits': 0,
+            'published': False
+        }
+        with FileLock(self.lock_file, exclusive=True):
+            entries = self._load()
+            entries[key] = entry
+            self._save(entries)
+        return entry
+
+    def mark_published(self, paths: Iterable[str]):
+        """笔记发布成功后标记其图片，之后不再复用到其他笔记"""
+        targets = {os.path.normcase(os.path.abspath(p)) for p in paths}
+        if not targets:
+            return
+        with FileLock(self.lock_file, exclusive=True):
+            entries = self._load()
+            changed = False
+            for entry in entries.values():
+                if not entry.get('published') and os.path.normcase(os.path.abspath(entry['path'])) in targets:
+                    entry['published'] = True
+                    changed = True
+            if changed:
+                self._save(entries)
+
+    def evict(self, max_age_days: Optional[float] = None, max_bytes: Optional[int] = None,
+              dry_run: bool = False) -> Dict:
+        """淘汰缓存条目
+
+        - 超过 max_age_days 未使用的条目直接淘汰
+        - 缓存图片总大小超过 max_bytes 时，从最久未使用的条目开始淘汰
+        只删除索引条目，图片文件由资源清理（gc）按历史记录引用决定是否删除；
+        返回值中的 kept 为淘汰后仍在缓存中的图片路径
+        """
+        now = time.time()
+        with FileLock(self.lock_file, exclusive=True):
+            entries = self._load()
+            count = len(entries)
+            total = sum(entry['bytes'] for entry in entries.values())
+            remaining = total
+            evicted: List[str] = []
+            for key, entry in sorted(entries.items(), key=lambda item: item[1]['last_used']):
+                expired = max_age_days is not None and now - entry['last_used'] > max_age_days * 86400
+                over_budget = max_bytes is not None and remaining > max_bytes
+                if expired or over_budget or not os.path.exists(entry['path']):
+                    evicted.append(key)
+                    remaining -= entry['bytes']
+            if evicted and not dry_run:
+                for key in evicted:
+                    del entries[key]
+                self._save(entries)
+            dropped = set(evicted)
+
+        return {
+            'entries': count,
+            'evicted': len(evicted),
+            'total_bytes': total,
+            'remaining_bytes': remaining,
+            'kept': {entry['path'] for key, entry in entries.items() if key not in dropped}
+        }
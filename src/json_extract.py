@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON 提取模块
+线性扫描模型输出，按括号平衡切出候选 JSON 对象，并修复常见格式问题
+"""
+
+import json
+from typing import Dict, Iterable, List, Optional
+
+
+# 模型常把全角引号、冒号、逗号当作 JSON 分隔符输出
+FULLWIDTH_QUOTES = '“”＂'
+FULLWIDTH_PUNCT = {'：': ':', '，': ','}
+CLOSERS = {'{': '}', '[': ']'}
+
+
+class JSONExtractor:
+    """增量式 JSON 提取器
+
+    通过 feed() 逐块喂入文本（可直接用于流式输出），每个字符只扫描一次，
+    返回其中已闭合的顶层对象文本；close() 返回被截断的末尾对象（自动补全括号）
+    """
+
+    def __init__(self):
+        self._buffer: List[str] = []
+        self._stack: List[str] = []
+        self._quote: Optional[str] = None  # 当前所在字符串的起始引号
+        self._escape = False
+
+    def feed(self, chunk: str) -> List[str]:
+        """喂入一段文本，返回本段内闭合的候选对象"""
+        candidates = []
+        for ch in chunk:
+            if not self._stack:
+                # 顶层只关心对象的起点，其余文字直接丢弃
+                if ch == '{':
+                    self._stack.append(ch)
+                    self._buffer = [ch]
+                continue
+
+            self._buffer.append(ch)
+
+            if self._quote:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"' and self._quote == '"':
+                    self._quote = None
+                elif ch in FULLWIDTH_QUOTES and self._quote != '"':
+                    self._quote = None
+                continue
+
+            if ch == '"' or ch in FULLWIDTH_QUOTES:
+                self._quote = ch
+            elif ch in CLOSERS:
+                self._stack.append(ch)
+            elif ch in '}]':
+                # 括号不匹配时按已打开的括号闭合，避免整段作废
+                self._stack.pop()
+                if not self._stack:
+                    candidates.append(''.join(self._buffer))
+                    self._buffer = []
+        return candidates
+
+    def close(self) -> Optional[str]:
+        """结束输入，返回补全后的未闭合对象"""
+        if not self._stack:
+            return None
+        tail = ''.join(self._buffer)
+        if self._quote:
+            tail += '"' if self._quote == '"' else '”'
+        tail = tail.rstrip().rstrip(',')
+        tail += ''.join(CLOSERS[opener] for opener in reversed(self._stack))
+        self._buffer, self._stack, self._quote, self._escape = [], [], None, False
+        return tail
+
+
+def repair_json(text: str) -> str:
+    """修复常见的 LLM JSON 格式问题
+
+    - 作为分隔符使用的全角引号、冒号、逗号转为半角（字符串内容中的保持不变）
+    - 删除对象和数组末尾多余的逗号
+    """
+    out: List[str] = []
+    quote: Optional[str] = None
+    escape = False
+
+    for ch in text:
+        if quote:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif quote == '"' and ch == '"':
+                quote = None
+            elif quote != '"' and ch in FULLWIDTH_QUOTES:
+                quote = None
+                ch = '"'
+            elif quote != '"' and ch == '"':
+                # 全角引号包裹的字符串中出现的半角引号需要转义
+                ch = '\\"'
+            out.append(ch)
+            continue
+
+        if ch == '"' or ch in FULLWIDTH_QUOTES:
+            quote = ch
+            ch = '"'
+        elif ch in FULLWIDTH_PUNCT:
+            ch = FULLWIDTH_PUNCT[ch]
+        elif ch in '}]':
+            # 回退到上一个非空白字符，去掉末尾逗号
+            i = len(out) - 1
+            while i >= 0 and out[i].isspace():
+                i -= 1
+            if i >= 0 and out[i] == ',':
+                del out[i]
+        out.append(ch)
+
+    return ''.join(out)
+
+
+def _loads(text: str) -> Optional[Dict]:
+    """解析为对象，失败返回 None"""
+    try:
+        data = json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def iter_json_objects(chunks: Iterable[str]) -> Iterable[Dict]:
+    """从文本块序列中依次产出可解析的 JSON 对象（含本地修复）"""
+    extractor = JSONExtractor()
+    for chunk in chunks:
+        for candidate in extractor.feed(chunk):
+            data = _loads(candidate)
+            if data is None:
+                data = _loads(repair_json(candidate))
+            if data is not None:
+                yield data
+
+    tail = extractor.close()
+    if tail:
+        data = _loads(repair_json(tail))
+        if data is not None:
+            yield data
+
+
+def extract_json(content, required_keys: Iterable[str] = ()) -> Dict:
+    """提取第一个包含必需字段的 JSON 对象
+
+    content 可以是完整字符串，也可以是流式返回的文本块序列；
+    本地修复仍无法解析时抛出 ValueError
+    """
+    chunks = [content] if isinstance(content, str) else content
+    required = set(required_keys)
+
+    for data in iter_json_objects(chunks):
+        if required.issubset(data):
+            return data
+    raise ValueError("未能从模型输出中解析出有效的 JSON 对象")
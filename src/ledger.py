@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+发布台账模块
+每篇笔记按内容生成幂等键，发布状态的每次变化追加写入台账文件并落盘；
+重试时沿用同一个键，进程崩溃后按最后状态对账，避免重复发布
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fileutil import FileLock
+
+
+# 允许的状态转换：pending（已登记）→ sending（请求已发出）→ published / failed；
+# 发送中断或超时无法确认结果时为 unknown，需要人工确认后再改为 published 或 failed；
+# 失败的重试重新登记为 pending
+TRANSITIONS = {
+    None: {'pending'},
+    'pending': {'sending', 'failed'},
+    'sending': {'published', 'failed', 'unknown'},
+    'failed': {'pending'},
+    'unknown': {'published', 'failed'},
+    'published': set()
+}
+
+# 台账状态对应的历史记录状态
+HISTORY_STATUS = {
+    'pending': 'pending',
+    'sending': 'pending',
+    'published': 'success',
+    'failed': 'failed',
+    'unknown': 'unknown'
+}
+
+
+class LedgerError(RuntimeError):
+    """非法的状态转换，或同一篇笔记正在 / 可能已经发布"""
+
+
+class OutcomeUnknown(RuntimeError):
+    """请求可能已被服务端接受但没有收到确认（如超时），不能直接重试"""
+
+
+def idempotency_key(data: Dict, account: str = '') -> str:
+    """根据账号、标题、正文、标签和图片文件名生成幂等键，同一篇笔记多次发布得到同一个键"""
+    payload = json.dumps({
+        'account': account,
+        'title': data.get('title', ''),
+        'content': data.get('content', ''),
+        'tags': data.get('tags', []),
+        'images': [os.path.basename(path) for path in data.get('images', [])]
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def _process_alive(pid: int) -> bool:
+    """进程是否仍在运行；Windows 上 os.kill 会结束进程，无法探测，按存活处理"""
+    if os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class PublishLedger:
+    """发布台账
+
+    台账文件每行一次状态变化：{"key", "state", "at", "pid", "record_id", ...}，
+    只追加不改写；读取时按行重放得到每个键的最新状态，其他进程追加的行增量读取
+    """
+
+    def __init__(self, ledger_file: str):
+        self.ledger_file = ledger_file
+        self.lock_file = f"{ledger_file}.lock"
+        self._entries: Dict[str, Dict] = {}
+        self._offset = 0
+
+    def _refresh(self):
+        """读取上次之后新追加的行"""
+        try:
+            with open(self.ledger_file, 'rb') as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # 另一个进程写到一半的行，下次再读
+                        break
+                    self._offset += len(line)
+                    line = line.strip()
+                    if not line:
+                        continue
+                    change = json.loads(line.decode('utf-8'))
+                    self._entries[change['key']] = {**self._entries.get(change['key'], {}), **change}
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str) -> Optional[Dict]:
+        """幂等键的最新状态"""
+        with FileLock(self.lock_file, exclusive=False):
+            self._refresh()
+        return self._entries.get(key)
+
+    def find(self, record_id: str) -> Optional[Dict]:
+        """按历史记录ID查找"""
+        for entry in self.entries():
+            if entry.get('record_id') == record_id:
+                return entry
+        return None
+
+    def entries(self, state: Optional[str] = None) -> List[Dict]:
+        """全部条目，可按状态过滤"""
+        with FileLock(self.lock_file, exclusive=False):
+            self._refresh()
+        return [e for e in self._entries.values() if state is None or e['state'] == state]
+
+    def transition(self, key: str, state: str, expect: Optional[Dict] = None, **fields) -> Dict:
+        """记录一次状态变化，不允许的转换抛出 LedgerError
+
+        expect 为当前条目应有的字段值（如 state、pid、owner），与实际不符说明已被其他进程修改，同样抛出 LedgerError
+        """
+        with FileLock(self.lock_file, exclusive=True):
+            self._refresh()
+            entry = self._entries.get(key, {})
+            current = entry.get('state')
+            if state not in TRANSITIONS[current]:
+                raise LedgerError(f"发布状态不能从 {current or '无'} 变为 {state}: {key}")
+            if expect and any(entry.get(name) != value for name, value in expect.items()):
+                raise LedgerError(f"发布状态已被其他进程修改（当前 {current or '无'}）: {key}")
+
+            change = {'key': key, 'state': state, 'at': datetime.now().isoformat(), 'pid': os.getpid(),
+                      'error': None, **fields}
+            line = (json.dumps(change, ensure_ascii=False) + '\n').encode('utf-8')
+            os.makedirs(os.path.dirname(self.ledger_file) or '.', exist_ok=True)
+            with open(self.ledger_file, 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._refresh()
+            return self._entries[key]
+
+    @staticmethod
+    def abandoned(entry: Dict) -> bool:
+        """登记该条目的进程已经退出"""
+        return not _process_alive(entry.get('pid', 0))
+
+    def stale(self, stale_after: float) -> List[Dict]:
+        """进程已退出或超过 stale_after 秒仍未结束的 pending / sending 条目"""
+        now = datetime.now()
+        result = []
+        for entry in self.entries():
+            if entry['state'] not in ('pending', 'sending'):
+                continue
+            age = (now - datetime.fromisoformat(entry['at'])).total_seconds()
+            if entry.get('pid') == os.getpid() and age <= stale_after:
+                continue
+            if not _process_alive(entry.get('pid', 0)) or age > stale_after:
+                result.append(entry)
+        return result
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行指标模块
+记录每次模型调用的耗时与 token 用量，以及超时和错过截止时间的调用
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+
+class Metrics:
+    """运行指标收集器"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.calls: List[Dict] = []
+        self.timeouts: List[Dict] = []
+        self.connections: Dict[str, Dict] = {}
+        self.failovers: List[Dict] = []
+        self.speculation: Optional[Dict] = None
+        self.image_cache = {'hits': 0, 'misses': 0}
+        self.page_loads: List[Dict] = []
+        self.stage_times: Dict[str, float] = {}
+        self.limits: Dict[str, Dict] = {}
+
+    def record_call(self, stage: str, model: str, latency: float,
+                    prompt_tokens: int = 0, completion_tokens: int = 0,
+                    cached_tokens: int = 0, max_tokens: Optional[int] = None,
+                    template: Optional[str] = None, output_length: int = 0) -> Dict:
+        """记录一次模型调用，template 为 模板名@版本"""
+        call = {
+            'stage': stage,
+            'model': model,
+            'latency': latency,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cached_tokens': cached_tokens,
+            'max_tokens': max_tokens,
+            'template': template,
+            'output_length': output_length
+        }
+        self.calls.append(call)
+        return call
+
+    @classmethod
+    def merge(cls, items: List['Metrics']) -> 'Metrics':
+        """合并多篇笔记的指标，用于批量汇总"""
+        merged = cls()
+        for item in items:
+            merged.started_at = min(merged.started_at, item.started_at)
+            merged.calls.extend(item.calls)
+            merged.timeouts.extend(item.timeouts)
+            merged.failovers.extend(item.failovers)
+            merged.page_loads.extend(item.page_loads)
+            merged.connections = item.connections or merged.connections
+            merged.limits = item.limits or merged.limits
+            for key, value in item.image_cache.items():
+                merged.image_cache[key] += value
+        return merged
+
+    def record_timeout(self, stage: str, reason: str, budget: float) -> Dict:
+        """记录一次超时，reason 为 stage（阶段超时）或 deadline（截止时间已到）"""
+        timeout = {'stage': stage, 'reason': reason, 'budget': budget}
+        self.timeouts.append(timeout)
+        return timeout
+
+    def record_failover(self, stage: str, model: str, error: str) -> Dict:
+        """记录一次模型调用失败后的切换"""
+        failover = {'stage': stage, 'model': model, 'error': error}
+        self.failovers.append(failover)
+        return failover
+
+    def record_image_cache(self, hit: bool):
+        """记录一次图片缓存查找"""
+        self.image_cache['hits' if hit else 'misses'] += 1
+
+    @contextmanager
+    def timed(self, stage: str):
+        """记录一个流水线阶段的耗时，只记录成功完成的阶段，用于估计后续笔记的耗时"""
+        start = time.time()
+        yield
+        self.stage_times[stage] = time.time() - start
+
+    def record_page_load(self, seconds: float, lean: bool, **stats) -> Dict:
+        """记录一次发布页打开到可用的耗时，stats 为精简加载的拦截和缓存计数"""
+        load = {'seconds': seconds, 'lean': lean, **stats}
+        self.page_loads.append(load)
+        return load
+
+    def record_speculation(self, stats: Dict):
+        """记录推测生成的候选统计（启动、完成、未通过、取消）"""
+        self.speculation = stats
+
+    def record_connections(self, stats: Dict[str, Dict]):
+        """记录共享连接池的复用计数（进程级累计值）"""
+        self.connections = stats
+
+    def record_limits(self, stats: Dict[str, Dict]):
+        """记录各调用类型的自适应并发上限（进程级当前值）"""
+        self.limits = stats
+
+    def summary(self) -> Dict:
+        """按阶段汇总调用指标"""
+        stages = {}
+        for call in self.calls:
+            stage = stages.setdefault(call['stage'], {
+                'calls': 0,
+                'latency': 0.0,
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+                'cached_tokens': 0
+            })
+            stage['calls'] += 1
+            stage['latency'] += call['latency']
+            stage['prompt_tokens'] += call['prompt_tokens']
+            stage['completion_tokens'] += call['completion_tokens']
+            stage['cached_tokens'] += call['cached_tokens']
+
+        models = {}
+        for call in self.calls:
+            model = models.setdefault(call['model'], {
+                'calls': 0,
+                'latency': 0.0,
+                'completion_tokens': 0,
+                'failures': 0
+            })
+            model['calls'] += 1
+            model['latency'] += call['latency']
+            model['completion_tokens'] += call['completion_tokens']
+        for failover in self.failovers:
+            models.setdefault(failover['model'], {
+                'calls': 0, 'latency': 0.0, 'completion_tokens': 0, 'failures': 0
+            })['failures'] += 1
+        for model in models.values():
+            model['tokens_per_second'] = model['completion_tokens'] / model['latency'] if model['latency'] else 0.0
+
+        templates = {}
+        for call in self.calls:
+            if not call.get('template'):
+                continue
+            template = templates.setdefault(call['template'], {
+                'calls': 0,
+                'latency': 0.0,
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+                'output_length': 0
+            })
+            template['calls'] += 1
+            template['latency'] += call['latency']
+            template['prompt_tokens'] += call['prompt_tokens']
+            template['completion_tokens'] += call['completion_tokens']
+            template['output_length'] += call.get('output_length', 0)
+
+        return {
+            'calls': len(self.calls),
+            'latency': sum(c['latency'] for c in self.calls),
+            'prompt_tokens': sum(c['prompt_tokens'] for c in self.calls),
+            'completion_tokens': sum(c['completion_tokens'] for c in self.calls),
+            'cached_tokens': sum(c['cached_tokens'] for c in self.calls),
+            'stages': stages,
+            'models': models,
+            'templates': templates,
+            'failovers': len(self.failovers),
+            'speculation': self.speculation,
+            'image_cache': dict(self.image_cache),
+            'page_loads': list(self.page_loads),
+            'stage_times': dict(self.stage_times),
+            'timeouts': len(self.timeouts),
+            'deadline_misses': sum(1 for t in self.timeouts if t['reason'] == 'deadline'),
+            'connections': self.connections,
+            'limits': self.limits
+        }
+
+    def report(self) -> str:
+        """生成可读的指标报告"""
+        summary = self.summary()
+        lines = [
+            f"📊 模型调用 {summary['calls']} 次，累计耗时 {summary['latency']:.1f}s，"
+            f"prompt {summary['prompt_tokens']} tokens（缓存命中 {summary['cached_tokens']}），"
+            f"completion {summary['completion_tokens']} tokens"
+        ]
+        for name, stage in summary['stages'].items():
+            lines.append(
+                f"   - {name}: {stage['calls']} 次, {stage['latency']:.1f}s, "
+                f"prompt {stage['prompt_tokens']} / completion {stage['completion_tokens']}"
+            )
+        if len(summary['models']) > 1 or self.failovers:
+            for name, model in summary['models'].items():
+                lines.append(
+                    f"🤖 {name}: {model['calls']} 次成功 / {model['failures']} 次失败, "
+                    f"{model['latency']:.1f}s, {model['tokens_per_second']:.0f} tokens/s"
+                )
+        if self.speculation:
+            spec = self.speculation
+            lines.append(f"🎲 候选文案 {spec['launched']} 个：完成 {spec['completed']}，未通过校验 {spec['rejected']}，"
+                         f"失败 {spec['failed']}，提前取消 {spec['cancelled']}")
+        if self.image_cache['hits']:
+            lines.append(f"♻️  图片缓存命中 {self.image_cache['hits']} 张，"
+                         f"新生成 {self.image_cache['misses']} 张")
+        for load in self.page_loads:
+            lines.append(f"⏱️  发布页就绪 {load['seconds']:.1f}s（{'精简加载' if load['lean'] else '完整加载'}）")
+        if self.timeouts:
+            details = ', '.join(
+                f"{t['stage']}（{'截止时间' if t['reason'] == 'deadline' else '阶段超时'} {t['budget']:.1f}s）"
+                for t in self.timeouts
+            )
+            lines.append(f"⏰ 超时 {summary['timeouts']} 次，其中错过截止时间 "
+                         f"{summary['deadline_misses']} 次: {details}")
+        for name, pool in self.connections.items():
+            rate = pool['reused'] / pool['requests'] * 100 if pool['requests'] else 0.0
+            lines.append(f"🔌 连接池 {name}: 请求 {pool['requests']} 次，新建连接 {pool['connections']} 个"
+                         f"（TLS 握手 {pool['tls_handshakes']}），复用率 {rate:.0f}%")
+        for kind, limit in self.limits.items():
+            lines.append(f"🎚️  {kind} 并发上限 {limit['limit']}（峰值 {limit['peak']}，"
+                         f"放宽 {limit['increases']} 次，收紧 {limit['decreases']} 次）")
+        return '\n'.join(lines)
+
+    def template_report(self) -> str:
+        """按模板版本对比平均耗时、token 用量和输出长度"""
+        templates = self.summary()['templates']
+        lines = [f"📐 模板版本对比（平均每次调用）",
+                 f"   {'模板@版本':<32}{'调用':>6}{'耗时(s)':>9}{'prompt':>9}{'completion':>12}{'输出字数':>9}"]
+        for name in sorted(templates):
+            t = templates[name]
+            n = t['calls']
+            lines.append(f"   {name:<32}{n:>6}{t['latency'] / n:>9.1f}{t['prompt_tokens'] / n:>9.0f}"
+                         f"{t['completion_tokens'] / n:>12.0f}{t['output_length'] / n:>9.0f}")
+        return '\n'.join(lines)
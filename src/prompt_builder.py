@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prompt 构建模块
+固定指令放在 system 消息中作为静态前缀，便于服务端前缀缓存复用；
+动态输入只放在 user 消息中。模板文本位于 prompts/ 目录
+"""
+
+from typing import Dict, List, Mapping, Optional, Sequence
+
+from template_registry import PromptMessages, PromptText, TemplateRegistry, get_templates
+
+
+# 合并生成结果的字段约束：字段名 -> (类型, 元素类型, 最少元素数)
+FUSED_SCHEMA = {
+    'final_title': (str, None, 1),
+    'content_outline': (list, str, 1),
+    'content': (str, None, 1),
+    'tags': (list, str, 1),
+    'cover_image': (str, None, 1),
+    'content_images': (list, str, 1)
+}
+
+
+def validate_response(data: Dict, schema: Dict) -> List[str]:
+    """按字段约束校验模型返回的 JSON，返回错误列表"""
+    if not isinstance(data, dict):
+        return ['返回内容不是 JSON 对象']
+
+    errors = []
+    for field, (field_type, item_type, min_size) in schema.items():
+        value = data.get(field)
+        if not isinstance(value, field_type):
+            errors.append(f"字段 {field} 缺失或类型错误")
+            continue
+        if item_type and not all(isinstance(item, item_type) and item.strip() for item in value):
+            errors.append(f"字段 {field} 包含非法元素")
+        if len(value if item_type else value.strip()) < min_size:
+            errors.append(f"字段 {field} 为空")
+    return errors
+
+
+def estimate_max_tokens(word_count: int, ratio: float = 1.5, overhead: int = 300,
+                        minimum: int = 512, maximum: int = 4096) -> int:
+    """根据目标字数估算 max_tokens
+
+    中文正文大约 1 字对应 1~1.5 个 token，再预留标题、标签等格式开销
+    """
+    try:
+        word_count = int(word_count)
+    except (TypeError, ValueError):
+        word_count = 0
+    budget = int(word_count * ratio) + overhead
+    return max(minimum, min(budget, maximum))
+
+
+class PromptBuilder:
+    """Prompt 构建器，返回的消息列表带有模板版本"""
+
+    def __init__(self, variants: Optional[Mapping[str, Sequence[str]]] = None,
+                 registry: Optional[TemplateRegistry] = None):
+        self.templates = registry or get_templates()
+        self.variants = variants
+
+    def _render(self, name: str, **values) -> PromptMessages:
+        return self.templates.render(name, self.variants, **values)
+
+    def structure(self, topic: str, word_count: int, context: str = '', with_tags: bool = True) -> PromptMessages:
+        """内容结构 Prompt，with_tags=False 时不要求模型生成标签（由本地标签索引推荐）"""
+        name = 'structure' if with_tags else 'structure_notags'
+        return self._render(name, topic=topic, word_count=word_count, context=context)
+
+    def content(self, structure: Dict) -> PromptMessages:
+        """完整内容 Prompt"""
+        return self._render(
+            'content',
+            title=structure['final_title'],
+            subject=structure.get('subject', ''),
+            outline=structure['content_outline'],
+            context=structure.get('context', ''),
+            word_count=structure.get('word_count', 600),
+            tags=structure['tags']
+        )
+
+    def humanize(self, content: str, title: str) -> PromptMessages:
+        """人性化优化 Prompt"""
+        return self._render('humanize', title=title, content=content)
+
+    def fused(self, topic: str, word_count: int, context: str = '', with_tags: bool = True) -> PromptMessages:
+        """单次生成全部内容的 Prompt"""
+        name = 'fused' if with_tags else 'fused_notags'
+        return self._render(name, topic=topic, word_count=word_count, context=context)
+
+    def json_repair(self, text: str, required_keys: List[str] = ()) -> PromptMessages:
+        """JSON 修复 Prompt"""
+        required = f"必须包含字段：{', '.join(required_keys)}\n\n" if required_keys else ''
+        return self._render('json_repair', required=required, text=text)
+
+    def image_prompts(self, content: Dict) -> PromptMessages:
+        """图片提示词 Prompt"""
+        return self._render('image_prompts', title=content['title'], summary=content['content'][:200])
+
+    def image(self, prompt: str) -> PromptText:
+        """图片生成 Prompt：在模型给出的描述后追加固定的画面要求"""
+        return self.templates.get('image', self.variants).render_text(prompt=prompt)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型路由模块
+每类调用配置一组候选模型，按观测到的延迟、错误率和当前负载排序，失败时自动切换
+"""
+
+import time
+from typing import Dict, List, Mapping, Optional, Sequence
+
+from config import ConfigSnapshot
+
+
+# 连续失败多少次后暂停使用该模型，以及暂停时长（秒）
+CIRCUIT_FAILURES = 3
+CIRCUIT_COOLDOWN = 30.0
+
+
+class ModelStats:
+    """单个模型的滑动统计"""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.completion_tokens = 0
+        self.busy_time = 0.0
+        self.consecutive_errors = 0
+        self.open_until = 0.0
+
+    def record(self, latency: float, ok: bool, completion_tokens: int = 0):
+        """记录一次调用结果，延迟只统计成功调用"""
+        self.calls += 1
+        self.busy_time += latency
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.completion_tokens += completion_tokens
+            self.consecutive_errors = 0
+            self.latency = latency if self.latency is None else \
+                self.latency + self.alpha * (latency - self.latency)
+        else:
+            self.errors += 1
+            self.consecutive_errors += 1
+            if self.consecutive_errors >= CIRCUIT_FAILURES:
+                self.open_until = time.monotonic() + CIRCUIT_COOLDOWN
+
+    def available(self) -> bool:
+        """是否处于暂停期之外"""
+        return time.monotonic() >= self.open_until
+
+    def score(self) -> float:
+        """预期耗时，越小越优先；没有数据的模型先试用"""
+        if self.latency is None:
+            return 0.0
+        return self.latency * (1 + self.in_flight) / (1 - min(self.error_rate, 0.95))
+
+    def to_dict(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'in_flight': self.in_flight,
+            'ewma_latency': self.latency,
+            'error_rate': self.error_rate,
+            'tokens_per_second': self.completion_tokens / self.busy_time if self.busy_time else 0.0
+        }
+
+
+class ModelRouter:
+    """按调用类型选择模型
+
+    routes 为 阶段 -> 候选模型列表，未配置的阶段使用 default；
+    修复类调用（如 structure_repair）沿用对应阶段的配置
+    """
+
+    def __init__(self, routes: Mapping[str, Sequence[str]], default: Sequence[str], alpha: float = 0.3):
+        self.routes = routes
+        self.default = default
+        self.alpha = alpha
+        self.models: Dict[str, ModelStats] = {}
+
+    def _stats(self, model: str) -> ModelStats:
+        stats = self.models.get(model)
+        if stats is None:
+            stats = self.models[model] = ModelStats(self.alpha)
+        return stats
+
+    def candidates(self, stage: str, routes: Optional[Mapping[str, Sequence[str]]] = None,
+                   default: Optional[Sequence[str]] = None) -> List[str]:
+        """按优先级排列的候选模型，暂停中的模型排在最后作为兜底
+
+        routes/default 为调用方所用配置快照中的路由，未传入时使用创建时的配置
+        """
+        base = stage[:-len('_repair')] if stage.endswith('_repair') else stage
+        routes = self.routes if routes is None else routes
+        models = routes.get(base) or (self.default if default is None else default)
+        ranked = sorted(models, key=lambda m: (not self._stats(m).available(), self._stats(m).score()))
+        return ranked
+
+    def begin(self, model: str):
+        """调用开始，计入负载"""
+        self._stats(model).in_flight += 1
+
+    def end(self, model: str, latency: float, ok: bool, completion_tokens: int = 0):
+        """调用结束，更新统计"""
+        stats = self._stats(model)
+        stats.in_flight -= 1
+        stats.record(latency, ok, completion_tokens)
+
+    def abandon(self, model: str):
+        """调用被取消（如推测生成的落选候选），只释放负载不计入统计"""
+        self._stats(model).in_flight -= 1
+
+    def stats(self) -> Dict[str, Dict]:
+        """各模型的统计"""
+        return {model: stats.to_dict() for model, stats in self.models.items()}
+
+
+_router: Optional[ModelRouter] = None
+
+
+def get_router(config: ConfigSnapshot) -> ModelRouter:
+    """获取进程级模型路由器，首次调用时创建"""
+    global _router
+    if _router is None:
+        _router = ModelRouter(config.model_routes, config.models)
+    return _router
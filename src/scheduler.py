@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务调度模块
+批量笔记按优先通道和最早截止时间（EDF）排序执行：
+有定时发布时间的笔记按 定时时间 - 预计生成耗时 得到最晚开始时间，越早越先执行，
+预计耗时来自历史运行中各阶段的实际耗时
+"""
+
+import os
+import json
+import time
+import asyncio
+import contextvars
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from concurrency import priority_scope
+from fileutil import FileLock, atomic_open
+
+
+# 优先通道，靠前的先执行；同一通道内按最晚开始时间，再按提交顺序
+LANES = ('urgent', 'normal', 'evergreen')
+# 距离最晚开始时间不足该秒数的笔记提升到 urgent 通道
+URGENT_SLACK = 300
+# 没有历史数据时各阶段的预计耗时（秒）
+DEFAULT_STAGE_SECONDS = {'generate_text': 60.0, 'generate_images': 90.0}
+# 阶段耗时的指数滑动平均系数
+STAGE_ALPHA = 0.3
+# 选题文件中定时发布时间的格式
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M')
+
+
+class StageEstimator:
+    """按历史运行估计各阶段耗时
+
+    stage_durations.json 保存 阶段 -> {ewma, count}，每篇笔记完成后用实际耗时更新
+    """
+
+    def __init__(self, output_dir: str):
+        self.stats_file = os.path.join(output_dir, 'stage_durations.json')
+        self.lock_file = f"{self.stats_file}.lock"
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.stats_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            print(f"⚠️  阶段耗时统计无法解析，已忽略: {e}")
+            return {}
+
+    def estimates(self) -> Dict[str, float]:
+        """各阶段的预计耗时，没有历史数据的阶段使用默认值"""
+        with FileLock(self.lock_file, exclusive=False):
+            stats = self._load()
+        result = dict(DEFAULT_STAGE_SECONDS)
+        for stage, item in stats.items():
+            result[stage] = item['ewma']
+        return result
+
+    def estimate(self, stages=tuple(DEFAULT_STAGE_SECONDS)) -> float:
+        """几个阶段的预计总耗时"""
+        estimates = self.estimates()
+        return sum(estimates.get(stage, 0.0) for stage in stages)
+
+    def update(self, durations: Dict[str, float]):
+        """计入一篇笔记各阶段的实际耗时"""
+        if not durations:
+            return
+        try:
+            with FileLock(self.lock_file, exclusive=True):
+                stats = self._load()
+                for stage, seconds in durations.items():
+                    item = stats.get(stage)
+                    if item is None:
+                        stats[stage] = {'ewma': seconds, 'count': 1}
+                    else:
+                        item['ewma'] += STAGE_ALPHA * (seconds - item['ewma'])
+                        item['count'] += 1
+                with atomic_open(self.stats_file) as f:
+                    json.dump(stats, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"⚠️  保存阶段耗时统计失败: {e}")
+
+
+def parse_time(value: str) -> datetime:
+    """解析定时发布时间"""
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"无法识别的时间: {value}（格式 YYYY-MM-DD HH:MM[:SS]）")
+
+
+class Job:
+    """一篇待处理的笔记"""
+
+    def __init__(self, topic: str, lane: str = 'normal', scheduled_time: Optional[datetime] = None):
+        if lane not in LANES:
+            raise ValueError(f"未知的优先通道: {lane}（可选 {', '.join(LANES)}）")
+        self.topic = topic
+        self.lane = lane
+        self.scheduled_time = scheduled_time
+        self.seq = 0
+        self.estimate = 0.0
+        self.state = 'queued'
+        self.submitted_at = 0.0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # 内容和图片生成完成、进入发布的时间
+        self.ready_at: Optional[float] = None
+        self.promoted = False
+        self.result: Any = None
+        self.detached = False
+        self.scheduler: Optional['JobScheduler'] = None
+
+    @classmethod
+    def parse(cls, line: str) -> 'Job':
+        """解析选题文件的一行：主题 | 定时发布时间 | 优先通道，后两项可省略"""
+        parts = [part.strip() for part in line.split('|')]
+        topic = parts[0]
+        scheduled = parse_time(parts[1]) if len(parts) > 1 and parts[1] else None
+        lane = parts[2] if len(parts) > 2 and parts[2] else 'normal'
+        return cls(topic, lane, scheduled)
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """截止时间（时间戳）：定时发布前必须完成生成"""
+        return self.scheduled_time.timestamp() if self.scheduled_time else None
+
+    def latest_start(self) -> float:
+        """最晚开始时间，没有定时的笔记为无穷大"""
+        return self.deadline - self.estimate if self.deadline is not None else float('inf')
+
+    def priority(self, now: float) -> Tuple[float, float]:
+        """(通道序号, 最晚开始时间)，临近最晚开始时间的笔记提升到 urgent 通道"""
+        latest = self.latest_start()
+        lane = LANES.index(self.lane)
+        if latest - now < URGENT_SLACK:
+            lane = 0
+        return lane, latest
+
+    def deadline_met(self) -> Optional[bool]:
+        """是否在定时发布时间前完成生成；没有定时或被跳过的笔记为 None"""
+        if self.deadline is None or self.state == 'skipped':
+            return None
+        return self.state == 'done' and self.ready_at is not None and self.ready_at <= self.deadline
+
+    def to_dict(self) -> Dict:
+        return {
+            'topic': self.topic,
+            'lane': self.lane,
+            'promoted': self.promoted,
+            'scheduled_time': self.scheduled_time.strftime('%Y-%m-%d %H:%M:%S') if self.scheduled_time else None,
+            'estimate': self.estimate,
+            'state': self.state,
+            'queued_for': (self.started_at or self.finished_at or time.time()) - self.submitted_at,
+            'ready_at': self.ready_at,
+            'deadline_met': self.deadline_met()
+        }
+
+
+_current_job: contextvars.ContextVar[Optional[Job]] = contextvars.ContextVar('job', default=None)
+
+
+class JobScheduler:
+    """笔记调度器
+
+    同时运行的笔记数不超过 max_running，排队的笔记每次按优先级选出下一篇；
+    运行中提交的紧急笔记会排到所有排队笔记之前（已开始的笔记不会被中断）。
+    笔记在等待定时发布时调用 release_slot() 让出名额
+    """
+
+    def __init__(self, runner: Callable[[Job], Awaitable[Any]], max_running: int = 0,
+                 estimator: Optional[StageEstimator] = None):
+        self.runner = runner
+        self.max_running = max_running
+        self.estimator = estimator
+        self.jobs: List[Job] = []
+        self.running = 0
+        self._queued: List[Job] = []
+        self._tasks: List[asyncio.Task] = []
+        # 任务在调度器创建时的上下文中启动，不继承触发调度的那篇笔记的上下文
+        self._context = contextvars.copy_context()
+        self._estimate = estimator.estimate() if estimator else sum(DEFAULT_STAGE_SECONDS.values())
+
+    def submit(self, job: Job) -> Job:
+        """提交笔记，有空闲名额时在下一轮事件循环开始
+
+        同一轮中连续提交的笔记一起参与排序，先提交的不会因此抢先
+        """
+        job.seq = len(self.jobs)
+        job.scheduler = self
+        job.estimate = self._estimate
+        job.submitted_at = time.time()
+        self.jobs.append(job)
+        self._queued.append(job)
+        asyncio.get_running_loop().call_soon(self._dispatch)
+        return job
+
+    def _has_capacity(self) -> bool:
+        return self.max_running <= 0 or self.running < self.max_running
+
+    def _dispatch(self):
+        """按优先级启动排队的笔记，直到名额用完"""
+        while self._queued and self._has_capacity():
+            now = time.time()
+            job = min(self._queued, key=lambda j: (j.priority(now), j.seq))
+            self._queued.remove(job)
+            if job.priority(now)[0] < LANES.index(job.lane):
+                job.promoted = True
+            self.running += 1
+            job.state = 'running'
+            job.started_at = now
+            self._tasks.append(self._context.run(asyncio.ensure_future, self._run(job)))
+
+    async def _run(self, job: Job):
+        token = _current_job.set(job)
+        try:
+            with priority_scope(job.priority(time.time())):
+                job.result = await self.runner(job)
+            job.state = 'skipped' if job.result is None else 'done'
+        except Exception as e:
+            job.state = 'failed'
+            job.result = e
+        finally:
+            job.finished_at = time.time()
+            _current_job.reset(token)
+            self.release(job)
+
+    def release(self, job: Job):
+        """笔记让出运行名额（完成或开始等待定时发布），可以重复调用"""
+        if job.detached:
+            return
+        job.detached = True
+        self.running -= 1
+        self._dispatch()
+
+    async def join(self) -> List[Job]:
+        """等待所有笔记结束（包括运行中提交的），返回按提交顺序排列的笔记"""
+        while True:
+            pending = [task for task in self._tasks if not task.done()]
+            if not pending and not self._queued:
+                return self.jobs
+            if pending:
+                await asyncio.wait(pending)
+            else:
+                self._dispatch()
+                await asyncio.sleep(0)
+
+    def report(self) -> Dict:
+        """定时笔记按时完成情况"""
+        scheduled = [job for job in self.jobs if job.deadline_met() is not None]
+        missed = [job for job in scheduled if not job.deadline_met()]
+        return {
+            'scheduled': len(scheduled),
+            'met': len(scheduled) - len(missed),
+            'missed': len(missed),
+            'promoted': sum(1 for job in self.jobs if job.promoted),
+            'jobs': [job.to_dict() for job in self.jobs]
+        }
+
+
+def current_job() -> Optional[Job]:
+    """当前上下文所属的调度任务"""
+    return _current_job.get()
+
+
+def mark_ready():
+    """记录当前笔记已完成生成、进入发布"""
+    job = _current_job.get()
+    if job is not None and job.ready_at is None:
+        job.ready_at = time.time()
+
+
+def release_slot():
+    """当前笔记开始长时间等待（如定时发布），让出运行名额给排队的笔记"""
+    job = _current_job.get()
+    if job is not None and job.scheduler is not None:
+        job.scheduler.release(job)
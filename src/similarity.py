@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+相似度索引模块
+基于字符 n-gram 的 MinHash/LSH，快速判断是否发布过相似的主题或标题
+"""
+
+import os
+import re
+import json
+import zlib
+import random
+from typing import Dict, List, Set, Tuple
+
+
+# 60 个哈希函数分成 20 段、每段 3 行，相似度约 0.37 以上的记录大概率进入候选
+NUM_PERM = 60
+BANDS = 20
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240101)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+# 只保留中文、字母和数字，忽略标点、emoji 和空白
+_NON_WORD = re.compile(r'[^0-9a-z\u4e00-\u9fff]+')
+
+
+def shingles(text: str, n: int = 2) -> Set[str]:
+    """把文本切成字符 n-gram，中文短文本用二元组效果最好"""
+    text = _NON_WORD.sub('', (text or '').lower())
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def minhash(tokens: Set[str]) -> Tuple[int, ...]:
+    """计算 MinHash 签名"""
+    if not tokens:
+        return ()
+    # 使用 crc32 而不是 hash()，保证签名跨进程稳定，可以落盘复用
+    values = [zlib.crc32(token.encode('utf-8')) for token in tokens]
+    return tuple(min((a * v + b) % _PRIME for v in values) for a, b in _PERMS)
+
+
+def _estimate(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """根据签名估算 Jaccard 相似度"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+class SimilarityIndex:
+    """历史笔记相似度索引
+
+    每条历史记录的主题和标题分别建立签名，签名追加写入索引文件，
+    启动时只需读取签名而无需重新计算；移除记录时追加一行删除标记，查询时跳过
+    """
+
+    def __init__(self, index_file: str):
+        self.index_file = index_file
+        self._loaded = False
+        self._entries: List[Tuple[str, str, Tuple[int, ...]]] = []  # (记录ID, 文本, 签名)
+        self._buckets: List[Dict[Tuple[int, ...], List[int]]] = [{} for _ in range(BANDS)]
+        self._record_ids: Set[str] = set()
+        self._removed: Set[str] = set()
+
+    def __len__(self) -> int:
+        self.load()
+        return len(self._record_ids)
+
+    def load(self):
+        """加载索引文件"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    entry = json.loads(line)
+                    if entry.get('removed'):
+                        self._record_ids.discard(entry['id'])
+                        self._removed.add(entry['id'])
+                    else:
+                        self._insert(entry['id'], entry['text'], tuple(entry['sig']))
+        except Exception as e:
+            print(f"⚠️  加载相似度索引失败: {e}")
+
+    def _insert(self, record_id: str, text: str, signature: Tuple[int, ...]):
+        """把签名放入内存中的 LSH 分桶"""
+        if not signature:
+            return
+        position = len(self._entries)
+        self._entries.append((record_id, text, signature))
+        self._record_ids.add(record_id)
+        self._removed.discard(record_id)
+        for band in range(BANDS):
+            key = signature[band * ROWS:(band + 1) * ROWS]
+            self._buckets[band].setdefault(key, []).append(position)
+
+    def contains(self, record_id: str) -> bool:
+        """记录是否已经建立索引"""
+        self.load()
+        return record_id in self._record_ids
+
+    def _append(self, lines: List[str]):
+        """追加写入索引文件"""
+        try:
+            os.makedirs(os.path.dirname(self.index_file) or '.', exist_ok=True)
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+        except Exception as e:
+            print(f"⚠️  写入相似度索引失败: {e}")
+
+    def add(self, record_id: str, texts: List[str]):
+        """为一条记录的若干文本（主题、标题）增量建立索引"""
+        self.load()
+        lines = []
+        for text in texts:
+            signature = minhash(shingles(text))
+            if not signature:
+                continue
+            self._insert(record_id, text, signature)
+            lines.append(json.dumps({'id': record_id, 'text': text, 'sig': signature}, ensure_ascii=False))
+
+        if lines:
+            self._append(lines)
+
+    def remove(self, record_id: str):
+        """移除一条记录（如发布失败或取消），之后的查询不再返回"""
+        self.load()
+        if record_id not in self._record_ids:
+            return
+        self._record_ids.discard(record_id)
+        self._removed.add(record_id)
+        self._append([json.dumps({'id': record_id, 'removed': True})])
+
+    def query(self, text: str, threshold: float = 0.5, limit: int = 3) -> List[Dict]:
+        """查询相似记录，按相似度从高到低返回"""
+        self.load()
+        signature = minhash(shingles(text))
+        if not signature:
+            return []
+
+        candidates: Set[int] = set()
+        for band in range(BANDS):
+            key = signature[band * ROWS:(band + 1) * ROWS]
+            candidates.update(self._buckets[band].get(key, ()))
+
+        best: Dict[str, Dict] = {}
+        for position in candidates:
+            record_id, matched, other = self._entries[position]
+            if record_id in self._removed:
+                continue
+            score = _estimate(signature, other)
+            if score >= threshold and score > best.get(record_id, {}).get('score', 0):
+                best[record_id] = {'id': record_id, 'text': matched, 'score': score}
+
+        return sorted(best.values(), key=lambda r: r['score'], reverse=True)[:limit]
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推测生成模块
+并发生成多个候选文案，本地校验后采用最先通过的一个并取消其余候选
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from deadline import DeadlineExceeded
+from history import HistoryManager
+
+
+# 正文长度允许偏离目标字数的比例
+LENGTH_TOLERANCE = 0.3
+MIN_TAGS = 3
+MAX_TAGS = 10
+MAX_TITLE_LENGTH = 20
+
+
+def check_candidate(content: Dict, word_count: int, history_mgr: Optional[HistoryManager] = None,
+                    threshold: float = 0.5) -> List[str]:
+    """本地校验候选文案，返回问题列表，空列表表示通过"""
+    problems = []
+
+    length = len(content.get('content', ''))
+    if abs(length - word_count) > word_count * LENGTH_TOLERANCE:
+        problems.append(f"正文 {length} 字，目标 {word_count} 字")
+
+    tags = content.get('tags') or []
+    if not MIN_TAGS <= len(tags) <= MAX_TAGS:
+        problems.append(f"标签 {len(tags)} 个")
+
+    title = content.get('title', '')
+    if not title or len(title) > MAX_TITLE_LENGTH:
+        problems.append(f"标题 {len(title)} 字")
+
+    if history_mgr and title:
+        similar = history_mgr.find_similar(title, threshold, limit=1)
+        if similar:
+            problems.append(f"标题与历史笔记《{similar[0]['text']}》相似")
+
+    return problems
+
+
+async def first_passing(factories: List[Callable[[], Awaitable[Any]]],
+                        check: Callable[[Any], List[str]]) -> Tuple[Any, List[str], Dict]:
+    """并发运行所有候选，返回 (结果, 问题列表, 统计)
+
+    第一个通过校验的候选立即胜出，其余候选被取消；
+    都没有通过时返回问题最少的一个，全部失败时抛出最后一个异常
+    """
+    tasks = [asyncio.ensure_future(factory()) for factory in factories]
+    best: Optional[Tuple[Any, List[str]]] = None
+    last_error: Optional[Exception] = None
+    stats = {'launched': len(tasks), 'completed': 0, 'failed': 0, 'rejected': 0, 'cancelled': 0}
+
+    try:
+        for future in asyncio.as_completed(tasks):
+            try:
+                result = await future
+            except DeadlineExceeded as e:
+                if e.reason == 'deadline':
+                    raise
+                last_error = e
+                stats['failed'] += 1
+                continue
+            except Exception as e:
+                last_error = e
+                stats['failed'] += 1
+                continue
+
+            stats['completed'] += 1
+            problems = check(result)
+            if not problems:
+                return result, [], stats
+            stats['rejected'] += 1
+            print(f"   🎲 候选未通过校验: {'；'.join(problems)}")
+            if best is None or len(problems) < len(best[1]):
+                best = (result, problems)
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        stats['cancelled'] = len(pending)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    if best is None:
+        raise last_error
+    return best[0], best[1], stats
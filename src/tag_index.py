@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+标签索引模块
+从历史记录中统计每个标签的使用次数、发布结果和共现关系，
+在本地统一标签写法并根据主题和大纲推荐标签，不需要额外的模型调用
+"""
+
+import re
+import math
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set
+
+from similarity import shingles
+
+
+# 推荐时各项得分的权重：与主题文本的字面重合、与已选标签的共现、历史使用次数和成功率
+MATCH_WEIGHT = 2.0
+COOCCURRENCE_WEIGHT = 1.0
+PRIOR_WEIGHT = 0.2
+# 每篇笔记的标签数，与 prompt 中要求生成的数量一致
+SUGGESTED_TAGS = 5
+# 有成功发布记录的标签少于该数量时，认为索引数据不足，不替代模型生成标签
+MIN_READY_TAGS = 20
+# 共现计数中两个标签之间的分隔符
+PAIR_SEPARATOR = '\t'
+
+_SPACES = re.compile(r'\s+')
+_EDGE_PUNCT = re.compile(r'^[#＃\W_]+|[\W_]+$')
+
+
+def normalize_tag(tag: str) -> str:
+    """统一标签写法：全角转半角、去掉空白和首尾标点，以 # 开头；无效标签返回空字符串"""
+    text = unicodedata.normalize('NFKC', tag or '')
+    text = _EDGE_PUNCT.sub('', _SPACES.sub('', text))
+    return f"#{text}" if text else ''
+
+
+def tag_key(tag: str) -> str:
+    """标签的统计键，不区分大小写"""
+    return normalize_tag(tag).lower()
+
+
+def apply_tag_stats(stats: Dict, record: Dict, delta: int):
+    """把一条记录的标签计入（或移出）统计
+
+    tags 按状态计数，tag_pairs 只统计成功发布的笔记中两两出现的标签，tag_names 保存首次出现的写法
+    """
+    status = record.get('status', '')
+    keys = []
+    for tag in record.get('tags') or []:
+        key = tag_key(tag)
+        if key and key not in keys:
+            keys.append(key)
+            stats['tag_names'].setdefault(key, normalize_tag(tag))
+
+    for key in keys:
+        bucket = stats['tags'].setdefault(key, {})
+        bucket[status] = bucket.get(status, 0) + delta
+
+    if status != 'success':
+        return
+    keys.sort()
+    for i, first in enumerate(keys):
+        for second in keys[i + 1:]:
+            pair = f"{first}{PAIR_SEPARATOR}{second}"
+            stats['tag_pairs'][pair] = stats['tag_pairs'].get(pair, 0) + delta
+
+
+class TagIndex:
+    """标签索引
+
+    由历史统计（HistoryManager 增量维护的 tags / tag_pairs / tag_names）构建，
+    标签按字符二元组建立倒排表，推荐时只对与文本有重合或与已选标签共现的标签打分
+    """
+
+    def __init__(self, tags: Dict[str, Dict[str, int]], pairs: Dict[str, int],
+                 names: Dict[str, str], source: Optional[List[int]] = None):
+        self.source = source
+        self.names = names
+        self.counts: Dict[str, int] = {}
+        self.success_rates: Dict[str, float] = {}
+        self.priors: Dict[str, float] = {}
+        self._shingles: Dict[str, Set[str]] = {}
+        self._postings: Dict[str, List[str]] = {}
+        self._neighbors: Dict[str, Dict[str, int]] = {}
+
+        for key, statuses in tags.items():
+            count = sum(statuses.values())
+            if count <= 0:
+                continue
+            success = statuses.get('success', 0)
+            failed = statuses.get('failed', 0)
+            self.counts[key] = count
+            # 拉普拉斯平滑，样本少的标签成功率接近 0.5
+            self.success_rates[key] = (success + 1) / (success + failed + 2)
+            self.priors[key] = math.log1p(success) * self.success_rates[key]
+            grams = shingles(key)
+            self._shingles[key] = grams
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(key)
+
+        for pair, count in pairs.items():
+            if count <= 0:
+                continue
+            first, _, second = pair.partition(PAIR_SEPARATOR)
+            self._neighbors.setdefault(first, {})[second] = count
+            self._neighbors.setdefault(second, {})[first] = count
+
+        self._popular = sorted(self.priors, key=lambda k: self.priors[k], reverse=True)
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def ready(self) -> bool:
+        """是否积累了足够的成功发布数据，可以替代模型生成标签"""
+        return sum(1 for key in self.counts if self.priors[key] > 0) >= MIN_READY_TAGS
+
+    def name(self, key: str) -> str:
+        """统计键对应的标签写法"""
+        return self.names.get(key) or key
+
+    def normalize(self, tags: Iterable[str]) -> List[str]:
+        """统一写法并去重，已知标签使用历史中的写法"""
+        result, seen = [], set()
+        for tag in tags:
+            key = tag_key(tag)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            result.append(self.names.get(key) or normalize_tag(tag))
+        return result
+
+    def suggest(self, text: str, limit: int = SUGGESTED_TAGS, seed: Iterable[str] = ()) -> List[str]:
+        """根据主题、大纲等文本推荐标签，seed 为已选标签（不会重复返回）"""
+        chosen = [tag_key(tag) for tag in seed]
+        grams = shingles(text)
+
+        scores: Dict[str, float] = {}
+        for gram in grams:
+            for key in self._postings.get(gram, ()):
+                scores[key] = 0.0
+        for key in scores:
+            tag_grams = self._shingles[key]
+            scores[key] = MATCH_WEIGHT * len(tag_grams & grams) / len(tag_grams)
+
+        # 与文本最相关的标签和已选标签一起作为共现的起点
+        anchors = set(chosen) | set(sorted(scores, key=scores.get, reverse=True)[:limit])
+        for anchor in anchors:
+            neighbors = self._neighbors.get(anchor)
+            if not neighbors:
+                continue
+            total = self.counts.get(anchor) or sum(neighbors.values())
+            for key, count in neighbors.items():
+                scores[key] = scores.get(key, 0.0) + COOCCURRENCE_WEIGHT * count / total
+
+        for key in scores:
+            scores[key] += PRIOR_WEIGHT * self.priors.get(key, 0.0)
+
+        excluded = set(chosen)
+        ranked = [key for key in sorted(scores, key=scores.get, reverse=True) if key not in excluded]
+        if len(ranked) < limit:
+            # 相关标签不够时用历史上表现最好的标签补齐
+            ranked += [key for key in self._popular if key not in excluded and key not in scores]
+        return [self.name(key) for key in ranked[:limit]]
+
+    def top(self, limit: int = 20) -> List[Dict]:
+        """使用最多的标签及其成功率"""
+        keys = sorted(self.counts, key=lambda k: self.counts[k], reverse=True)[:limit]
+        return [{'tag': self.name(key), 'count': self.counts[key],
+                 'success_rate': self.success_rates[key]} for key in keys]
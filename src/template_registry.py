@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prompt 模板注册模块
+模板从 prompts/ 目录加载一次并预编译，按内容哈希标记版本，
+同一模板可以有多个变体（name@variant.txt）用于 A/B 对比
+"""
+
+import os
+import re
+import random
+import hashlib
+from string import Template
+from typing import Dict, List, Mapping, Optional, Sequence
+
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prompts')
+SECTION_PATTERN = re.compile(r'^=== (system|user) ===$')
+
+
+class PromptMessages(list):
+    """渲染后的消息列表，附带模板名称和版本，便于调用方记录指标"""
+
+    def __init__(self, messages: List[Dict], template: str, version: str):
+        super().__init__(messages)
+        self.template = template
+        self.version = version
+
+
+class PromptText(str):
+    """渲染后的纯文本 prompt（如图片 prompt），附带模板名称和版本"""
+
+    def __new__(cls, text: str, template: str, version: str):
+        obj = super().__new__(cls, text)
+        obj.template = template
+        obj.version = version
+        return obj
+
+
+class PromptTemplate:
+    """预编译的模板
+
+    文件由 "=== system ===" 和 "=== user ===" 分段：system 段为固定指令（保持不变以命中前缀缓存），
+    user 段使用 $name 占位符
+    """
+
+    def __init__(self, name: str, variant: str, text: str):
+        self.name = name
+        self.variant = variant
+        self.version = f"{variant}-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:8]}"
+
+        sections: Dict[str, List[str]] = {}
+        current = None
+        for line in text.rstrip('\n').split('\n'):
+            match = SECTION_PATTERN.match(line)
+            if match:
+                current = sections.setdefault(match.group(1), [])
+            elif current is not None:
+                current.append(line)
+        if 'user' not in sections:
+            raise ValueError(f"模板 {name} 缺少 user 段")
+
+        # system 消息只构建一次，每次调用复用同一个对象
+        self.system: Optional[Dict] = None
+        if 'system' in sections:
+            self.system = {"role": "system", "content": '\n'.join(sections['system'])}
+        self.user = Template('\n'.join(sections['user']))
+
+    def render_text(self, **values) -> PromptText:
+        """渲染 user 段文本"""
+        return PromptText(self.user.substitute(**values), self.name, self.version)
+
+    def render(self, **values) -> PromptMessages:
+        """渲染为消息列表"""
+        messages = [{"role": "user", "content": self.render_text(**values)}]
+        if self.system:
+            messages.insert(0, self.system)
+        return PromptMessages(messages, self.name, self.version)
+
+
+class TemplateRegistry:
+    """模板注册表
+
+    variants 为 模板名 -> 参与对比的变体列表，每次渲染随机选择一个；
+    未配置的模板只使用默认变体
+    """
+
+    def __init__(self, template_dir: str = TEMPLATE_DIR, variants: Optional[Mapping[str, Sequence[str]]] = None):
+        self.template_dir = template_dir
+        self.variants = variants or {}
+        self.templates: Dict[str, Dict[str, PromptTemplate]] = {}
+        self._load()
+
+    def _load(self):
+        """加载并预编译目录下所有模板"""
+        for filename in sorted(os.listdir(self.template_dir)):
+            if not filename.endswith('.txt'):
+                continue
+            stem = filename[:-len('.txt')]
+            name, _, variant = stem.partition('@')
+            with open(os.path.join(self.template_dir, filename), 'r', encoding='utf-8') as f:
+                template = PromptTemplate(name, variant or 'default', f.read())
+            self.templates.setdefault(name, {})[template.variant] = template
+
+    def get(self, name: str, selected: Optional[Mapping[str, Sequence[str]]] = None) -> PromptTemplate:
+        """获取模板，配置了多个变体时随机选择；selected 覆盖注册表的变体配置"""
+        variants = self.templates.get(name)
+        if not variants:
+            raise KeyError(f"模板不存在: {name}")
+        selected = self.variants if selected is None else selected
+        enabled = [v for v in selected.get(name, ()) if v in variants]
+        if not enabled:
+            return variants.get('default') or next(iter(variants.values()))
+        return variants[random.choice(enabled)]
+
+    def render(self, name: str, selected: Optional[Mapping[str, Sequence[str]]] = None,
+               **values) -> PromptMessages:
+        """渲染模板为消息列表"""
+        return self.get(name, selected).render(**values)
+
+    def versions(self) -> Dict[str, List[str]]:
+        """所有模板的版本"""
+        return {name: [t.version for t in variants.values()] for name, variants in self.templates.items()}
+
+
+_registry: Optional[TemplateRegistry] = None
+
+
+def get_templates(variants: Optional[Mapping[str, Sequence[str]]] = None) -> TemplateRegistry:
+    """获取进程级模板注册表，首次调用时加载模板"""
+    global _registry
+    if _registry is None:
+        _registry = TemplateRegistry(variants=variants)
+    return _registry
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+调用链追踪模块
+流水线各阶段和每次外部调用记录为 span（父子关系通过 contextvars 传递），
+导出为 Chrome Trace Event JSON，可在 Perfetto（ui.perfetto.dev）或 chrome://tracing 中按时间线查看
+"""
+
+import os
+import json
+import time
+import itertools
+import contextvars
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from fileutil import atomic_open
+
+
+# 内存中最多保留的 span 数，超出后只计数不记录，避免长时间运行占用过多内存
+TRACE_SPAN_LIMIT = 200000
+
+
+class Span:
+    """一次阶段或调用，退出时记录开始时间、耗时和参数"""
+
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'id', 'parent', 'lane', 'start', '_token')
+
+    def __init__(self, tracer: 'Tracer', name: str, cat: str, args: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.id = 0
+        self.parent: Optional[Span] = None
+        self.lane = 0
+        self.start = 0
+
+    def set(self, **args):
+        """补充参数，如 token 数、状态码"""
+        self.args.update(args)
+
+    def __enter__(self) -> 'Span':
+        self.tracer._begin(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer._end(self)
+        return False
+
+
+class _NullSpan:
+    """未开启追踪时使用的空 span"""
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self) -> '_NullSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('span', default=None)
+
+
+class Tracer:
+    """span 记录器
+
+    并发的 span 分配到不同的轨道（导出为 Trace Event 的 tid），同一轨道上的 span 严格嵌套：
+    父 span 所在轨道的最内层正是父 span 时沿用该轨道，否则（如 gather 并发的兄弟任务）换一条空闲轨道。
+    跨轨道的父子关系导出为 flow 箭头；记录时只追加元组，导出时才构造 JSON
+    """
+
+    def __init__(self, limit: int = TRACE_SPAN_LIMIT):
+        self.limit = limit
+        self.origin = time.perf_counter_ns()
+        self.started_at = time.time()
+        self.pid = os.getpid()
+        self.dropped = 0
+        self._records: List[Tuple] = []
+        self._ids = itertools.count(1)
+        self._stacks: Dict[int, List[Span]] = {}
+        self._free: List[int] = []
+        self._lane_count = 0
+
+    def _lane_for(self, parent: Optional[Span]) -> int:
+        """选择轨道：能嵌套在父 span 下就沿用父轨道，否则取编号最小的空闲轨道"""
+        if parent is not None:
+            stack = self._stacks.get(parent.lane)
+            if stack and stack[-1] is parent:
+                return parent.lane
+        elif 0 not in self._stacks or not self._stacks[0]:
+            return 0
+        if self._free:
+            self._free.sort()
+            return self._free.pop(0)
+        self._lane_count += 1
+        return self._lane_count
+
+    def _begin(self, span: Span):
+        span.parent = _current.get()
+        span.id = next(self._ids)
+        span.lane = self._lane_for(span.parent)
+        self._stacks.setdefault(span.lane, []).append(span)
+        span._token = _current.set(span)
+        span.start = time.perf_counter_ns()
+
+    def _end(self, span: Span):
+        end = time.perf_counter_ns()
+        try:
+            _current.reset(span._token)
+        except ValueError:
+            # 在创建它的上下文之外结束（如被其他任务关闭），不影响记录
+            pass
+        stack = self._stacks.get(span.lane)
+        if stack:
+            if stack[-1] is span:
+                stack.pop()
+            elif span in stack:
+                stack.remove(span)
+            if not stack and span.lane != 0:
+                del self._stacks[span.lane]
+                self._free.append(span.lane)
+
+        if len(self._records) >= self.limit:
+            self.dropped += 1
+            return
+        parent = span.parent
+        self._records.append((span.name, span.cat, span.start, end, span.lane, span.id,
+                              parent.id if parent else 0, parent.lane if parent else span.lane, span.args))
+
+    def events(self) -> List[Dict]:
+        """转换为 Trace Event 列表（时间单位微秒）"""
+        events: List[Dict] = [{'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'tid': 0,
+                               'args': {'name': 'xhs_auto'}}]
+        lanes = set()
+        for name, cat, start, end, lane, span_id, parent_id, parent_lane, args in self._records:
+            lanes.add(lane)
+            ts = (start - self.origin) / 1000
+            events.append({'name': name, 'cat': cat, 'ph': 'X', 'ts': ts, 'dur': (end - start) / 1000,
+                           'pid': self.pid, 'tid': lane,
+                           'args': {**args, 'span_id': span_id, 'parent_id': parent_id}})
+            if parent_id and parent_lane != lane:
+                # 父 span 在另一条轨道上时用 flow 箭头连接
+                events.append({'name': 'spawn', 'cat': cat, 'ph': 's', 'id': span_id, 'ts': ts,
+                               'pid': self.pid, 'tid': parent_lane})
+                events.append({'name': 'spawn', 'cat': cat, 'ph': 'f', 'bp': 'e', 'id': span_id, 'ts': ts,
+                               'pid': self.pid, 'tid': lane})
+        for lane in sorted(lanes):
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': lane,
+                           'args': {'name': 'main' if lane == 0 else f'lane {lane}'}})
+        return events
+
+    def export(self, path: str) -> str:
+        """写出 Trace Event JSON 文件"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with atomic_open(path) as f:
+            json.dump({
+                'traceEvents': self.events(),
+                'displayTimeUnit': 'ms',
+                'otherData': {
+                    'started_at': self.started_at,
+                    'spans': len(self._records),
+                    'dropped': self.dropped
+                }
+            }, f, ensure_ascii=False)
+        return path
+
+
+_tracer: Optional[Tracer] = None
+
+
+def configure_tracer(enabled: bool = True) -> Optional[Tracer]:
+    """开启或关闭进程级追踪，需在事件循环开始前调用"""
+    global _tracer
+    _tracer = Tracer() if enabled else None
+    return _tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    """获取进程级追踪器，未开启时为 None"""
+    return _tracer
+
+
+def span(name: str, cat: str = 'stage', **args):
+    """在当前上下文打开一个 span；未开启追踪时返回空 span，开销只有一次判断"""
+    if _tracer is None:
+        return _NULL_SPAN
+    return Span(_tracer, name, cat, args)
+
+
+def export_trace(output_dir: str) -> Optional[str]:
+    """导出本次运行的时间线到输出目录（trace_时间.json），未开启追踪时不导出"""
+    if _tracer is None:
+        return None
+    path = os.path.join(output_dir, f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    try:
+        _tracer.export(path)
+    except Exception as e:
+        print(f"⚠️  导出时间线失败: {e}")
+        return None
+    print(f"🧭 时间线已导出: {path}（可在 https://ui.perfetto.dev 打开）")
+    return path
@@ -9,173 +9,243 @@ import os
 import sys
 import json
 import time
+import uuid
+import asyncio
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 import webbrowser
 import subprocess
 import re
+from assets import AssetStore, ImageAsset
+from browser_lean import LeanLoader, StaticCache
+from image_cache import ImageCache, cache_key
+from concurrency import configure_limiter, get_limiter
+from deadline import DeadlineExceeded, deadline_scope, budget_for, extend, forked, paused, with_timeout
 from history import HistoryManager
 from logger import Logger
-
-
-def parse_json(content: str) -> Dict:
-    """共享的 JSON 解析函数，包含错误处理和正则提取"""
+from json_extract import extract_json
+from metrics import Metrics
+from tracing import configure_tracer, export_trace, span
+from scheduler import Job, JobScheduler, StageEstimator, mark_ready, release_slot
+from speculative import check_candidate, first_passing
+from tag_index import SUGGESTED_TAGS, TagIndex
+from ledger import HISTORY_STATUS, LedgerError, OutcomeUnknown, idempotency_key
+from prompt_builder import PromptBuilder, FUSED_SCHEMA, estimate_max_tokens, validate_response
+
+
+def parse_json(content: str, required_keys: List[str] = ()) -> Dict:
+    """共享的 JSON 解析函数，按括号平衡提取并修复常见格式问题"""
     try:
-        # 移除 markdown 代码块标记
-        content = content.replace('```json', '').replace('```', '').strip()
-
-        # 尝试提取 JSON（处理可能的额外文本）
-        json_match = re.search(r'\{[\s\S]*\}', content)
-        if json_match:
-            content = json_match.group()
-
-        return json.loads(content)
-    except json.JSONDecodeError as e:
+        return extract_json(content, required_keys)
+    except ValueError as e:
         print(f"❌ JSON 解析失败: {e}")
         print(f"原始内容: {content[:200]}...")
         raise ValueError("AI 返回的内容格式不正确，请重试") from e
 
 try:
-    import requests
-    from openai import OpenAI
+    import httpx
+    import openai  # noqa: F401  模型客户端（clients）依赖
 except ImportError:
     print("❌ 缺少依赖，请安装:")
-    print("   pip install requests openai")
+    print("   pip install httpx openai")
     sys.exit(1)
 
-from config import Config
+from cassette import configure_cassette, report_cassette
+from clients import get_registry, run as run_async
+from router import get_router
+from config import Config, ConfigSnapshot, ConfigWatcher
+
+
+class ChatClient:
+    """文本模型调用封装，记录每次调用的 token 用量"""
+
+    def __init__(self, config: ConfigSnapshot, metrics: Optional[Metrics] = None):
+        self.config = config
+        self.metrics = metrics or Metrics()
+        self.prompts = PromptBuilder(config.prompt_variants)
+        self.client = get_registry(config).openai(config)
+
+    async def complete(self, stage: str, messages: List[Dict], temperature: float = 0.7,
+                       max_tokens: int = 1000) -> str:
+        """调用文本模型并返回回复内容
+
+        按路由器给出的顺序尝试候选模型，失败时切换到下一个；
+        有多个候选时不在同一模型上重试，直接切换
+        """
+        router = get_router(self.config)
+        candidates = router.candidates(stage, self.config.model_routes, self.config.models)
+        client = self.client if len(candidates) == 1 else self.client.with_options(max_retries=0)
+
+        last_error: Optional[Exception] = None
+        for model in candidates:
+            with span(stage, cat='chat', model=model) as trace:
+                async with get_limiter().slot('chat', stage) as call:
+                    router.begin(model)
+                    start = time.time()
+                    try:
+                        response = await with_timeout(stage, client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            temperature=temperature,
+                            max_tokens=max_tokens,
+                            timeout=self.config.chat_timeout
+                        ), self.config.chat_timeout, self.metrics)
+                    except asyncio.CancelledError:
+                        router.abandon(model)
+                        raise
+                    except Exception as e:
+                        router.end(model, time.time() - start, ok=False)
+                        call.fail(e)
+                        # 整体预算耗尽时换模型也来不及
+                        if isinstance(e, DeadlineExceeded) and e.reason == 'deadline':
+                            raise
+                        last_error = e
+                        trace.set(error=str(e))
+                        self.metrics.record_failover(stage, model, str(e))
+                        print(f"   ⚠️  {stage}: 模型 {model} 调用失败: {e}")
+                        continue
+                    latency = time.time() - start
+
+                usage = getattr(response, 'usage', None)
+                prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+                completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+                details = getattr(usage, 'prompt_tokens_details', None)
+                cached_tokens = getattr(details, 'cached_tokens', 0) or 0
+
+                content = response.choices[0].message.content
+                template = getattr(messages, 'template', None)
+                if template:
+                    template = f"{template}@{messages.version}"
+
+                router.end(model, latency, ok=True, completion_tokens=completion_tokens)
+                trace.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                          cached_tokens=cached_tokens, template=template)
+                self.metrics.record_call(stage, model, latency, prompt_tokens,
+                                         completion_tokens, cached_tokens, max_tokens,
+                                         template=template, output_length=len(content or ''))
+                print(f"   📊 {stage}: prompt {prompt_tokens} tokens（缓存 {cached_tokens}）/ "
+                      f"completion {completion_tokens} tokens, {latency:.1f}s ({model})")
+
+                return content
+
+        raise last_error
+
+    async def complete_json(self, stage: str, messages: List[Dict], temperature: float = 0.7,
+                      max_tokens: int = 1000, required_keys: List[str] = ()) -> Dict:
+        """调用文本模型并解析 JSON
+
+        先在本地提取和修复，仍失败时才发起一次只针对格式的修复请求，
+        避免整次生成作废
+        """
+        content = await self.complete(stage, messages, temperature, max_tokens)
+        try:
+            return extract_json(content, required_keys)
+        except ValueError:
+            print(f"⚠️  {stage} 返回的 JSON 无法本地修复，请求模型修复格式...")
+
+        repair_messages = self.prompts.json_repair(content, list(required_keys))
+        repaired = await self.complete(f'{stage}_repair', repair_messages, temperature=0,
+                                       max_tokens=max_tokens)
+        return parse_json(repaired, required_keys)
 
 
 class ContentGenerator:
     """内容生成器"""
 
-    def __init__(self, config: Config):
+    def __init__(self, config: ConfigSnapshot, metrics: Optional[Metrics] = None,
+                 tags: Optional[TagIndex] = None):
         self.config = config
-        self.client = OpenAI(
-            api_key=config.api_key,
-            base_url=config.base_url
-        )
-
-    def generate_structure(self, topic: str, word_count: int = 600, context: str = '') -> Dict:
+        self.chat = ChatClient(config, metrics)
+        self.client = self.chat.client
+        self.prompts = PromptBuilder(config.prompt_variants)
+        self.tags = tags
+        # 历史数据足够时不让模型生成标签，省去这部分输出
+        self.local_tags = bool(tags is not None and config.local_tags and tags.ready())
+
+    def _finish_tags(self, tags: List[str], *texts: str) -> List[str]:
+        """用标签索引统一写法，数量不足时用本地推荐补齐"""
+        if self.tags is None:
+            return tags
+        tags = self.tags.normalize(tags)
+        if len(tags) < SUGGESTED_TAGS:
+            tags += self.tags.suggest(' '.join(texts), SUGGESTED_TAGS - len(tags), seed=tags)
+        return tags
+
+    async def generate_structure(self, topic: str, word_count: int = 600, context: str = '') -> Dict:
         """生成内容结构"""
         print(f"📝 正在生成内容结构...")
 
-        prompt = f"""你是一位资深的小红书内容创作专家。
-
-【你的任务】
-根据用户的内容需求，**严格填充下面的 JSON 结构**，不得输出任何多余文字。
-
-====================
-【输入信息】
-主题：{topic}
-字数：{word_count}
-背景：{context}
-
-====================
-【标题创作技巧】：
-1. 采用二极管标题法：
-   - 正面刺激：产品+只需1秒+便可开挂
-   - 负面刺激：你不X+绝对会后悔
-2. 控制字数在20字以内
-3. 生成5个标题，选择1个作为最终标题
-4. 生成正文大纲
-5. 生成5个标签
-
-**输出格式必须只输出下面 JSON**：
-{{
-  "titles": ["标题1", "标题2", "标题3", "标题4", "标题5"],
-  "final_title": "最终标题",
-  "content_outline": ["要点1", "要点2", "要点3"],
-  "tags": ["#标签1", "#标签2", "#标签3", "#标签4", "#标签5"]
-}}"""
-
-        response = self.client.chat.completions.create(
-            model=self.config.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=1000,
-            timeout=self.config.api_timeout
+        messages = self.prompts.structure(topic, word_count, context, with_tags=not self.local_tags)
+        required_keys = ['final_title', 'content_outline'] + ([] if self.local_tags else ['tags'])
+        structure = await self.chat.complete_json('structure', messages, temperature=0.7, max_tokens=1000,
+                                                  required_keys=required_keys)
+        structure['tags'] = self._finish_tags(
+            [] if self.local_tags else structure['tags'],
+            topic, structure['final_title'], *structure['content_outline']
         )
+        return structure
 
-        content = response.choices[0].message.content
-        return parse_json(content)
-
-    def generate_content(self, structure: Dict) -> Dict:
+    async def generate_content(self, structure: Dict) -> Dict:
         """生成完整内容"""
         print(f"📝 正在生成完整内容...")
 
-        prompt = f"""你是一位资深的小红书内容创作专家。
-
-用户需求：
-标题：{structure['final_title']}
-主题：{structure.get('subject', '')}
-大纲：{structure['content_outline']}
-背景：{structure.get('context', '')}
-
-## 正文创作规则：
-1. 风格匹配：根据主题匹配对应风格
-2. 内容要求：结尾设互动，结构清晰，口语化表达，字数50-{structure.get('word_count', 600)}字
-3. 严格围绕大纲创作
-
-输出 Markdown：
-## 标题
-{structure['final_title']}
-
-## 正文
-（正文内容）
-
-## 标签
-{structure['tags']}"""
-
-        response = self.client.chat.completions.create(
-            model=self.config.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=2000,
-            timeout=self.config.api_timeout
-        )
-
-        content = response.choices[0].message.content
+        messages = self.prompts.content(structure)
+        max_tokens = estimate_max_tokens(structure.get('word_count', 600))
+        content = await self.chat.complete('content', messages, temperature=0.7, max_tokens=max_tokens)
         result = self._parse_markdown(content)
+        if self.tags is not None:
+            # 正文阶段只是照抄结构中的标签，以结构阶段统一过写法的结果为准
+            result['tags'] = structure['tags']
 
         # 调用 humanizer-zh skill 优化内容
         if result.get('content'):
             print(f"🔄 正在优化内容，使其更自然...")
-            result['content'] = self._humanize_content(result['content'], structure['final_title'])
+            result['content'] = await self._humanize_content(result['content'], structure['final_title'])
 
         return result
 
-    def _humanize_content(self, content: str, title: str) -> str:
+    async def generate_fused(self, topic: str, word_count: int = 600, context: str = '') -> Tuple[Dict, Dict]:
+        """单次调用生成结构、人性化正文、标签和图片提示词，返回 (内容, 图片提示词)"""
+        print(f"📝 正在一次性生成完整内容...")
+
+        messages = self.prompts.fused(topic, word_count, context, with_tags=not self.local_tags)
+        # 除正文外还需容纳标题、大纲和图片提示词
+        max_tokens = estimate_max_tokens(word_count, overhead=900)
+        data = await self.chat.complete_json('fused', messages, temperature=0.7, max_tokens=max_tokens,
+                                             required_keys=['final_title', 'content'])
+
+        schema = FUSED_SCHEMA
+        if self.local_tags:
+            schema = {field: rule for field, rule in FUSED_SCHEMA.items() if field != 'tags'}
+        errors = validate_response(data, schema)
+        if errors:
+            raise ValueError(f"合并生成结果校验失败: {'; '.join(errors)}")
+
+        content = {
+            'title': data['final_title'].strip(),
+            'content': data['content'].replace('```', '').strip(),
+            'tags': self._finish_tags(
+                [] if self.local_tags else data['tags'],
+                topic, data['final_title'], *data['content_outline']
+            )
+        }
+        prompts = {
+            'cover_image': data['cover_image'],
+            'content_images': data['content_images'][:3]
+        }
+        return content, prompts
+
+    async def _humanize_content(self, content: str, title: str) -> str:
         """使用 humanizer-zh skill 优化内容"""
         try:
-            # 构建 humanizer-zh 的请求
-            humanizer_prompt = f"""请帮我优化以下小红书笔记内容，使其更自然、更人性化，减少 AI 痕迹：
-
-标题：{title}
-
-正文：
-{content}
-
-要求：
-1. 保持原有的核心信息和结构
-2. 使用更口语化、自然的表达方式
-3. 添加适当的语气词和情感表达
-4. 避免过于正式或机械的表述
-5. 保持小红书平台的风格特点
-6. 不要改变字数太多
-
-请直接返回优化后的正文内容，不要添加其他说明。"""
-
-            # 调用 AI 进行人性化优化
-            response = self.client.chat.completions.create(
-                model=self.config.model,
-                messages=[{"role": "user", "content": humanizer_prompt}],
-                temperature=0.8,  # 稍高的温度以增加创造性
-                max_tokens=2000,
-                timeout=self.config.api_timeout
-            )
+            # 构建 humanizer-zh 的请求，固定要求走静态前缀
+            messages = self.prompts.humanize(content, title)
 
-            optimized_content = response.choices[0].message.content.strip()
+            # 调用 AI 进行人性化优化，稍高的温度以增加创造性
+            optimized_content = (await self.chat.complete(
+                'humanize', messages, temperature=0.8,
+                max_tokens=estimate_max_tokens(len(content))
+            )).strip()
 
             # 移除可能的 markdown 标记
             optimized_content = optimized_content.replace('```', '').strip()
@@ -183,6 +253,12 @@ class ContentGenerator:
             print(f"✅ 内容优化完成")
             return optimized_content
 
+        except DeadlineExceeded as e:
+            if e.reason == 'deadline':
+                raise
+            print(f"⚠️  内容优化超时，使用原始内容: {e}")
+            return content
+
         except Exception as e:
             print(f"⚠️  内容优化失败，使用原始内容: {e}")
             return content
@@ -214,137 +290,100 @@ class ContentGenerator:
         }
 
 
+# 生成图片的尺寸（3:4 竖图）
+IMAGE_SIZE = "1728x2304"
+
+
 class ImageGenerator:
     """图片生成器"""
 
-    def __init__(self, config: Config):
+    def __init__(self, config: ConfigSnapshot, metrics: Optional[Metrics] = None):
         self.config = config
-        self.client = OpenAI(
-            api_key=config.api_key,
-            base_url=config.base_url
-        )
+        self.chat = ChatClient(config, metrics)
+        self.client = self.chat.client
+        self.prompts = PromptBuilder(config.prompt_variants)
+        self.cache = ImageCache(config.output_dir, config.image_cache_reuse) if config.image_cache else None
 
-    def generate_prompts(self, content: Dict) -> Dict:
+    async def generate_prompts(self, content: Dict) -> Dict:
         """生成图片提示词"""
         print(f"🎨 正在生成图片提示词...")
 
-        prompt = f"""你是小红书配图专家。
-
-标题：{content['title']}
-
-正文摘要：
-{content['content'][:200]}...
-
-请生成：
-1. 1条封面图 Prompt（现代简洁风格，突出主题关键词）
-2. 2-3条内容图 Prompt（对应正文观点，可视化关键概念）
-
-生成规则：
-- 现代简洁风格，配色协调
-- 封面图：必须包含主题关键词的视觉化表达（如图标、符号、抽象图形）
-- 内容图：配合正文观点，使用清晰的视觉元素
-- 严禁：水印、logo、emoji、乱码、假字、二维码
-- 严禁：任何形式的品牌标识或推广文字
-- 使用干净的背景，避免杂乱元素
-- 图片尺寸：1728x2304（3:4 比例）
-
-只输出严格 JSON：
-{{
-  "cover_image": "封面图提示词，包含主题关键词的视觉元素",
-  "content_images": ["内容图1提示词", "内容图2提示词"],
-  "content_images_count": 2
-}}"""
-
-        response = self.client.chat.completions.create(
-            model=self.config.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=1000,
-            timeout=self.config.api_timeout
-        )
+        messages = self.prompts.image_prompts(content)
+        return await self.chat.complete_json('image_prompts', messages, temperature=0.7, max_tokens=1000,
+                                             required_keys=['cover_image'])
 
-        content = response.choices[0].message.content
-        return parse_json(content)
-
-    def generate_images(self, prompts: Dict) -> List[str]:
-        """生成图片"""
+    async def generate_images(self, prompts: Dict) -> List[ImageAsset]:
+        """并发生成封面图和内容图，结果保持封面在前的顺序"""
         print(f"🎨 正在生成图片...")
 
-        images = []
+        tasks = []
 
         # 生成封面图
         if prompts.get('cover_image'):
             print(f"   - 生成封面图...")
-            filepath = self._generate_single_image(prompts['cover_image'], 'cover', 0)
-            images.append(filepath)
+            tasks.append(self._generate_single_image(prompts['cover_image'], 'cover', 0))
 
         # 生成内容图
         for i, prompt_text in enumerate(prompts.get('content_images', [])):
             print(f"   - 生成内容图 {i+1}...")
-            filepath = self._generate_single_image(prompt_text, 'content', i + 1)
-            images.append(filepath)
+            tasks.append(self._generate_single_image(prompt_text, 'content', i + 1))
 
-        return images
+        return list(await asyncio.gather(*tasks))
 
-    def _generate_single_image(self, prompt: str, image_type: str = 'content', index: int = 0) -> str:
+    async def _generate_single_image(self, prompt: str, image_type: str = 'content', index: int = 0) -> ImageAsset:
         """生成单张图片并下载到本地"""
-        # 构建增强的 prompt，使用明确的否定语言来避免水印等元素
-        enhanced_prompt = f"""{prompt}
-
-重要要求：
-1. 必须创建纯净的图像，不要添加任何水印、logo、文字、品牌标识或签名
-2. 不要包含任何中文字符、英文字母、数字或符号
-3. 不要添加 emoji 表情符号或二维码
-4. 避免模糊、噪点或任何视觉伪影
-5. 使用清晰的视觉元素来表达主题，而不是文字
-
-视觉风格：
-- 现代简洁的设计风格
-- 色彩协调，饱和度适中
-- 良好的光影效果和对比度
-- 专业摄影或高质量设计风格
-- 保持画面干净整洁，无多余元素"""
-
-        response = self.client.images.generate(
-            model=self.config.image_model,
-            prompt=enhanced_prompt,
-            response_format="url",
-            size="1728x2304",
-            extra_body={
-                "watermark": False
-            },
-            timeout=self.config.api_timeout
-        )
+        # 构建增强的 prompt（模板 prompts/image.txt），使用明确的否定语言来避免水印等元素
+        enhanced_prompt = self.prompts.image(prompt)
+
+        key = None
+        if self.cache:
+            key = cache_key(self.config.image_model, IMAGE_SIZE, enhanced_prompt,
+                            f"{enhanced_prompt.template}@{enhanced_prompt.version}")
+            entry = self.cache.get(key, image_type)
+            if self.chat.metrics:
+                self.chat.metrics.record_image_cache(entry is not None)
+            if entry:
+                print(f"   ♻️  复用缓存图片: {image_type}_{index}")
+                return ImageAsset(entry['path'])
+
+        with span('image_generate', cat='image', image=f'{image_type}_{index}', model=self.config.image_model):
+            async with get_limiter().slot('image'):
+                response = await with_timeout(f'image_{image_type}_{index}', self.client.images.generate(
+                    model=self.config.image_model,
+                    prompt=enhanced_prompt,
+                    response_format="url",
+                    size=IMAGE_SIZE,
+                    extra_body={
+                        "watermark": False
+                    },
+                    timeout=self.config.image_timeout
+                ), self.config.image_timeout, self.chat.metrics)
 
         image_url = response.data[0].url
 
         # 下载图片到本地
-        return ImageDownloader.download(
+        asset = await ImageDownloader.download(
             image_url,
             self.config.output_dir,
             image_type,
-            index
+            index,
+            timeout=self.config.download_timeout,
+            metrics=self.chat.metrics,
+            client=get_registry(self.config).http('cdn')
         )
+        if key:
+            self.cache.put(key, asset.path, self.config.image_model, IMAGE_SIZE, prompt,
+                           f"{enhanced_prompt.template}@{enhanced_prompt.version}", image_type)
+        return asset
 
 
 class ImageDownloader:
     """图片下载器"""
 
     @staticmethod
-    def download(url: str, output_dir: str, image_type: str = 'content', index: int = 0) -> str:
-        """下载图片到本地"""
-        try:
-            # 创建输出目录
-            os.makedirs(output_dir, exist_ok=True)
-
-            # 生成文件名
-            timestamp = int(time.time())
-            filename = f"{image_type}_{index}_{timestamp}.png"
-            filepath = os.path.join(output_dir, filename)
-
-            # 下载图片
-            print(f"   📥 下载图片: {filename}")
-            response = requests.get(url, stream=True, timeout=30)
+    async def _fetch(client, url: str, output_dir: str, timeout: float) -> ImageAsset:
+        """流式下载并写入资源存储，同时在内存中保留数据供上传使用"""
+        async with client.stream('GET', url, follow_redirects=True, timeout=timeout) as response:
             response.raise_for_status()
 
             # 验证图片
@@ -352,23 +391,44 @@ class ImageDownloader:
             if not content_type.startswith('image/'):
                 raise ValueError(f"下载的不是图片: {content_type}")
 
-            # 保存图片
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            # 保存图片，小于1KB可能是错误图片
+            with AssetStore(output_dir).open_incoming('.png', min_size=1024, keep_buffer=True) as incoming:
+                async for chunk in response.aiter_bytes(chunk_size=8192):
+                    incoming.write(chunk)
+        return ImageAsset(incoming.path, incoming.buffer)
 
-            # 验证文件大小
-            file_size = os.path.getsize(filepath)
-            if file_size < 1024:  # 小于1KB可能是错误图片
-                raise ValueError(f"图片过小: {file_size} bytes")
+    @staticmethod
+    async def download(url: str, output_dir: str, image_type: str = 'content', index: int = 0,
+                       timeout: float = 30, metrics: Optional[Metrics] = None,
+                       client: Optional[httpx.AsyncClient] = None) -> ImageAsset:
+        """下载图片到本地，按内容哈希保存，重复内容只保留一份
+
+        传入共享 client 时复用其连接池，否则临时建立连接
+        """
+        try:
+            # 下载图片
+            print(f"   📥 下载图片: {image_type}_{index}")
+            with span('download', cat='http', image=f'{image_type}_{index}') as trace:
+                async with get_limiter().slot():
+                    if client is None:
+                        async with httpx.AsyncClient(timeout=timeout) as temp_client:
+                            asset = await with_timeout(f'download_{image_type}_{index}',
+                                                       ImageDownloader._fetch(temp_client, url, output_dir, timeout),
+                                                       timeout, metrics)
+                    else:
+                        asset = await with_timeout(f'download_{image_type}_{index}',
+                                                   ImageDownloader._fetch(client, url, output_dir, timeout),
+                                                   timeout, metrics)
+                trace.set(bytes=asset.size)
 
-            print(f"   ✅ 图片保存成功: {filepath}")
-            return filepath
+            print(f"   ✅ 图片保存成功: {asset.path}")
+            return asset
 
-        except requests.exceptions.Timeout:
+        except DeadlineExceeded:
+            raise
+        except httpx.TimeoutException:
             raise ValueError("图片下载超时")
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             raise ValueError(f"图片下载失败: {e}")
         except Exception as e:
             raise ValueError(f"图片处理失败: {e}")
@@ -387,8 +447,8 @@ class PreviewManager:
         images_html = ''
         for i, img in enumerate(data['images']):
             # 将本地路径转换为file://协议
-            abs_path = os.path.abspath(img)
-            file_url = f'file:///{abs_path.replace("\\", "/")}'
+            abs_path = os.path.abspath(img).replace('\\', '/')
+            file_url = f'file:///{abs_path}'
             images_html += f'<img src="{file_url}" class="slide-img" data-index="{i}" />'
 
         tags_html = ' '.join(data['tags'])
@@ -615,23 +675,20 @@ class PreviewManager:
 class Publisher:
     """发布器"""
 
-    def __init__(self, config: Config):
+    def __init__(self, config: ConfigSnapshot, metrics: Optional[Metrics] = None):
         self.config = config
+        self.metrics = metrics
 
-    def publish(self, data: Dict, scheduled_time: Optional[str] = None, publish_method: str = 'auto'):
-        """发布内容"""
-        print(f"📤 准备发布...")
+    async def publish(self, data: Dict, scheduled_time: Optional[str] = None, publish_method: str = 'auto',
+                      assets: Optional[List[ImageAsset]] = None, idempotency_key: Optional[str] = None,
+                      on_send: Optional[Callable[[], None]] = None):
+        """发布内容，assets 为与 data['images'] 对应的图片数据，未提供时按路径映射本地文件
 
-        if scheduled_time:
-            print(f"⏰ 定时发布: {scheduled_time}")
-            # 等待到指定时间
-            schedule_time = datetime.strptime(scheduled_time, '%Y-%m-%d %H:%M:%S')
-            now = datetime.now()
-            wait_seconds = (schedule_time - now).total_seconds()
+        on_send 在请求真正发出前调用；发布失败时抛出异常，无法确认是否已发布时抛出 OutcomeUnknown
+        """
+        print(f"📤 准备发布...")
 
-            if wait_seconds > 0:
-                print(f"⏳ 等待 {int(wait_seconds)} 秒...")
-                time.sleep(wait_seconds)
+        await wait_for_schedule(scheduled_time)
 
         # 模拟发布（实际需要调用小红书 API）
         print(f"📝 标题: {data['title']}")
@@ -640,74 +697,179 @@ class Publisher:
         print(f"🖼️  图片: {len(data['images'])} 张")
 
         # 根据发布方式选择发布方法
+        # 配置了真实发布渠道时失败直接报错，不再退回模拟发布，以免把未发出的笔记记为成功
         if publish_method == 'browser':
             try:
-                self._publish_via_browser(data)
-            except Exception as e:
-                print(f"⚠️  浏览器发布失败: {e}")
+                await XHSBrowserPublisher(self.config, self.metrics).publish(data, assets=assets, on_send=on_send)
+            except ImportError:
                 print(f"💡 请检查是否安装了 playwright: pip install playwright && playwright install")
-                self._publish_simulation(data)
+                raise
         elif self.config.mcp_url:
-            try:
-                self._publish_via_mcp(data)
-            except Exception as e:
-                print(f"⚠️  MCP 发布失败: {e}")
-                self._publish_simulation(data)
+            await self._publish_via_mcp(data, assets=assets, idempotency_key=idempotency_key, on_send=on_send)
         else:
+            if on_send:
+                on_send()
             self._publish_simulation(data)
 
-    def _publish_via_mcp(self, data: Dict, max_retries: int = 3) -> bool:
-        """通过 MCP 发布"""
+    @staticmethod
+    def _mcp_body(request: Dict, assets: List[ImageAsset]) -> Tuple[int, Any]:
+        """流式生成 JSON-RPC 请求体，图片以 base64 分块写入 arguments.images，返回 (总长度, 数据流)
+
+        每张图片只按块编码，不在内存中拼出完整的 base64 字符串或请求体；
+        base64 长度可以预先算出，因此仍带 Content-Length，不依赖分块传输
+        """
+        placeholder = '\x00images\x00'
+        envelope = {**request, 'params': {**request['params'],
+                                          'arguments': {**request['params']['arguments'], 'images': placeholder}}}
+        head, tail = json.dumps(envelope, ensure_ascii=False).split(json.dumps(placeholder))
+
+        # 固定片段为 bytes，图片数据位置放 ImageAsset
+        parts: List[Any] = [head.encode('utf-8') + b'[']
+        for i, asset in enumerate(assets):
+            meta = json.dumps({'name': asset.name, 'mime_type': asset.mime_type,
+                               'encoding': 'base64', 'size': asset.size}, ensure_ascii=False)
+            parts.append((',' if i else '').encode() + meta[:-1].encode('utf-8') + b', "data": "')
+            parts.append(asset)
+            parts.append(b'"}')
+        parts.append(b']' + tail.encode('utf-8'))
+
+        length = sum(len(part) if isinstance(part, bytes) else (part.size + 2) // 3 * 4 for part in parts)
+
+        async def stream():
+            for part in parts:
+                if isinstance(part, bytes):
+                    yield part
+                else:
+                    for chunk in part.iter_base64():
+                        yield chunk.encode('ascii')
+
+        return length, stream()
+
+    async def check_mcp(self) -> List[str]:
+        """请求 MCP 服务端的工具列表，确认发布工具存在，返回工具名列表"""
+        request = {
+            "jsonrpc": "2.0",
+            "id": f"tools-{uuid.uuid4().hex}",
+            "method": "tools/list",
+            "params": {}
+        }
+        client = get_registry(self.config).http('cdn')
+        with span('mcp_tools_list', cat='mcp') as trace:
+            async with get_limiter().slot('mcp', 'tools/list') as call:
+                response = await with_timeout('mcp_tools_list', client.post(
+                    self.config.mcp_url,
+                    json=request,
+                    timeout=self.config.mcp_timeout
+                ), self.config.mcp_timeout, self.metrics)
+                call.status(response.status_code)
+            trace.set(status=response.status_code)
+        response.raise_for_status()
+
+        result = response.json()
+        if result.get('error'):
+            raise ValueError(f"MCP 错误: {result['error']}")
+        tools = [tool.get('name') for tool in (result.get('result') or {}).get('tools', [])]
+        if self.config.mcp_tool not in tools:
+            raise ValueError(f"MCP 服务端没有发布工具 {self.config.mcp_tool}（可用: {', '.join(tools) or '无'}）")
+        return tools
+
+    async def _publish_via_mcp(self, data: Dict, max_retries: int = 3,
+                               assets: Optional[List[ImageAsset]] = None,
+                               idempotency_key: Optional[str] = None,
+                               on_send: Optional[Callable[[], None]] = None):
+        """通过 MCP 发布，失败时抛出异常
+
+        XHS_MCP_IMAGE_MODE=path 时只传本地路径（MCP 服务端与本机共享文件系统）；
+        base64 时把图片数据流式编码进请求体，远程服务端也能拿到图片。
+        每次重试使用新的 JSON-RPC id，但携带同一个 Idempotency-Key 请求头，支持幂等的服务端可以据此去重；
+        最后一次失败是超时时请求可能已被接受，抛出 OutcomeUnknown
+        """
         print(f"🔗 使用 MCP 服务端发布...")
 
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(
-                    self.config.mcp_url,
-                    json={
-                        "jsonrpc": "2.0",
-                        "id": 1,
-                        "method": "tools/call",
-                        "params": {
-                            "name": "publish_content",
-                            "arguments": data
-                        }
-                    },
-                    headers={'Content-Type': 'application/json'},
-                    timeout=30
-                )
-                response.raise_for_status()
-
-                # 验证响应
-                result = response.json()
-                if result.get('error'):
-                    raise ValueError(f"MCP 错误: {result['error']}")
-
-                print(f"✅ MCP 发布成功")
-                return True
-
-            except requests.exceptions.Timeout:
-                print(f"⚠️  MCP 请求超时，尝试 {attempt + 1}/{max_retries}")
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
-                continue
-
-            except requests.exceptions.ConnectionError:
-                print(f"⚠️  MCP 连接失败，尝试 {attempt + 1}/{max_retries}")
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
-                continue
-
-            except requests.exceptions.HTTPError as e:
-                print(f"❌ MCP HTTP 错误: {e}")
-                return False
-
-            except Exception as e:
-                print(f"❌ MCP 发布失败: {e}")
-                return False
-
-        print(f"❌ MCP 发布失败，已重试 {max_retries} 次")
-        return False
+        request_key = idempotency_key or uuid.uuid4().hex
+        inline = self.config.mcp_image_mode == 'base64'
+        owned: List[ImageAsset] = []
+        if inline and assets is None:
+            assets = owned = [ImageAsset(path) for path in data['images']]
+
+        timed_out = False
+        try:
+            for attempt in range(max_retries):
+                request = {
+                    "jsonrpc": "2.0",
+                    "id": f"{request_key}-{attempt + 1}",
+                    "method": "tools/call",
+                    "params": {
+                        "name": self.config.mcp_tool,
+                        "arguments": data
+                    }
+                }
+                try:
+                    client = get_registry(self.config).http('cdn')
+                    headers = {'Content-Type': 'application/json', 'Idempotency-Key': request_key}
+                    if inline:
+                        # 流式请求体只能读取一次，每次重试重新生成
+                        length, stream = self._mcp_body(request, assets)
+                        headers['Content-Length'] = str(length)
+                        body = {'content': stream}
+                    else:
+                        body = {'json': request}
+                    with span('mcp_post', cat='mcp', attempt=attempt + 1, inline=inline) as trace:
+                        async with get_limiter().slot('mcp', 'tools/call') as call:
+                            if on_send:
+                                on_send()
+                            response = await with_timeout('mcp_publish', client.post(
+                                self.config.mcp_url,
+                                headers=headers,
+                                timeout=self.config.mcp_timeout,
+                                **body
+                            ), self.config.mcp_timeout, self.metrics)
+                            call.status(response.status_code)
+                        trace.set(status=response.status_code)
+                    response.raise_for_status()
+
+                    # 验证响应
+                    result = response.json()
+                    if result.get('error'):
+                        raise ValueError(f"MCP 错误: {result['error']}")
+
+                    print(f"✅ MCP 发布成功")
+                    return
+
+                except DeadlineExceeded as e:
+                    if e.reason == 'deadline':
+                        raise
+                    timed_out = True
+                    print(f"⚠️  MCP 请求超时，尝试 {attempt + 1}/{max_retries}")
+                    if attempt < max_retries - 1:
+                        await asyncio.sleep(2 ** attempt)
+                    continue
+
+                except httpx.TimeoutException:
+                    timed_out = True
+                    print(f"⚠️  MCP 请求超时，尝试 {attempt + 1}/{max_retries}")
+                    if attempt < max_retries - 1:
+                        await asyncio.sleep(2 ** attempt)
+                    continue
+
+                except httpx.ConnectError:
+                    # 连接都没建立，请求肯定没有送达
+                    timed_out = False
+                    print(f"⚠️  MCP 连接失败，尝试 {attempt + 1}/{max_retries}")
+                    if attempt < max_retries - 1:
+                        await asyncio.sleep(2 ** attempt)
+                    continue
+
+                except httpx.HTTPStatusError as e:
+                    raise RuntimeError(f"MCP HTTP 错误: {e}") from e
+
+        finally:
+            for asset in owned:
+                asset.close()
+
+        if timed_out:
+            raise OutcomeUnknown(f"MCP 请求超时 {max_retries} 次，无法确认是否已发布")
+        raise RuntimeError(f"MCP 发布失败，已重试 {max_retries} 次")
 
     def _publish_simulation(self, data: Dict):
         """模拟发布"""
@@ -715,90 +877,256 @@ class Publisher:
         print(f"💡 提示: 实际发布需要配置小红书 API 或 MCP 服务端")
 
 
+# 浏览器配置目录 -> 锁，同一目录同时只能被一个浏览器使用
+_profile_locks: Dict[str, asyncio.Lock] = {}
+
+
+class BrowserSession:
+    """已打开发布页并确认登录的浏览器会话，关闭时释放浏览器配置目录"""
+
+    def __init__(self, lock: Optional[asyncio.Lock] = None):
+        self.lock = lock
+        self.playwright = None
+        self.context = None
+        self.closer = None
+        self.page = None
+        self.loader: Optional[LeanLoader] = None
+
+    async def close(self):
+        """关闭浏览器，可以重复调用"""
+        closer, self.closer = self.closer, None
+        playwright, self.playwright = self.playwright, None
+        lock, self.lock = self.lock, None
+        try:
+            if closer is not None:
+                await closer.close()
+        except Exception as e:
+            print(f"⚠️  关闭浏览器失败: {e}")
+        finally:
+            try:
+                if playwright is not None:
+                    await playwright.stop()
+            finally:
+                if lock is not None:
+                    lock.release()
+
+
 class XHSBrowserPublisher:
     """小红书浏览器自动发布器"""
 
-    def __init__(self, config: Config):
+    PUBLISH_URL = 'https://creator.xiaohongshu.com/publish/publish'
+    # 精简加载时等到上传控件或登录入口出现即认为页面可用，不等待 networkidle
+    READY_SELECTOR = 'input[type="file"], .login-btn, [class*="login"]'
+
+    def __init__(self, config: ConfigSnapshot, metrics: Optional[Metrics] = None):
         self.config = config
+        self.metrics = metrics
+        # 最近一次等待用户登录的起止时间（monotonic）
+        self.login_wait: Optional[Tuple[float, float]] = None
+
+    def _lean_loader(self) -> Optional[LeanLoader]:
+        """精简加载模式的请求拦截器，静态资源缓存在浏览器配置目录中"""
+        if not self.config.browser_lean:
+            return None
+        cache = None
+        if self.config.browser_profile:
+            cache = StaticCache(os.path.join(self.config.browser_profile, 'static_cache'))
+        return LeanLoader(self.config.browser_block_types, self.config.browser_allow_domains, cache)
+
+    async def _launch(self, playwright, headless: bool):
+        """启动浏览器，返回 (上下文, 结束时需要关闭的对象)
+
+        配置了浏览器配置目录时使用持久化上下文，登录状态和浏览器缓存跨运行保留
+        """
+        args = ['--no-sandbox', '--disable-setuid-sandbox']
+        options = {
+            'viewport': {'width': 1280, 'height': 800},
+            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+        if self.config.browser_profile:
+            os.makedirs(self.config.browser_profile, exist_ok=True)
+            context = await playwright.chromium.launch_persistent_context(
+                self.config.browser_profile, headless=headless, args=args, **options
+            )
+            return context, context
+
+        browser = await playwright.chromium.launch(headless=headless, args=args)
+        context = await browser.new_context(**options)
+        return context, browser
+
+    async def _open_publish_page(self, page, loader: Optional[LeanLoader]) -> float:
+        """打开发布页并等待可用，返回页面就绪耗时（秒）"""
+        budget, _ = budget_for(self.config.browser_timeout / 1000)
+        if budget <= 0:
+            raise DeadlineExceeded('browser_goto', 'deadline', 0.0)
+
+        start = time.perf_counter()
+        with span('browser_goto', cat='browser', lean=loader is not None) as trace:
+            if loader:
+                await page.goto(self.PUBLISH_URL, wait_until='domcontentloaded', timeout=budget * 1000)
+                # 等待表单控件出现，不等待统计脚本、字体和图片
+                await page.wait_for_selector(self.READY_SELECTOR, state='attached', timeout=budget * 1000)
+            else:
+                await page.goto(self.PUBLISH_URL, timeout=budget * 1000)
+                # 等待页面加载
+                await page.wait_for_load_state('networkidle')
+            ready = time.perf_counter() - start
+            stats = loader.stats() if loader else {}
+            trace.set(ready=ready, **stats)
+
+        if self.metrics:
+            self.metrics.record_page_load(ready, loader is not None, **stats)
+        if loader:
+            print(f"⏱️  页面就绪 {ready:.1f}s（精简加载，拦截 {stats['blocked']} 个请求，"
+                  f"缓存命中 {stats['cache_hits']} 个）")
+        else:
+            print(f"⏱️  页面就绪 {ready:.1f}s（完整加载）")
+        return ready
+
+    async def measure_page_load(self, headless: bool = True) -> Dict:
+        """只打开发布页并测量就绪耗时，用于对比精简加载和完整加载"""
+        from playwright.async_api import async_playwright
+
+        async with async_playwright() as p:
+            context, closer = await self._launch(p, headless)
+            loader = self._lean_loader()
+            try:
+                if loader:
+                    await loader.install(context)
+                page = context.pages[0] if context.pages else await context.new_page()
+                ready = await self._open_publish_page(page, loader)
+                return {'ready': ready, **(loader.stats() if loader else {})}
+            finally:
+                await closer.close()
+
+    async def open_session(self, headless: bool = False) -> 'BrowserSession':
+        """启动浏览器、打开发布页并确认已登录，返回可以直接填写表单的会话
 
-    def publish(self, data: Dict, headless: bool = False):
-        """使用浏览器自动操作发布到小红书"""
+        使用浏览器配置目录时同一目录同时只能被一个浏览器使用，并发的笔记依次借用；
+        准备过程中失败或被取消时关闭已打开的浏览器
+        """
         try:
-            from playwright.sync_api import sync_playwright
+            from playwright.async_api import async_playwright
         except ImportError:
             raise ImportError("请先安装 playwright: pip install playwright && playwright install")
 
-        print(f"🌐 启动浏览器自动操作...")
+        lock = None
+        if self.config.browser_profile:
+            lock = _profile_locks.setdefault(os.path.abspath(self.config.browser_profile), asyncio.Lock())
+            with span('browser_borrow', cat='browser'):
+                await lock.acquire()
 
-        with sync_playwright() as p:
+        print(f"🌐 启动浏览器自动操作...")
+        session = BrowserSession(lock)
+        try:
+            session.playwright = await async_playwright().start()
             # 启动浏览器
-            browser = p.chromium.launch(
-                headless=headless,
-                args=['--no-sandbox', '--disable-setuid-sandbox']
-            )
-
-            context = browser.new_context(
-                viewport={'width': 1280, 'height': 800},
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            )
-
-            page = context.new_page()
+            with span('browser_launch', cat='browser', headless=headless):
+                session.context, session.closer = await self._launch(session.playwright, headless)
+                session.loader = self._lean_loader()
+                if session.loader:
+                    await session.loader.install(session.context)
+                pages = session.context.pages
+                session.page = pages[0] if pages else await session.context.new_page()
+
+            # 访问小红书发布页面
+            print(f"📱 打开小红书发布页面...")
+            await self._open_publish_page(session.page, session.loader)
+            await self._ensure_login(session)
+            return session
+
+        except BaseException as e:
+            if not isinstance(e, asyncio.CancelledError):
+                print(f"❌ 浏览器操作失败: {e}")
+            await session.close()
+            raise
+
+    async def _ensure_login(self, session: 'BrowserSession'):
+        """检查登录状态，未登录时等待用户在浏览器中完成登录"""
+        page = session.page
+        with span('browser_check_login', cat='browser'):
+            need_login = await self._need_login(page)
+        if not need_login:
+            return
+
+        print(f"🔐 检测到需要登录")
+        if session.loader:
+            # 登录二维码等图片被屏蔽了，恢复完整加载
+            await session.loader.remove(session.context)
+            await page.reload(wait_until='domcontentloaded')
+        print(f"💡 请在浏览器中完成登录...")
+        print(f"⏳ 等待登录完成...")
+
+        # 等待用户手动登录（最多等待120秒，不计入截止时间）
+        started = time.monotonic()
+        try:
+            with paused(), span('browser_login', cat='browser'):
+                for i in range(120):
+                    await asyncio.sleep(1)
+                    if not await self._need_login(page):
+                        print(f"✅ 登录成功")
+                        break
+                    if i % 10 == 0 and i > 0:
+                        print(f"⏳ 等待登录中... ({i}/120秒)")
+                else:
+                    raise TimeoutError("登录超时，请重新运行程序")
+        finally:
+            self.login_wait = (started, time.monotonic())
+
+    async def publish(self, data: Dict, headless: bool = False, assets: Optional[List[ImageAsset]] = None,
+                      session: Optional['BrowserSession'] = None, on_send: Optional[Callable[[], None]] = None):
+        """使用浏览器自动操作发布到小红书，图片直接从内存缓冲上传
+
+        传入预热好的 session 时跳过启动浏览器、打开页面和登录检查，直接填写表单；session 用完后关闭。
+        表单填好、交给用户点击发布之前调用 on_send
+        """
+        if session is None:
+            session = await self.open_session(headless)
+        page = session.page
 
+        try:
+            # 上传图片
+            print(f"🖼️  开始上传图片 ({len(data['images'])} 张)...")
+            owned = [] if assets is not None else [ImageAsset(path) for path in data['images']]
             try:
-                # 访问小红书发布页面
-                print(f"📱 打开小红书发布页面...")
-                page.goto('https://creator.xiaohongshu.com/publish/publish', timeout=30000)
-
-                # 等待页面加载
-                page.wait_for_load_state('networkidle')
-
-                # 检查是否需要登录
-                if self._need_login(page):
-                    print(f"🔐 检测到需要登录")
-                    print(f"💡 请在浏览器中完成登录...")
-                    print(f"⏳ 等待登录完成...")
-
-                    # 等待用户手动登录（最多等待120秒）
-                    for i in range(120):
-                        time.sleep(1)
-                        if not self._need_login(page):
-                            print(f"✅ 登录成功")
-                            break
-                        if i % 10 == 0 and i > 0:
-                            print(f"⏳ 等待登录中... ({i}/120秒)")
-                    else:
-                        raise TimeoutError("登录超时，请重新运行程序")
-
-                # 上传图片
-                print(f"🖼️  开始上传图片 ({len(data['images'])} 张)...")
-                self._upload_images(page, data['images'])
+                with span('browser_upload', cat='browser', images=len(data['images'])):
+                    await self._upload_images(page, assets if assets is not None else owned)
+            finally:
+                for asset in owned:
+                    asset.close()
 
-                # 输入标题
-                print(f"📝 输入标题...")
-                self._input_title(page, data['title'])
+            # 输入标题
+            print(f"📝 输入标题...")
+            with span('browser_title', cat='browser'):
+                await self._input_title(page, data['title'])
 
-                # 输入正文
-                print(f"📝 输入正文...")
-                self._input_content(page, data['content'], data['tags'])
+            # 输入正文
+            print(f"📝 输入正文...")
+            with span('browser_content', cat='browser'):
+                await self._input_content(page, data['content'], data['tags'])
 
-                # 等待确认
-                print(f"✅ 内容已填写完成，请在浏览器中检查")
-                print(f"💡 请在浏览器中点击发布按钮完成发布")
-                print(f"⏳ 等待30秒后自动关闭浏览器...")
+            # 等待确认
+            print(f"✅ 内容已填写完成，请在浏览器中检查")
+            print(f"💡 请在浏览器中点击发布按钮完成发布")
+            print(f"⏳ 等待30秒后自动关闭浏览器...")
 
-                # 等待30秒让用户检查和发布
-                time.sleep(30)
+            # 等待30秒让用户检查和发布
+            if on_send:
+                on_send()
+            with paused(), span('browser_review', cat='browser'):
+                await asyncio.sleep(30)
 
-                print(f"✅ 浏览器发布流程完成")
+            print(f"✅ 浏览器发布流程完成")
 
-            except Exception as e:
-                print(f"❌ 浏览器操作失败: {e}")
-                raise
+        except Exception as e:
+            print(f"❌ 浏览器操作失败: {e}")
+            raise
 
-            finally:
-                browser.close()
+        finally:
+            with span('browser_close', cat='browser'):
+                await session.close()
 
-    def _need_login(self, page) -> bool:
+    async def _need_login(self, page) -> bool:
         """检查是否需要登录"""
         try:
             # 检查是否存在登录按钮或登录相关元素
@@ -811,7 +1139,7 @@ class XHSBrowserPublisher:
             ]
 
             for selector in login_selectors:
-                if page.locator(selector).count() > 0:
+                if await page.locator(selector).count() > 0:
                     return True
 
             return False
@@ -819,7 +1147,7 @@ class XHSBrowserPublisher:
         except Exception:
             return False
 
-    def _upload_images(self, page, image_paths: List[str]):
+    async def _upload_images(self, page, assets: List[ImageAsset]):
         """上传图片"""
         try:
             # 查找上传按钮（可能的选择器）
@@ -834,7 +1162,7 @@ class XHSBrowserPublisher:
             for selector in upload_selectors:
                 try:
                     file_input = page.locator(selector).first
-                    if file_input.count() > 0:
+                    if await file_input.count() > 0:
                         break
                 except:
                     continue
@@ -842,11 +1170,11 @@ class XHSBrowserPublisher:
             if not file_input:
                 raise Exception("未找到上传按钮，请手动上传图片")
 
-            # 上传所有图片
-            file_input.set_input_files(image_paths)
+            # 上传所有图片，以缓冲载荷传入，不再让浏览器从磁盘读取
+            await file_input.set_input_files([asset.file_payload() for asset in assets])
 
             # 等待上传完成
-            time.sleep(3)
+            await asyncio.sleep(3)
 
             print(f"✅ 图片上传完成")
 
@@ -854,7 +1182,7 @@ class XHSBrowserPublisher:
             print(f"⚠️  图片上传失败: {e}")
             print(f"💡 请在浏览器中手动上传图片")
 
-    def _input_title(self, page, title: str):
+    async def _input_title(self, page, title: str):
         """输入标题"""
         try:
             # 查找标题输入框
@@ -869,13 +1197,13 @@ class XHSBrowserPublisher:
             for selector in title_selectors:
                 try:
                     title_input = page.locator(selector).first
-                    if title_input.count() > 0:
+                    if await title_input.count() > 0:
                         break
                 except:
                     continue
 
             if title_input:
-                title_input.fill(title)
+                await title_input.fill(title)
                 print(f"✅ 标题已输入")
             else:
                 print(f"⚠️  未找到标题输入框，请手动输入")
@@ -884,7 +1212,7 @@ class XHSBrowserPublisher:
             print(f"⚠️  标题输入失败: {e}")
             print(f"💡 请在浏览器中手动输入标题")
 
-    def _input_content(self, page, content: str, tags: List[str]):
+    async def _input_content(self, page, content: str, tags: List[str]):
         """输入正文和标签"""
         try:
             # 查找正文输入框
@@ -900,7 +1228,7 @@ class XHSBrowserPublisher:
             for selector in content_selectors:
                 try:
                     content_input = page.locator(selector).first
-                    if content_input.count() > 0:
+                    if await content_input.count() > 0:
                         break
                 except:
                     continue
@@ -908,7 +1236,7 @@ class XHSBrowserPublisher:
             if content_input:
                 # 组合正文和标签
                 full_content = f"{content}\n\n{' '.join(tags)}"
-                content_input.fill(full_content)
+                await content_input.fill(full_content)
                 print(f"✅ 正文和标签已输入")
             else:
                 print(f"⚠️  未找到正文输入框，请手动输入")
@@ -918,14 +1246,510 @@ class XHSBrowserPublisher:
             print(f"💡 请在浏览器中手动输入正文和标签")
 
 
+class ChannelWarmup:
+    """发布渠道预热
+
+    笔记开始生成时在后台准备发布渠道：浏览器发布提前启动浏览器、打开发布页并确认登录，
+    MCP 发布提前检查服务端和工具列表（同时建立好连接）；
+    生成失败、跳过或取消发布时关闭已准备好的渠道。
+    预热使用截止时间的副本，等待登录时生成照常计时，只有发布阶段被登录卡住的时间才顺延截止时间
+    """
+
+    def __init__(self, config: ConfigSnapshot, publish_method: str, metrics: Optional[Metrics] = None):
+        self.config = config
+        self.publish_method = publish_method
+        self.metrics = metrics
+        self.task: Optional[asyncio.Task] = None
+        self.browser: Optional[XHSBrowserPublisher] = None
+
+    def start(self) -> 'ChannelWarmup':
+        """开始预热，模拟发布不需要预热"""
+        if self.publish_method == 'browser' or self.config.mcp_url:
+            self.task = asyncio.create_task(self._prepare())
+        return self
+
+    async def _prepare(self) -> Optional[BrowserSession]:
+        with forked(), span('prewarm', method=self.publish_method):
+            if self.publish_method == 'browser':
+                self.browser = XHSBrowserPublisher(self.config, self.metrics)
+                return await self.browser.open_session()
+            tools = await Publisher(self.config, self.metrics).check_mcp()
+            print(f"🔗 MCP 服务端可用（{len(tools)} 个工具）")
+            return None
+
+    async def take(self) -> Optional[BrowserSession]:
+        """等待预热完成并取出浏览器会话；预热失败时返回 None，由发布流程重新准备"""
+        if self.task is None:
+            return None
+        task, self.task = self.task, None
+        blocked = time.monotonic()
+        try:
+            return await task
+        except Exception as e:
+            print(f"⚠️  发布渠道预热失败，发布时重新准备: {e}")
+            return None
+        finally:
+            login = self.browser.login_wait if self.browser else None
+            if login:
+                # 只顺延发布阶段真正在等用户登录的时间
+                extend(min(login[1], time.monotonic()) - max(login[0], blocked))
+
+    async def cancel(self):
+        """取消尚未取出的预热，关闭已经打开的浏览器"""
+        if self.task is None:
+            return
+        task, self.task = self.task, None
+        task.cancel()
+        # gather 收集预热任务自身的取消或异常，当前任务被取消时仍会抛出
+        session, = await asyncio.gather(task, return_exceptions=True)
+        if isinstance(session, BrowserSession):
+            await session.close()
+
+
+async def generate_text(config: ConfigSnapshot, metrics: Metrics, topic: str, word_count: int,
+                        context: str = '', fused: bool = False,
+                        tags: Optional[TagIndex] = None) -> Tuple[Dict, Dict]:
+    """生成文本内容和图片提示词，返回 (内容, 图片提示词)
+
+    fused 模式只发起一次模型调用，结果校验失败时回退到多次调用流程；
+    传入标签索引时标签在本地统一写法并补齐
+    """
+    generator = ContentGenerator(config, metrics, tags)
+
+    if fused:
+        try:
+            return await generator.generate_fused(topic, word_count, context)
+        except DeadlineExceeded as e:
+            # 整体预算耗尽时回退也来不及了
+            if e.reason == 'deadline':
+                raise
+            print(f"⚠️  合并生成超时，回退到分步生成: {e}")
+        except Exception as e:
+            print(f"⚠️  合并生成失败，回退到分步生成: {e}")
+
+    structure = await generator.generate_structure(topic, word_count, context)
+    structure['subject'] = topic
+    structure['context'] = context
+    structure['word_count'] = word_count
+
+    content = await generator.generate_content(structure)
+
+    image_gen = ImageGenerator(config, metrics)
+    prompts = await image_gen.generate_prompts(content)
+    return content, prompts
+
+
+async def generate_speculative(config: ConfigSnapshot, metrics: Metrics, topic: str, word_count: int,
+                               context: str = '', fused: bool = False, candidates: int = 2,
+                               history_mgr: Optional[HistoryManager] = None,
+                               tags: Optional[TagIndex] = None) -> Tuple[Dict, Dict]:
+    """并发生成多个候选文案，采用最先通过本地校验的一个，其余候选立即取消"""
+    print(f"🎲 并发生成 {candidates} 个候选文案...")
+
+    def check(result: Tuple[Dict, Dict]) -> List[str]:
+        return check_candidate(result[0], word_count, history_mgr, config.dedup_threshold)
+
+    (content, prompts), problems, stats = await first_passing(
+        [lambda: generate_text(config, metrics, topic, word_count, context, fused, tags)] * candidates,
+        check
+    )
+    metrics.record_speculation(stats)
+    if problems:
+        print(f"⚠️  没有候选完全通过校验，采用问题最少的一个: {'；'.join(problems)}")
+    return content, prompts
+
+
+def reangle_context(context: str, similar: List[Dict]) -> str:
+    """在背景说明中追加已发布的相似笔记，要求模型换一个切入角度"""
+    published = '、'.join(f"《{match['text']}》" for match in similar)
+    hint = f"已发布过相似笔记：{published}。请换一个全新的切入角度和标题，避免内容重复。"
+    return f"{context}\n{hint}" if context else hint
+
+
+async def ask(prompt: str) -> str:
+    """在线程中读取输入，等待用户时不阻塞其他任务，也不计入截止时间"""
+    with paused():
+        return (await asyncio.to_thread(input, prompt)).strip()
+
+
+def seconds_until(scheduled_time: Optional[str]) -> float:
+    """距离定时发布时间（YYYY-MM-DD HH:MM:SS）的秒数，未设置或已过时为 0"""
+    if not scheduled_time:
+        return 0.0
+    return max(0.0, (datetime.strptime(scheduled_time, '%Y-%m-%d %H:%M:%S') - datetime.now()).total_seconds())
+
+
+async def wait_for_schedule(scheduled_time: Optional[str]):
+    """等待到定时发布时间，已过时立即返回"""
+    if not scheduled_time:
+        return
+    print(f"⏰ 定时发布: {scheduled_time}")
+    wait_seconds = seconds_until(scheduled_time)
+    if wait_seconds > 0:
+        print(f"⏳ 等待 {int(wait_seconds)} 秒...")
+        # 定时等待不计入截止时间，批量模式下让出名额给排队的笔记
+        release_slot()
+        with paused():
+            await asyncio.sleep(wait_seconds)
+
+
+async def publish_note(config: ConfigSnapshot, history_mgr: HistoryManager, logger: Logger, data: Dict,
+                       account: str, topic: str, publish_method: str = 'auto',
+                       scheduled_time: Optional[str] = None, assets: Optional[List[ImageAsset]] = None,
+                       metrics: Optional[Metrics] = None, record_id: Optional[str] = None,
+                       warmup: Optional[ChannelWarmup] = None) -> str:
+    """按发布台账发布一篇笔记，返回历史记录ID
+
+    同一内容的幂等键相同：已发布的直接返回，正在发送、其他进程已登记或结果未知的拒绝重复发布，
+    之前失败或登记进程已退出的沿用原来的历史记录重试；
+    传入 warmup 时使用预热好的发布渠道，浏览器发布只剩填写表单。
+    定时等待在登记 sending 之前，请求发出前中断或取消记为 failed，之后才记为 unknown；
+    台账条目带本次调用的 owner 标记，只修改自己登记的条目
+    """
+    ledger = history_mgr.ledger
+    key = idempotency_key(data, account)
+    owner = uuid.uuid4().hex
+    entry = ledger.get(key)
+    state = entry['state'] if entry else None
+
+    if state == 'published':
+        print(f"✅ 该笔记已发布过，跳过 - 记录ID: {entry['record_id']}")
+        return entry['record_id']
+    if state in ('sending', 'unknown') or (state == 'pending' and not ledger.abandoned(entry)):
+        raise LedgerError(f"该笔记{'上次发布结果未知' if state == 'unknown' else '正在发布'}，"
+                          f"请先确认（python run.py history reconcile）- 记录ID: {entry['record_id']}")
+
+    if state == 'pending':
+        # 登记的进程已经退出，请求没有发出
+        entry = ledger.transition(key, 'failed', expect={'state': 'pending', 'pid': entry.get('pid')},
+                                  error='进程中断，请求未发出')
+    if entry:
+        record_id = entry['record_id']
+        ledger.transition(key, 'pending', owner=owner)
+        history_mgr.update_status(record_id, 'pending', '重试发布')
+    else:
+        # 先在台账登记，抢到之后再写历史记录，并发发布同一内容时不会留下多余的待发布记录
+        new_record = record_id is None
+        record_id = record_id or history_mgr.new_record_id()
+        ledger.transition(key, 'pending', record_id=record_id, publish_method=publish_method, owner=owner)
+        if new_record:
+            try:
+                history_mgr.add_record({**data, 'account': account, 'topic': topic},
+                                       status='pending', publish_method=publish_method, record_id=record_id)
+            except BaseException as e:
+                ledger.transition(key, 'failed', error=str(e) or type(e).__name__)
+                raise
+
+    dispatched = False
+
+    def mark_sending():
+        """请求发出前登记 sending，MCP 重试时只登记一次"""
+        nonlocal dispatched
+        if not dispatched:
+            ledger.transition(key, 'sending', expect={'state': 'pending', 'owner': owner},
+                              attempt=entry.get('attempt', 0) + 1 if entry else 1)
+            dispatched = True
+
+    try:
+        if publish_method == 'browser' and warmup and seconds_until(scheduled_time) > 0:
+            # 定时等待期间不占用浏览器和配置目录，到点后重新打开发布页
+            await warmup.cancel()
+        await wait_for_schedule(scheduled_time)
+        # 等待预热完成（如用户仍在扫码登录）
+        session = await warmup.take() if warmup else None
+        with span('publish', method=publish_method, record_id=record_id):
+            if publish_method == 'browser':
+                browser_publisher = XHSBrowserPublisher(config, metrics)
+                await browser_publisher.publish(data, assets=assets, session=session, on_send=mark_sending)
+            else:
+                publisher = Publisher(config, metrics)
+                await publisher.publish(data, None, publish_method, assets=assets, idempotency_key=key,
+                                        on_send=mark_sending)
+
+    except BaseException as publish_error:
+        # 请求发出后超时或被取消时无法确认服务端是否已接受；发出前的任何中断都可以安全重试
+        sent = dispatched and (isinstance(publish_error, (OutcomeUnknown, asyncio.CancelledError)) or
+                               (isinstance(publish_error, DeadlineExceeded) and publish_error.budget > 0))
+        state = 'unknown' if sent else 'failed'
+        message = str(publish_error) or type(publish_error).__name__
+        # 只修改本次调用登记的条目：未发出时条目可能已被其他进程接手，不能改动台账和共用的历史记录
+        expected = {'state': 'sending' if dispatched else 'pending', 'pid': os.getpid(), 'owner': owner}
+        try:
+            ledger.transition(key, state, expect=expected, error=message)
+        except LedgerError as e:
+            print(f"⚠️  {e}")
+        else:
+            history_mgr.update_status(record_id, HISTORY_STATUS[state], message)
+        logger.error(f"发布{'结果未知' if sent else '失败'} - {message}")
+        raise
+
+    # 更新记录状态为成功
+    ledger.transition(key, 'published')
+    history_mgr.update_status(record_id, 'success')
+    if config.image_cache:
+        ImageCache(config.output_dir).mark_published(data['images'])
+    logger.success(f"发布成功 - 记录ID: {record_id}")
+    print(f"\n🎉 发布流程完成！")
+    return record_id
+
+
+async def run_note(config: ConfigSnapshot, history_mgr: HistoryManager, logger: Logger, topic: str,
+                   word_count: int = 600, context: str = '', quick: bool = False,
+                   publish_method: str = 'auto', account: str = '', fused: bool = False,
+                   dedup_mode: str = 'reangle', candidates: int = 1,
+                   metrics_sink: Optional[List[Metrics]] = None,
+                   scheduled_time: Optional[str] = None) -> Optional[str]:
+    """完整处理一篇笔记：生成内容和图片、预览确认、发布，返回历史记录ID
+
+    跳过或取消发布时返回 None，生成或发布失败时抛出异常；
+    整篇笔记受 XHS_NOTE_DEADLINE 约束，每个阶段只能使用剩余的预算。
+    scheduled_time 为快速模式下的定时发布时间，非快速模式在预览后询问
+    """
+    metrics = Metrics()
+    if metrics_sink is not None:
+        metrics_sink.append(metrics)
+    assets: List[ImageAsset] = []
+    warmup = ChannelWarmup(config, publish_method, metrics) if config.prewarm else None
+    try:
+        with deadline_scope(config.note_deadline), span('note', topic=topic):
+            # 检查是否发布过相似主题
+            if dedup_mode != 'off':
+                with span('dedup'):
+                    similar = history_mgr.find_similar(topic, config.dedup_threshold)
+                if similar:
+                    print(f"🔁 发现相似的历史笔记: {', '.join(m['text'] for m in similar)}")
+                    logger.warning(f"主题与历史笔记相似 - {similar[0]['text']} ({similar[0]['score']:.2f})")
+                    if dedup_mode == 'skip':
+                        print(f"⏭️  已跳过该主题: {topic}")
+                        return None
+                    print("💡 将要求模型换一个切入角度\n")
+                    context = reangle_context(context, similar)
+
+            # 生成内容的同时在后台准备发布渠道
+            if warmup:
+                warmup.start()
+
+            logger.info(f"开始生成内容 - 主题: {topic}")
+
+            # 生成内容
+            logger.step(1, 5, "生成内容结构" if not fused else "合并生成内容")
+            tags = history_mgr.tag_index()
+            with span('generate_text', fused=fused, candidates=candidates), metrics.timed('generate_text'):
+                if candidates > 1:
+                    content, prompts = await generate_speculative(
+                        config, metrics, topic, word_count, context, fused, candidates,
+                        history_mgr if dedup_mode != 'off' else None, tags
+                    )
+                else:
+                    content, prompts = await generate_text(config, metrics, topic, word_count, context, fused, tags)
+
+            print(f"✅ 标题: {content['title']}")
+            print(f"✅ 标签: {content['tags']}\n")
+            logger.success(f"内容生成完成 - 标题: {content['title']}")
+
+            if dedup_mode != 'off':
+                similar_titles = history_mgr.find_similar(content['title'], config.dedup_threshold)
+                if similar_titles:
+                    print(f"⚠️  生成的标题与历史笔记相似: {', '.join(m['text'] for m in similar_titles)}\n")
+                    logger.warning(f"标题与历史笔记相似 - {similar_titles[0]['text']}")
+
+            # 生成图片
+            image_gen = ImageGenerator(config, metrics)
+
+            logger.step(4, 5, "生成图片")
+            with span('generate_images', count=len(prompts.get('content_images', [])) + 1), \
+                    metrics.timed('generate_images'):
+                assets = await image_gen.generate_images(prompts)
+            images = [asset.path for asset in assets]
+
+            print(f"✅ 图片生成完成，共 {len(images)} 张\n")
+            logger.success(f"图片生成完成 - 共 {len(images)} 张")
+
+            metrics.record_connections(get_registry(config).stats())
+            metrics.record_limits(get_limiter().stats())
+            report = metrics.report()
+            print(f"{report}\n")
+            logger.info(report)
+
+            mark_ready()
+
+            # 预览
+            if not quick:
+                logger.step(5, 5, "生成预览")
+                with span('preview'):
+                    preview_mgr = PreviewManager(config.output_dir)
+                    html = preview_mgr.generate_preview({
+                        'title': content['title'],
+                        'content': content['content'],
+                        'tags': content['tags'],
+                        'images': images
+                    })
+
+                    filepath = preview_mgr.show_preview(html)
+                print(f"👀 预览已打开: {filepath}")
+                logger.info(f"预览已生成: {filepath}")
+
+                confirm = (await ask("\n确认发布吗？(y/n): ")).lower()
+                if confirm != 'y':
+                    print("❌ 已取消发布")
+                    logger.warning("用户取消发布")
+                    # 记录取消的历史
+                    history_mgr.add_record({
+                        'account': account,
+                        'topic': topic,
+                        'title': content['title'],
+                        'content': content['content'],
+                        'tags': content['tags'],
+                        'images': images
+                    }, status='cancelled', publish_method=publish_method)
+                    return None
+
+                scheduled_time = None
+                scheduled = (await ask("是否定时发布？(y/n, 默认n): ")).lower()
+                if scheduled == 'y':
+                    scheduled_time = await ask("请输入发布时间 (格式: YYYY-MM-DD HH:MM:SS): ")
+
+            # 发布
+            print(f"\n📤 开始发布...")
+            logger.info(f"开始发布 - 方式: {publish_method}")
+
+            publish_data = {
+                'title': content['title'],
+                'content': content['content'],
+                'tags': content['tags'],
+                'images': images
+            }
+
+            return await publish_note(config, history_mgr, logger, publish_data, account, topic,
+                                      publish_method, scheduled_time, assets, metrics, warmup=warmup)
+
+    except DeadlineExceeded:
+        report = metrics.report()
+        print(f"{report}\n")
+        logger.warning(report)
+        raise
+
+    finally:
+        # 生成失败、跳过或取消发布时关闭预热好的发布渠道
+        if warmup:
+            await warmup.cancel()
+        for asset in assets:
+            asset.close()
+        StageEstimator(config.output_dir).update(metrics.stage_times)
+
+
+async def run_batch(config: ConfigSnapshot, history_mgr: HistoryManager, logger: Logger,
+                    topics: List[Union[str, Job]], watcher: Optional[ConfigWatcher] = None,
+                    max_jobs: Optional[int] = None, **options) -> Dict:
+    """调度处理多篇笔记，单篇失败不影响其他笔记
+
+    批量模式跳过预览确认。同时处理的笔记数由 max_jobs（默认 XHS_MAX_JOBS）控制，排队的笔记按优先通道、
+    定时发布前的最晚开始时间依次开始；同时进行的网络调用数由全局并发限制器控制，紧急笔记的调用优先。
+    传入 watcher 时每篇笔记在开始时取当时的配置快照，之后的重新加载不影响已开始的笔记
+    """
+    start = time.time()
+    note_metrics: List[Metrics] = []
+    jobs = [topic if isinstance(topic, Job) else Job(topic) for topic in topics]
+
+    async def note(job: Job) -> Optional[str]:
+        note_config = watcher.current() if watcher else config
+        scheduled_time = job.scheduled_time.strftime('%Y-%m-%d %H:%M:%S') if job.scheduled_time else None
+        with span('job', lane=job.lane, scheduled_time=scheduled_time, estimate=job.estimate):
+            return await run_note(note_config, history_mgr, logger, job.topic, quick=True,
+                                  metrics_sink=note_metrics, scheduled_time=scheduled_time, **options)
+
+    with span('batch', notes=len(jobs)):
+        scheduler = JobScheduler(note, config.max_jobs if max_jobs is None else max_jobs,
+                                 StageEstimator(config.output_dir))
+        for job in jobs:
+            scheduler.submit(job)
+        await scheduler.join()
+    topics = [job.topic for job in jobs]
+    results = [job.result for job in jobs]
+
+    summary = {'total': len(topics), 'published': 0, 'skipped': 0, 'failed': 0, 'deadline_missed': 0}
+    for topic, result in zip(topics, results):
+        if isinstance(result, Exception):
+            summary['failed'] += 1
+            if isinstance(result, DeadlineExceeded) and result.reason == 'deadline':
+                summary['deadline_missed'] += 1
+            print(f"❌ {topic}: {result}")
+            logger.error(f"批量任务失败 - {topic}: {result}")
+        elif result is None:
+            summary['skipped'] += 1
+        else:
+            summary['published'] += 1
+
+    summary['wall_time'] = time.time() - start
+    summary['connections'] = get_registry(config).stats()
+    summary['models'] = get_router(config).stats()
+    summary['limits'] = get_limiter().stats()
+    summary['templates'] = Metrics.merge(note_metrics).summary()['templates']
+    summary['schedule'] = scheduler.report()
+    print(f"\n📊 批量完成: 共 {summary['total']} 篇，发布 {summary['published']}，"
+          f"跳过 {summary['skipped']}，失败 {summary['failed']}（错过截止时间 {summary['deadline_missed']}），"
+          f"耗时 {summary['wall_time']:.1f}s")
+    for name, pool in summary['connections'].items():
+        print(f"🔌 连接池 {name}: 请求 {pool['requests']} 次，新建连接 {pool['connections']} 个，"
+              f"复用 {pool['reused']} 次")
+    for name, model in summary['models'].items():
+        latency = f"{model['ewma_latency']:.1f}s" if model['ewma_latency'] is not None else '-'
+        print(f"🤖 模型 {name}: 调用 {model['calls']} 次，失败 {model['errors']} 次，"
+              f"平均延迟 {latency}，{model['tokens_per_second']:.0f} tokens/s")
+    for kind, limit in summary['limits'].items():
+        print(f"🎚️  {kind} 并发上限 {limit['limit']}（{limit['min']}~{limit['max']}，峰值 {limit['peak']}），"
+              f"放宽 {limit['increases']} 次，收紧 {limit['decreases']} 次"
+              f"（限流/超时 {limit['overloads']}，延迟突增 {limit['latency_spikes']}）")
+    schedule = summary['schedule']
+    if schedule['scheduled']:
+        print(f"📅 定时笔记 {schedule['scheduled']} 篇：按时完成 {schedule['met']}，错过 {schedule['missed']}"
+              f"（临近截止提升为紧急 {schedule['promoted']} 篇）")
+        for job in schedule['jobs']:
+            if job['deadline_met'] is False:
+                print(f"   - {job['topic']}（{job['lane']}，定时 {job['scheduled_time']}，{job['state']}）")
+        logger.info(f"定时笔记按时完成 {schedule['met']}/{schedule['scheduled']}")
+    if summary['templates']:
+        template_report = Metrics.merge(note_metrics).template_report()
+        print(template_report)
+        logger.info(template_report)
+    return summary
+
+
+def read_topics(path: str) -> List[Job]:
+    """读取选题文件，每行 主题 [| 定时发布时间 [| 优先通道]]，忽略空行和 # 注释"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [Job.parse(line.strip()) for line in f if line.strip() and not line.strip().startswith('#')]
+
+
 def main():
-    """主函数"""
+    """主函数：同步入口，实际流程在事件循环中执行"""
+    # 子命令
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        from benchmark import run_benchmark
+        run_benchmark(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'history':
+        from history_cli import run_history_command
+        run_history_command(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'gc':
+        from assets import run_gc_command
+        run_gc_command(sys.argv[2:])
+        return
+
     print("🚀 小红书自动化发布工具 - 简化版\n")
 
-    # 加载配置
-    config = Config('.env')
-    if not config.validate():
+    # 加载配置，之后各组件只使用只读快照
+    loader = Config('.env')
+    if not loader.validate():
+        sys.exit(1)
+    try:
+        watcher = ConfigWatcher(loader)
+    except ValueError as e:
+        print(f"❌ 配置无效: {e}")
         sys.exit(1)
+    watcher.install_signal_handler()
+    config = watcher.current()
 
     # 初始化历史记录和日志
     history_mgr = HistoryManager(config.output_dir)
@@ -934,6 +1758,11 @@ def main():
     logger.info("程序启动")
 
     # 获取输入
+    topics_file = None
+    concurrency = config.max_concurrency
+    max_jobs = config.max_jobs
+    cassette_mode, cassette_path = config.cassette_mode, config.cassette_path
+    replay_scale = config.replay_scale
     if len(sys.argv) > 1:
         # 命令行参数模式
         args = parse_args()
@@ -942,6 +1771,18 @@ def main():
         context = args.context or ''
         quick = args.quick
         publish_method = args.publish_method
+        account = args.account or config.default_account
+        fused = args.fused
+        dedup_mode = args.dedup or config.dedup_mode
+        candidates = args.candidates or config.candidates
+        topics_file = args.topics_file
+        concurrency = args.concurrency or concurrency
+        max_jobs = args.max_jobs if args.max_jobs is not None else max_jobs
+        if args.record or args.replay:
+            cassette_mode = 'record' if args.record else 'replay'
+            cassette_path = args.record or args.replay
+        if args.replay_scale is not None:
+            replay_scale = args.replay_scale
     else:
         # 交互式模式
         topic = input("请输入主题: ").strip()
@@ -949,108 +1790,49 @@ def main():
         context = input("请输入背景说明 (可选): ").strip()
         quick = input("是否快速发布（跳过预览）？(y/n, 默认n): ").strip().lower() == 'y'
         publish_method = input("发布方式 (auto/mcp/browser, 默认auto): ").strip().lower() or 'auto'
+        account = config.default_account
+        fused = False
+        dedup_mode = config.dedup_mode
+        candidates = config.candidates
+
+    configure_limiter(concurrency, adaptive=config.adaptive_concurrency)
+    configure_tracer(config.trace)
+    try:
+        configure_cassette(cassette_mode, cassette_path, replay_scale)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    options = {
+        'word_count': word_count,
+        'context': context,
+        'publish_method': publish_method,
+        'account': account,
+        'fused': fused,
+        'dedup_mode': dedup_mode,
+        'candidates': candidates
+    }
+
+    if topics_file:
+        topics = read_topics(topics_file)
+        print(f"\n📋 批量模式: {len(topics)} 个主题，同时处理 {max_jobs or '不限'} 篇，并发上限 {concurrency}")
+        print(f"📋 发布方式: {publish_method}\n")
+        try:
+            summary = run_async(run_batch(config, history_mgr, logger, topics, watcher=watcher,
+                                          max_jobs=max_jobs, **options))
+        finally:
+            export_trace(config.output_dir)
+            report_cassette()
+        if summary['failed']:
+            sys.exit(1)
+        return
 
     print(f"\n📋 主题: {topic}")
     print(f"📋 字数: {word_count}")
     print(f"📋 背景: {context if context else '无'}")
     print(f"📋 发布方式: {publish_method}\n")
 
-    logger.info(f"开始生成内容 - 主题: {topic}")
-
     try:
-        # 生成内容
-        logger.step(1, 5, "生成内容结构")
-        generator = ContentGenerator(config)
-        structure = generator.generate_structure(topic, word_count, context)
-        structure['subject'] = topic
-        structure['context'] = context
-        structure['word_count'] = word_count
-
-        logger.step(2, 5, "生成完整内容")
-        content = generator.generate_content(structure)
-
-        print(f"✅ 标题: {content['title']}")
-        print(f"✅ 标签: {content['tags']}\n")
-        logger.success(f"内容生成完成 - 标题: {content['title']}")
-
-        # 生成图片
-        logger.step(3, 5, "生成图片提示词")
-        image_gen = ImageGenerator(config)
-        prompts = image_gen.generate_prompts(content)
-
-        logger.step(4, 5, "生成图片")
-        images = image_gen.generate_images(prompts)
-
-        print(f"✅ 图片生成完成，共 {len(images)} 张\n")
-        logger.success(f"图片生成完成 - 共 {len(images)} 张")
-
-        # 预览
-        if not quick:
-            logger.step(5, 5, "生成预览")
-            preview_mgr = PreviewManager(config.output_dir)
-            html = preview_mgr.generate_preview({
-                'title': content['title'],
-                'content': content['content'],
-                'tags': content['tags'],
-                'images': images
-            })
-
-            filepath = preview_mgr.show_preview(html)
-            print(f"👀 预览已打开: {filepath}")
-            logger.info(f"预览已生成: {filepath}")
-
-            confirm = input("\n确认发布吗？(y/n): ").strip().lower()
-            if confirm != 'y':
-                print("❌ 已取消发布")
-                logger.warning("用户取消发布")
-                # 记录取消的历史
-                history_mgr.add_record({
-                    'title': content['title'],
-                    'content': content['content'],
-                    'tags': content['tags'],
-                    'images': images
-                }, status='cancelled', publish_method=publish_method)
-                return
-
-            scheduled = input("是否定时发布？(y/n, 默认n): ").strip().lower()
-            scheduled_time = None
-            if scheduled == 'y':
-                scheduled_time = input("请输入发布时间 (格式: YYYY-MM-DD HH:MM:SS): ").strip()
-        else:
-            scheduled_time = None
-
-        # 发布
-        print(f"\n📤 开始发布...")
-        logger.info(f"开始发布 - 方式: {publish_method}")
-
-        publish_data = {
-            'title': content['title'],
-            'content': content['content'],
-            'tags': content['tags'],
-            'images': images
-        }
-
-        # 添加待发布记录
-        record_id = history_mgr.add_record(publish_data, status='pending', publish_method=publish_method)
-
-        try:
-            if publish_method == 'browser':
-                browser_publisher = XHSBrowserPublisher(config)
-                browser_publisher.publish(publish_data)
-            else:
-                publisher = Publisher(config)
-                publisher.publish(publish_data, scheduled_time, publish_method)
-
-            # 更新记录状态为成功
-            history_mgr.update_status(record_id, 'success')
-            logger.success(f"发布成功 - 记录ID: {record_id}")
-            print(f"\n🎉 发布流程完成！")
-
-        except Exception as publish_error:
-            # 更新记录状态为失败
-            history_mgr.update_status(record_id, 'failed', str(publish_error))
-            logger.error(f"发布失败 - {publish_error}")
-            raise publish_error
+        run_async(run_note(config, history_mgr, logger, topic, quick=quick, **options))
 
     except Exception as e:
         print(f"\n❌ 错误: {e}")
@@ -1059,19 +1841,43 @@ def main():
         traceback.print_exc()
         sys.exit(1)
 
+    finally:
+        export_trace(config.output_dir)
+        report_cassette()
+
 
 def parse_args():
     """解析命令行参数"""
     import argparse
     parser = argparse.ArgumentParser(description='小红书自动化发布工具')
     parser.add_argument('-t', '--topic', help='主题/选题')
+    parser.add_argument('-a', '--account', help='账号名称（默认读取 XHS_DEFAULT_ACCOUNT）')
     parser.add_argument('-w', '--word-count', type=int, default=600, help='字数')
     parser.add_argument('-c', '--context', help='背景说明')
     parser.add_argument('-q', '--quick', action='store_true', help='快速发布（跳过预览）')
     parser.add_argument('-m', '--publish-method', default='auto', choices=['auto', 'mcp', 'browser'],
                        help='发布方式 (auto/mcp/browser)')
+    parser.add_argument('--fused', action='store_true',
+                       help='单次调用生成结构、正文、标签和图片提示词（失败时自动回退）')
+    parser.add_argument('--dedup', choices=['reangle', 'skip', 'off'],
+                       help='发现相似历史笔记时的处理方式（默认读取 XHS_DEDUP_MODE）')
+    parser.add_argument('--candidates', type=int,
+                       help='并发生成的候选文案数，采用最先通过校验的一个（默认读取 XHS_CANDIDATES）')
+    parser.add_argument('--topics-file',
+                       help='批量模式：选题文件，每行 主题 [| 定时发布时间 [| urgent/normal/evergreen]]，按优先级调度生成和发布')
+    parser.add_argument('--max-jobs', type=int,
+                       help='批量模式同时处理的笔记数，0 为不限（默认读取 XHS_MAX_JOBS）')
+    parser.add_argument('--concurrency', type=int,
+                       help='同时进行的网络调用上限（默认读取 XHS_MAX_CONCURRENCY）')
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument('--record', metavar='FILE',
+                          help='录制本次运行的模型、图片和 MCP 请求到回放文件')
+    cassette.add_argument('--replay', metavar='FILE',
+                          help='从回放文件返回响应，不访问网络')
+    parser.add_argument('--replay-scale', type=float,
+                       help='回放耗时缩放，1 为原始耗时，0 为立即返回（默认读取 XHS_REPLAY_SCALE）')
     return parser.parse_args()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()